@@ -1,24 +1,10 @@
 import streamlit as st
-import snowflake.snowpark.functions as F
-from snowflake.snowpark.context import get_active_session
-from PIL import Image
-import io
 
-# Import des applications spécifiques
-from apps.analyst_jeux_olympiques import AnalystJeuxOlympiques
-from apps.analyst_st_gobain import AnalystSaintGobain
-from apps.analyst_winter_games import AnalystWinterGames
-from pages import monitoring, admin
-
-def load_image_from_snowflake(stage_path):
-    session = get_active_session()
-    try:
-        with session.file.get_stream(stage_path) as file_stream:
-            image_data = file_stream.read()
-            return Image.open(io.BytesIO(image_data))
-    except Exception as e:
-        st.error(f"Erreur lors du chargement de l'image : {e}")
-        return None
+# Les applications et les pages sont importées à la demande par le registre (APP_URL)
+from apps.app_registry import get_app_registry
+from common.backend import get_session
+from common.image_service import get_image_service
+from common.profiling import profile_rerun
 
 def load_css():
     st.markdown("""
@@ -59,10 +45,12 @@ def main():
     st.title("Cortex Analyst Apps")
 
     logo_width, logo_height = 200, 200
-    session = get_active_session()
+    registry = get_app_registry()
 
-    df = session.table("CORTEX_DB.PUBLIC.CORTEX_APPS").filter(F.col("APP_ACTIVE") == True).to_pandas()
-    df = df.sort_values(by='APP_ID')
+    df = registry.list_active_apps()
+    # Miniatures téléchargées en parallèle au premier affichage, puis servies depuis le cache
+    logos = get_image_service().get_many(get_session(), df["APP_LOGO_URL"].tolist(),
+                                         (logo_width, logo_height), keep_aspect=False)
 
     cols = st.columns(3)
 
@@ -71,38 +59,26 @@ def main():
         with col:
             with st.container():
                 st.markdown('<div class="app-container">', unsafe_allow_html=True)
-                logo_image = load_image_from_snowflake(app["APP_LOGO_URL"])
+                logo_image = logos.get(app["APP_LOGO_URL"])
                 if logo_image:
-                    resized_image = logo_image.resize((logo_width, logo_height))
-                    st.image(resized_image, use_column_width=False)
+                    st.image(logo_image, use_column_width=False)
+                else:
+                    st.error("Erreur lors du chargement de l'image")
                 if st.button(app['APP_NAME']):
                     st.session_state.selected_page = app["APP_URL"]
+                    st.session_state.selected_app_id = app["APP_ID"]
                 st.markdown('</div>', unsafe_allow_html=True)
 
     if "selected_page" in st.session_state:
         try:
-            page_mapping = {
-                "analyst_winter_games": AnalystWinterGames,
-                "analyst_st_gobain": AnalystSaintGobain,
-                "analyst_jeux_olympiques": AnalystJeuxOlympiques,
-                "monitoring": monitoring,
-                "admin": admin
-            }
-
-            selected = st.session_state.selected_page
-            if selected in page_mapping:
-                if selected in ["monitoring", "admin"]:
-                    # Pour les pages monitoring et admin, on appelle directement leur fonction main
-                    page_mapping[selected].main()
-                else:
-                    # Pour les applications d'analyse, on instancie la classe et on appelle sa méthode run
-                    app = page_mapping[selected]()
-                    app.run()
-            else:
-                st.error("Page non trouvée")
-
+            # Pages monitoring et admin : module importé puis main() ; applications d'analyse :
+            # instance générique BaseAnalystApp(APP_ID) partagée par le registre
+            get_app_registry().run(st.session_state.selected_page, st.session_state.get("selected_app_id"))
+        except LookupError:
+            st.error("Page non trouvée")
         except Exception as e:
             st.error(f"Une erreur s'est produite: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_rerun("Home"):
+        main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import importlib
+import threading
+import time
+import logging
+import streamlit as st
+from common.backend import get_session
+from common.profiling import profile_rerun
+
+
+# APP_URL -> module exposant main(), importé seulement à l'ouverture de la page. Un APP_URL
+# contenant un point est lui-même un chemin de module ; tout autre APP_URL désigne une
+# application Cortex Analyst générique, configurée par son APP_ID.
+PAGE_MODULES = {
+    "monitoring": "pages.monitoring",
+    "admin": "pages.admin",
+}
+
+
+def resolve_page_module(app_url):
+    if app_url in PAGE_MODULES:
+        return PAGE_MODULES[app_url]
+    if app_url and "." in app_url:
+        return app_url
+    return None
+
+
+def create_analyst_app(app_id):
+    from apps.base_analyst_app import BaseAnalystApp
+    return BaseAnalystApp(int(app_id) if str(app_id).isdigit() else app_id)
+
+
+class AppRegistry:
+    # Instances d'applications partagées entre les sessions, indexées par APP_ID.
+    # Les instances ne portent que la configuration (CORTEX_APPS, CORTEX_MODELS) ;
+    # l'état propre à chaque utilisateur reste dans st.session_state.
+
+    def __init__(self, check_interval=300):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._apps = None
+        self._lock = threading.Lock()
+
+    def fetch_version(self, app_id):
+        session = get_session()
+        query = f"""
+        SELECT
+            (SELECT HASH_AGG(*) FROM CORTEX_DB.PUBLIC.CORTEX_APPS WHERE APP_ID = '{app_id}') AS APP_VERSION,
+            (SELECT HASH_AGG(*) FROM CORTEX_DB.PUBLIC.CORTEX_MODELS WHERE APP_ID = '{app_id}') AS MODELS_VERSION
+        """
+        row = session.sql(query).collect()[0]
+        return (row['APP_VERSION'], row['MODELS_VERSION'])
+
+    def get(self, app_id, factory=None):
+        factory = factory or (lambda: create_analyst_app(app_id))
+        app_id = str(app_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(app_id)
+            if entry is not None and now < entry['checked_at'] + self.check_interval:
+                return entry['app']
+
+        # Vérification de version au plus une fois par intervalle, hors du chemin de chaque rerun
+        version = self.fetch_version(app_id)
+        with self._lock:
+            entry = self._entries.get(app_id)
+            if entry is not None and entry['version'] == version:
+                entry['checked_at'] = now
+                return entry['app']
+
+        logging.info(f"Chargement de l'application {app_id} dans le registre")
+        app = factory()
+        with self._lock:
+            self._entries[app_id] = {'app': app, 'version': version, 'checked_at': now}
+        return app
+
+    def run(self, app_url, app_id=None):
+        module_path = resolve_page_module(app_url)
+        if module_path is None and app_id is None:
+            raise LookupError(f"Application introuvable pour APP_URL={app_url}")
+        with profile_rerun(app_url):
+            if module_path is not None:
+                importlib.import_module(module_path).main()
+            else:
+                self.get(app_id).run()
+
+    def list_active_apps(self):
+        now = time.time()
+        with self._lock:
+            if self._apps is not None and now < self._apps[0] + self.check_interval:
+                return self._apps[1]
+        session = get_session()
+        df = session.sql("""
+            SELECT *
+            FROM CORTEX_DB.PUBLIC.CORTEX_APPS
+            WHERE APP_ACTIVE = TRUE
+        """).to_pandas()
+        df = df.sort_values(by='APP_ID')
+        with self._lock:
+            self._apps = (now, df)
+        return df
+
+    def invalidate(self, app_id=None):
+        with self._lock:
+            if app_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(app_id), None)
+            self._apps = None
+
+
+@st.cache_resource
+def get_app_registry():
+    return AppRegistry(check_interval=300)
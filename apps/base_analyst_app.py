@@ -1,25 +1,89 @@
-import _snowflake
 import json
+import os
 import streamlit as st
 import time
-from snowflake.snowpark.context import get_active_session
-from datetime import datetime
 import pandas as pd
 import hashlib
 import logging
+import uuid
+import contextvars
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from common.response_cache import ResponseCache
+from common.log_sink import BufferedLogSink
+from common.result_cache import PagedResult, ResultCursor, ResultSetCache, statement_hash
+from common.analyst_stream import RESPONSE_PARSERS, StreamTimer, open_analyst_stream, streaming_enabled
+from common.single_flight import SharedQueries, SingleFlight
+from common.tracing import RequestTrace, current_trace, set_current_trace, reset_current_trace
+from common.backend import get_session, send_api_request
+from common.downsample import downsample_frame
+from common.image_service import get_image_service, stage_file_version
+
+
+@st.cache_resource
+def get_response_cache():
+    # Instance unique par processus, partagée entre toutes les sessions
+    return ResponseCache(max_entries=500, ttl_seconds=3600)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_model_version(stage_path):
+    # Empreinte (md5, date de modification) du modèle sémantique sur le stage : un fichier YAML
+    # remplacé sous le même nom change la clé du cache des réponses. None si LIST échoue.
+    try:
+        return stage_file_version(get_session(), stage_path)
+    except Exception as e:
+        logging.warning(f"Version du modèle {stage_path} indisponible : {e}")
+        return None
+
+
+@st.cache_resource
+def get_log_sink():
+    # File d'écriture partagée pour CORTEX_LOGS, CORTEX_VOTES et CORTEX_BOOKMARKS
+    return BufferedLogSink(max_batch_size=100, flush_interval=2.0, max_queue_size=5000)
+
+
+@st.cache_resource
+def get_sql_executor():
+    # Pool de threads pour lancer le SQL généré pendant que la réponse streamée continue
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="cortex-sql")
+
+
+@st.cache_resource
+def get_single_flight():
+    # Déduplication des appels Analyst identiques en cours, toutes sessions confondues
+    return SingleFlight()
+
+
+@st.cache_resource
+def get_shared_queries():
+    # Requêtes SQL identiques en cours, partagées par query id entre les sessions
+    return SharedQueries()
 
 class BaseAnalystApp:
+    RESULT_CACHE_MAX_BYTES = 100 * 1024 * 1024
+    RESULT_PAGE_SIZE = 1000
+    RESULT_MAX_ROWS = 10000
+    CHART_MAX_POINTS = 1000
+    STATEMENT_TIMEOUT = 120
+    BOOTSTRAP_TTL = 60
+    USER_WRITE_TIMEOUT = 10
+    # Mode de développement uniquement (voir streaming_enabled)
+    STREAMING = streaming_enabled()
+    RESPONSE_PARSER = "sse"
+
     def __init__(self, app_id):
         self.APP_ID = app_id
         self.setup_logging()
         self.load_app_config()
-        self.FILES = self.fetch_yamls()
+        self.FILES = MappingProxyType(self.fetch_yamls())
+        get_response_cache().sync_models(self.APP_ID, self.FILES)
 
     def setup_logging(self):
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     def load_app_config(self):
-        session = get_active_session()
+        session = get_session()
         query = f"""
             SELECT * 
             FROM CORTEX_DB.PUBLIC.CORTEX_APPS
@@ -33,58 +97,98 @@ class BaseAnalystApp:
         self.SCHEMA = row['APP_SCHEMA']
         self.STAGE = row['APP_STAGE']
         self.APP_LOGO_URL = row['APP_LOGO_URL']
-
-    def log_to_snowflake(self, username, input_text, output_json, elapsed_time, resolution_time, yaml_file):
-        session = get_active_session()
-        session.sql("""
-            INSERT INTO CORTEX_DB.PUBLIC.CORTEX_LOGS 
-            (DateTime, Username, App_Name, App_ID, Yaml_File, input_text, output_json, elapsed_time, resolution_time)
-            VALUES (?, CURRENT_USER(), ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.now(), 
-            self.APP_NAME,  # Use APP_NAME instead of APP_TITLE
-            self.APP_ID,
-            yaml_file,
-            input_text, 
-            json.dumps(output_json),
-            elapsed_time,
-            resolution_time
-        )).collect()
-
-    def calculate_resolution_time(self, elapsed_time):
-        return elapsed_time * 0.7
+        self.MAX_ROWS = row.as_dict().get('APP_MAX_ROWS') or self.RESULT_MAX_ROWS
+        self.STATEMENT_TIMEOUT = row.as_dict().get('APP_STATEMENT_TIMEOUT') or self.STATEMENT_TIMEOUT
+
+    def log_to_snowflake(self, username, input_text, output_json, elapsed_time, resolution_time, yaml_file, trace=None, cached=False):
+        # DATETIME est l'heure d'écriture (CURRENT_TIMESTAMP() à l'insertion, après la file du sink) et non
+        # le début de la question, conservé dans TRACE_JSON : une ligne écrite en retard ne tombe pas avant
+        # le filigrane des rollups et du chargement incrémental
+        session = get_session()
+        trace = trace or RequestTrace()
+        # Le span couvre la préparation de la ligne et se termine avant la sérialisation de la trace,
+        # pour figurer dans TRACE_JSON ; la mise en file (put_nowait) ne bloque pas, sauf file pleine,
+        # signalée par le sink
+        with trace.span("log_write"):
+            output = json.dumps(output_json)
+        get_log_sink().submit(
+            session,
+            "CORTEX_DB.PUBLIC.CORTEX_LOGS",
+            ("DateTime", "Username", "App_Name", "App_ID", "Yaml_File", "input_text", "output_json", "elapsed_time", "resolution_time",
+             "sql_time", "query_id", "trace_json", "request_id", "cached"),
+            (
+                self.APP_NAME,  # Use APP_NAME instead of APP_TITLE
+                self.APP_ID,
+                yaml_file,
+                input_text,
+                output,
+                elapsed_time,
+                resolution_time,
+                trace.total_ms("sql_execution"),
+                trace.first_attribute("sql_execution", "query_id"),
+                trace.to_json(),
+                trace.request_id,
+                cached
+            ),
+            placeholders=("CURRENT_TIMESTAMP()", "CURRENT_USER()", "?", "?", "?", "?", "?", "?", "?", "?", "?", "?", "?", "?")
+        )
+
+    def fetch_bootstrap_data(self):
+        # Favoris de l'utilisateur, questions populaires et questions clés en une seule requête,
+        # mis en cache dans la session (donc par utilisateur) avec un TTL court
+        cache = st.session_state.setdefault('bootstrap_data', {})
+        entry = cache.get(self.APP_ID)
+        if entry is not None and entry['expires_at'] > time.time():
+            return entry['data']
+
+        logging.info(f"fetch_bootstrap_data called in {__class__.__name__}")
+        session = get_session()
+        bootstrap_query = f"""
+        SELECT KIND, QUESTION
+        FROM (
+            SELECT 'BOOKMARK' AS KIND, BK_QUESTION AS QUESTION,
+                ROW_NUMBER() OVER (ORDER BY BK_UPDATED_AT DESC) AS RANK
+            FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
+            WHERE APP_ID = {self.APP_ID}
+            AND BK_USERNAME = CURRENT_USER()
+            UNION ALL
+            SELECT 'KEY' AS KIND, BK_QUESTION AS QUESTION,
+                ROW_NUMBER() OVER (ORDER BY BK_UPDATED_AT DESC) AS RANK
+            FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
+            WHERE APP_ID = {self.APP_ID}
+            AND BK_USERNAME = 'ALL'
+            UNION ALL
+            SELECT 'POPULAR' AS KIND, INPUT_TEXT AS QUESTION,
+                ROW_NUMBER() OVER (ORDER BY COUNT(*) DESC) AS RANK
+            FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+            WHERE App_ID = {self.APP_ID}
+            GROUP BY INPUT_TEXT
+        )
+        WHERE KIND = 'BOOKMARK'
+        OR (KIND = 'KEY' AND RANK <= 6)
+        OR (KIND = 'POPULAR' AND RANK <= 4)
+        ORDER BY KIND, RANK
+        """
+        data = {'BOOKMARK': [], 'KEY': [], 'POPULAR': []}
+        for row in session.sql(bootstrap_query).collect():
+            data[row['KIND']].append(row['QUESTION'])
+        cache[self.APP_ID] = {'data': data, 'expires_at': time.time() + self.BOOTSTRAP_TTL}
+        return data
+
+    def patch_cached_bookmarks(self, update):
+        # Invalidation ciblée : on applique la modification au cache plutôt que de relancer la requête
+        entry = st.session_state.get('bootstrap_data', {}).get(self.APP_ID)
+        if entry is not None:
+            entry['data']['BOOKMARK'] = update(entry['data']['BOOKMARK'])
 
     def fetch_popular_questions(self):
-        logging.info(f"fetch_popular_questions called in {__class__.__name__}")
-        session = get_active_session()
-        popular_questions_query = f"""
-        SELECT input_text, COUNT(*) as question_count
-        FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
-        WHERE App_ID = {self.APP_ID}
-        GROUP BY input_text
-        ORDER BY question_count DESC
-        LIMIT 4
-        """
-        popular_questions = session.sql(popular_questions_query).collect()
-        return [row['INPUT_TEXT'] for row in popular_questions]
-    
-    # @st.cache_data(ttl=3600)
-    def fetch_key_questions(self):  # Ajoutez un underscore devant 'self'
-        logging.info(f"fetch_key_questions called in {__class__.__name__}")
-        session = get_active_session()
-        user_bookmarks_query = f"""
-        SELECT bk_question 
-        FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
-        WHERE APP_ID = {self.APP_ID}
-        AND BK_USERNAME = 'ALL'
-        ORDER BY BK_UPDATED_AT DESC
-        LIMIT 6
-        """
-        user_bookmarks = session.sql(user_bookmarks_query).collect()
-        return [row['BK_QUESTION'] for row in user_bookmarks]
-    
+        return self.fetch_bootstrap_data()['POPULAR']
+
+    def fetch_key_questions(self):
+        return self.fetch_bootstrap_data()['KEY']
+
     def fetch_yamls(self):
-        session = get_active_session()
+        session = get_session()
         query = f"""
         SELECT *
         FROM CORTEX_DB.PUBLIC.CORTEX_MODELS
@@ -114,30 +218,61 @@ class BaseAnalystApp:
                             st.session_state.active_suggestion = question
 
     def load_and_display_image(self):
-        session = get_active_session()
+        session = get_session()
+        image_data = get_image_service().get(session, self.APP_LOGO_URL, (500, 500))
+        if image_data is None:
+            st.error("Erreur lors du chargement de l'image")
+            return None
+        col1, col2, col3 = st.columns([1,2,1])
+        with col2:
+            st.image(image_data, width=500)
+        return self.APP_LOGO_URL
+
+    def submit_user_write(self, label, table, columns, values, placeholders, on_success=None):
+        # Écriture visible par l'utilisateur (favori, vote) : envoi immédiat puis attente de la confirmation.
+        # Au-delà de USER_WRITE_TIMEOUT, l'écriture reste en file (None) et son résultat est annoncé
+        # au rerun suivant (display_write_notices) ; un échec définitif lève l'erreur du sink.
+        future = get_log_sink().submit(get_session(), table, columns, values, placeholders=placeholders, urgent=True)
         try:
-            with session.file.get_stream(self.APP_LOGO_URL) as file_stream:
-                image_data = file_stream.read()
-                col1, col2, col3 = st.columns([1,2,1])
-                with col2:
-                    st.image(image_data, width=500)
-            return self.APP_LOGO_URL
-        except Exception as e:
-            st.error(f"Erreur lors du chargement de l'image : {e}")
+            future.result(timeout=self.USER_WRITE_TIMEOUT)
+        except FutureTimeoutError:
+            st.session_state.setdefault('pending_writes', []).append((label, future, on_success))
             return None
+        if on_success is not None:
+            on_success()
+        return True
+
+    def display_write_notices(self):
+        # Messages laissés par le rerun précédent, puis résultat des écritures encore en file à ce moment-là
+        for kind, message in st.session_state.pop('write_notices', []):
+            getattr(st, kind)(message)
+        still_pending = []
+        for label, future, on_success in st.session_state.get('pending_writes', []):
+            if not future.done():
+                still_pending.append((label, future, on_success))
+            elif future.exception() is not None:
+                st.error(f"{label} : échec de l'enregistrement ({future.exception()}).")
+            else:
+                if on_success is not None:
+                    on_success()
+                st.success(f"{label} : enregistrement confirmé.")
+        st.session_state.pending_writes = still_pending
 
     def insert_bookmark_data(self, question, lang):
+        # True : écrit ; None : toujours en file ; False : échec
         logging.info(f"Tentative d'ajout d'un Bookmark : app_id={self.APP_ID}, question={question}, lang={lang}")
-        session = get_active_session()
         try:
-            query = """
-            INSERT INTO CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS 
-            (APP_ID, BK_USERNAME, BK_QUESTION, BK_LANG)
-            VALUES (?, CURRENT_USER(), ?, ?)
-            """
-            result = session.sql(query, (self.APP_ID, question, lang)).collect()
-            logging.info(f"Résultat de l'insertion du bookmark : {result}")
-            return True
+            written = self.submit_user_write(
+                "Favori",
+                "CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS",
+                ("APP_ID", "BK_USERNAME", "BK_QUESTION", "BK_LANG"),
+                (self.APP_ID, question, lang),
+                placeholders=("?", "CURRENT_USER()", "?", "?"),
+                # Le cache des favoris n'est modifié qu'une fois la ligne écrite
+                on_success=lambda: self.patch_cached_bookmarks(lambda bookmarks: [question] + bookmarks)
+            )
+            logging.info("Bookmark enregistré" if written else "Bookmark toujours en file d'insertion")
+            return written
         except Exception as e:
             logging.error(f"Erreur lors de l'ajout du bookmark: {str(e)}")
             return False
@@ -153,8 +288,11 @@ class BaseAnalystApp:
             logging.info(f"Button clicked")
             success = self.insert_bookmark_data(question, lang)
             if success:
-                st.success("Question enregistrée dans vos favoris !")
-                st.rerun() 
+                # Message affiché après le rerun qui met à jour la liste des favoris
+                st.session_state.setdefault('write_notices', []).append(("success", "Question enregistrée dans vos favoris !"))
+                st.rerun()
+            elif success is None:
+                st.info("Enregistrement du favori en cours, le résultat s'affichera au prochain rafraîchissement.")
             else:
                 st.error("Erreur lors de l'enregistrement du favori.")
 
@@ -204,7 +342,7 @@ class BaseAnalystApp:
                 st.rerun()
 
     def update_bookmark(self, old_bookmark, new_bookmark):
-        session = get_active_session()
+        session = get_session()
         update_query = f"""
         UPDATE CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
         SET BK_QUESTION = ?, BK_UPDATED_AT = CURRENT_TIMESTAMP()
@@ -213,10 +351,11 @@ class BaseAnalystApp:
         AND BK_QUESTION = ?
         """
         session.sql(update_query, (new_bookmark, old_bookmark)).collect()
+        self.patch_cached_bookmarks(lambda bookmarks: [new_bookmark if b == old_bookmark else b for b in bookmarks])
         logging.info(f"Favori mis à jour : '{old_bookmark}' -> '{new_bookmark}'")
 
     def delete_bookmark(self, question):
-        session = get_active_session()
+        session = get_session()
         delete_query = f"""
         DELETE FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
         WHERE APP_ID = {self.APP_ID}
@@ -224,73 +363,230 @@ class BaseAnalystApp:
         AND BK_QUESTION = ?
         """
         session.sql(delete_query, (question,)).collect()
+        self.patch_cached_bookmarks(lambda bookmarks: [b for b in bookmarks if b != question])
 
     def fetch_user_bookmarks(self):
-        logging.info(f"fetch_user_bookmarks called in {__class__.__name__}")
-        session = get_active_session()
-        user_bookmarks_query = f"""
-        SELECT BK_QUESTION 
-        FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
-        WHERE APP_ID = {self.APP_ID}
-        AND BK_USERNAME = CURRENT_USER()
-        ORDER BY BK_UPDATED_AT DESC
-        """
-        user_bookmarks = session.sql(user_bookmarks_query).collect()
-        return [row['BK_QUESTION'] for row in user_bookmarks]
+        return self.fetch_bootstrap_data()['BOOKMARK']
 
-    def insert_vote_data(self, question, yaml_file, vote_value):
-        logging.info(f"Tentative d'ajout d'un vote : app_id={self.APP_ID}, question={question}, vote_value={vote_value}")
-        session = get_active_session()
+    def insert_vote_data(self, question, yaml_file, vote_value, request_id=None):
+        # request_id : identifiant de la requête dans CORTEX_LOGS (REQUEST_ID), pour la jointure des votes
+        # True : écrit ; None : toujours en file ; False : échec
+        logging.info(f"Tentative d'ajout d'un vote : app_id={self.APP_ID}, request_id={request_id}, vote_value={vote_value}")
         try:
-            query = """
-            INSERT INTO CORTEX_DB.PUBLIC.CORTEX_VOTES 
-            (VOTE_USERNAME, QUESTION_TEXT, YAML_FILE, VOTE_VALUE)
-            VALUES (CURRENT_USER(), ?, ?, ?)
-            """
-            session.sql(query, (question, yaml_file, vote_value)).collect()
-            logging.info("Vote inséré avec succès")
-            return True
+            written = self.submit_user_write(
+                "Vote",
+                "CORTEX_DB.PUBLIC.CORTEX_VOTES",
+                ("VOTE_USERNAME", "VOTE_CREATED_AT", "QUESTION_TEXT", "YAML_FILE", "VOTE_VALUE", "APP_ID", "REQUEST_ID"),
+                (question, yaml_file, vote_value, self.APP_ID, request_id),
+                placeholders=("CURRENT_USER()", "CURRENT_TIMESTAMP()", "?", "?", "?", "?", "?")
+            )
+            logging.info("Vote enregistré" if written else "Vote toujours en file d'insertion")
+            return written
         except Exception as e:
             logging.error(f"Erreur lors de l'ajout du vote: {str(e)}")
             return False
 
-    def add_vote_button_up(self, question, yaml_file, message_index):
+    def display_vote_result(self, written, message, error_message):
+        if written:
+            st.success(message)
+        elif written is None:
+            st.info("Enregistrement du vote en cours, le résultat s'affichera au prochain rafraîchissement.")
+        else:
+            st.error(error_message)
+
+    def add_vote_button_up(self, question, yaml_file, message_index, request_id=None):
         logging.info(f"add_vote_buttons")
         question_hash = hashlib.md5(question.encode()).hexdigest()
         like_button_key = f"like_{message_index}_{question_hash}"
         if st.button("👍", key=like_button_key):
-            success = self.insert_vote_data(question, yaml_file, 1)
-            if success:
-                st.success("Vous avez aimé cette réponse !")
-            else:
-                st.error("Erreur lors de l'enregistrement du vote positif.")
+            written = self.insert_vote_data(question, yaml_file, 1, request_id)
+            self.display_vote_result(written, "Vous avez aimé cette réponse !",
+                                     "Erreur lors de l'enregistrement du vote positif.")
 
-    def add_vote_button_down(self, question, yaml_file, message_index):
+    def add_vote_button_down(self, question, yaml_file, message_index, request_id=None):
         logging.info(f"add_vote_buttons")
         question_hash = hashlib.md5(question.encode()).hexdigest()
         dislike_button_key = f"dislike_{message_index}_{question_hash}"
         if st.button("👎", key=dislike_button_key):
-            success = self.insert_vote_data(question, yaml_file, -1)
-            if success:
-                st.success("Vous n'avez pas aimé cette réponse. Merci pour votre feedback !")
-            else:
-                st.error("Erreur lors de l'enregistrement du vote négatif.")
+            written = self.insert_vote_data(question, yaml_file, -1, request_id)
+            self.display_vote_result(written, "Vous n'avez pas aimé cette réponse. Merci pour votre feedback !",
+                                     "Erreur lors de l'enregistrement du vote négatif.")
 
-    def add_feedback_buttons(self, question, lang, yaml_file, message_index):
+    def add_feedback_buttons(self, question, lang, yaml_file, message_index, request_id=None):
         col1, col2, col3 = st.columns([1,1,1])
         with col1:
             self.add_bookmark_button(question, lang, message_index)
         with col2:
-            self.add_vote_button_up(question, yaml_file, message_index)
+            self.add_vote_button_up(question, yaml_file, message_index, request_id)
         with col3:
-            self.add_vote_button_down(question, yaml_file, message_index)
+            self.add_vote_button_down(question, yaml_file, message_index, request_id)
+
+    def get_result_cache(self):
+        # Cache par session (st.session_state) des résultats SQL déjà affichés
+        if 'sql_results' not in st.session_state:
+            st.session_state.sql_results = ResultSetCache(max_bytes=self.RESULT_CACHE_MAX_BYTES)
+        return st.session_state.sql_results
+
+    def get_sql_jobs(self):
+        # Requêtes asynchrones en cours de la session : clé -> query id et heure de soumission.
+        # Dictionnaire simple pour rester accessible depuis les threads de préchargement.
+        if 'sql_jobs' not in st.session_state:
+            st.session_state.sql_jobs = {}
+        return st.session_state.sql_jobs
+
+    def submit_sql_job(self, session, jobs, job_key, flight_key, submit):
+        # Reprend la requête déjà soumise avant un rerun, sinon se rattache à la requête identique
+        # d'une autre session (get_shared_queries) ; chaque appelant a son propre handle AsyncJob
+        job_info = jobs.get(job_key)
+        if job_info is None:
+            query_id, submitted_at = get_shared_queries().acquire(
+                flight_key, lambda: (submit().query_id, time.time())
+            )
+            job_info = jobs[job_key] = {'query_id': query_id, 'submitted_at': submitted_at, 'flight_key': flight_key}
+        return session.create_async_job(job_info['query_id']), job_info['submitted_at']
+
+    def release_sql_jobs(self, session, jobs, job_key, cancel=False):
+        # Détache l'appelant de ses requêtes ; annulation côté serveur seulement si plus personne ne les attend
+        for suffix in ("result", "count"):
+            job_info = jobs.pop(job_key + (suffix,), None)
+            if job_info is None:
+                continue
+            last = get_shared_queries().release(job_info['flight_key'], job_info['query_id'])
+            if cancel and last:
+                session.sql(f"SELECT SYSTEM$CANCEL_QUERY('{job_info['query_id']}')").collect()
+                logging.info(f"Requête {job_info['query_id']} annulée")
+
+    def wait_for_sql_job(self, job, submitted_at, jobs, job_key, progress=None):
+        while not job.is_done():
+            if job_key not in jobs:
+                # Annulée par l'utilisateur de cette session (cancel_sql) pendant l'attente
+                raise RuntimeError(f"Requête {job.query_id} annulée")
+            elapsed = time.time() - submitted_at
+            if elapsed > self.STATEMENT_TIMEOUT:
+                raise TimeoutError(f"Requête {job.query_id} annulée après {self.STATEMENT_TIMEOUT} s")
+            if progress is not None:
+                progress.caption(f"⏳ Requête {job.query_id} en cours depuis {elapsed:.1f} s")
+            time.sleep(0.25)
+        if progress is not None:
+            progress.empty()
+
+    def open_sql_cursor(self, session, statement, jobs, job_key, progress=None):
+        # Une seule exécution par résultat : les pages sont lues à la suite dans ses lots (to_pandas_batches)
+        with current_trace().span("sql_execution", kind="result") as span:
+            job, submitted_at = self.submit_sql_job(
+                session, jobs, job_key + ("result",), ("sql", statement),
+                lambda: session.sql(statement).to_pandas_batches(block=False)
+            )
+            span["attributes"]["query_id"] = job.query_id
+            self.wait_for_sql_job(job, submitted_at, jobs, job_key + ("result",), progress)
+        return ResultCursor(job.result("pandas_batches"), self.MAX_ROWS, job.query_id)
+
+    def read_sql_page(self, cursor, offset):
+        with current_trace().span("dataframe_conversion", offset=offset) as span:
+            df = cursor.read(offset, self.RESULT_PAGE_SIZE)
+            span["attributes"]["rows"] = len(df)
+        return df
+
+    def count_sql_rows(self, session, cursor, jobs, job_key, progress=None):
+        # Total connu si le résultat a été lu en entier ; sinon COUNT(*) sur le résultat déjà
+        # calculé (RESULT_SCAN), sans réexécuter la requête
+        if cursor.exhausted:
+            return cursor.fetched_rows
+        count_query = f"SELECT COUNT(*) AS TOTAL_ROWS FROM TABLE(RESULT_SCAN('{cursor.query_id}'))"
+        with current_trace().span("sql_execution", kind="count") as span:
+            job, submitted_at = self.submit_sql_job(
+                session, jobs, job_key + ("count",), ("count", cursor.query_id),
+                lambda: session.sql(count_query).collect_nowait()
+            )
+            span["attributes"]["query_id"] = job.query_id
+            self.wait_for_sql_job(job, submitted_at, jobs, job_key + ("count",), progress)
+            return job.result("row")[0]['TOTAL_ROWS']
+
+    def run_sql(self, statement, session=None, jobs=None, job_key=None, progress=None):
+        # Première page et total ; le curseur renvoyé, propre à l'appelant, sert aux pages suivantes.
+        # L'exécution et le comptage sont partagés avec les sessions qui lancent la même requête.
+        session = session or get_session()
+        jobs = jobs if jobs is not None else {}
+        job_key = (job_key or statement_hash(statement),)
+        statement = statement.strip().rstrip(";")
 
-    def display_content(self, content: list, message_index: int = None, prompt: str = None, yaml_file: str = None):
-        message_index = message_index or len(st.session_state.messages)
+        try:
+            cursor = self.open_sql_cursor(session, statement, jobs, job_key, progress)
+            df = self.read_sql_page(cursor, 0)
+            total_rows = self.count_sql_rows(session, cursor, jobs, job_key, progress)
+        except Exception:
+            self.release_sql_jobs(session, jobs, job_key, cancel=True)
+            raise
+        # Une interruption par rerun (BaseException) garde les query ids pour reprendre les requêtes
+        self.release_sql_jobs(session, jobs, job_key)
+        logging.info(f"Exécution SQL : {get_shared_queries().stats()}")
+        return df, total_rows, cursor
+
+    def cancel_sql(self, message_id, statement):
+        # Annulation des requêtes de cette session pour ce résultat ; les autres sessions qui
+        # attendent la même requête continuent
+        cache_key = self.get_result_cache().make_key(message_id, statement)
+        self.release_sql_jobs(get_session(), self.get_sql_jobs(), (cache_key,), cancel=True)
+        st.session_state.setdefault('sql_cancelled', set()).add(cache_key)
+
+    def prefetch_sql(self, session, message_id, statement):
+        # Lance la requête dès que le SQL est émis, sans attendre la fin de la réponse streamée
+        result_cache = self.get_result_cache()
+        cache_key = result_cache.make_key(message_id, statement)
+        pending = st.session_state.setdefault('sql_prefetch', {})
+        if cache_key not in result_cache and cache_key not in pending:
+            # copy_context() pour que les spans SQL du thread rejoignent la trace de la question
+            pending[cache_key] = get_sql_executor().submit(
+                contextvars.copy_context().run, self.run_sql, statement, session, self.get_sql_jobs(), cache_key
+            )
+
+    def get_sql_result(self, message_id, statement):
+        result_cache = self.get_result_cache()
+        cache_key = result_cache.make_key(message_id, statement)
+        result = result_cache.get(cache_key)
+        if result is None:
+            if cache_key in st.session_state.get('sql_cancelled', set()):
+                return None
+            cancel_placeholder = st.empty()
+            if cancel_placeholder.button("⏹️ Annuler la requête", key=f"cancel_{message_id}_{cache_key[1]}"):
+                cancel_placeholder.empty()
+                self.cancel_sql(message_id, statement)
+                return None
+            future = st.session_state.get('sql_prefetch', {}).pop(cache_key, None)
+            if future is not None:
+                with st.spinner("Exécution de la requête SQL..."):
+                    df, total_rows, cursor = future.result()
+            else:
+                df, total_rows, cursor = self.run_sql(statement, jobs=self.get_sql_jobs(), job_key=cache_key, progress=st.empty())
+            cancel_placeholder.empty()
+            result = PagedResult(df, total_rows, self.MAX_ROWS, cursor)
+            result_cache.put(cache_key, result)
+        return result
+
+    def load_more_sql_result(self, message_id, statement):
+        result_cache = self.get_result_cache()
+        cache_key = result_cache.make_key(message_id, statement)
+        result = self.get_sql_result(message_id, statement)
+        df = self.read_sql_page(result.cursor, result.loaded_rows)
+        result = PagedResult(pd.concat([result.df, df], ignore_index=True), result.total_rows, self.MAX_ROWS, result.cursor)
+        result_cache.put(cache_key, result)
+        return result
+
+    def refresh_sql_result(self, message_id, statement):
+        result_cache = self.get_result_cache()
+        cache_key = result_cache.make_key(message_id, statement)
+        result_cache.evict(cache_key)
+        st.session_state.get('sql_cancelled', set()).discard(cache_key)
+
+    def display_content(self, content: list, message_index: int = None, prompt: str = None, yaml_file: str = None, message_id: str = None):
+        # L'index 0 (premier message de l'historique) est un index valide : pas de `or`
+        message_index = message_index if message_index is not None else len(st.session_state.messages)
+        request_id = message_id
+        message_id = message_id or f"idx-{message_index}"
         for item in content:
             if item["type"] == "text":
                 st.markdown(item["text"])
-                self.add_feedback_buttons(prompt, "FR", yaml_file, message_index)
+                self.add_feedback_buttons(prompt, "FR", yaml_file, message_index, request_id)
             elif item["type"] == "suggestions":
                 with st.expander("Suggestions", expanded=True):
                     for suggestion_index, suggestion in enumerate(item["suggestions"]):
@@ -299,56 +595,104 @@ class BaseAnalystApp:
                             st.session_state.active_suggestion = suggestion
                             st.experimental_rerun()
             elif item["type"] == "sql":
+                statement_key = statement_hash(item["statement"])
                 with st.expander("Requête SQL", expanded=False):
                     st.code(item["statement"], language="sql")
                 with st.expander("Résultats", expanded=True):
-                    with st.spinner("Exécution de la requête SQL..."):
-                        session = get_active_session()
-                        df = session.sql(item["statement"]).to_pandas()
-                        if not df.empty:
-                            data_tab, line_tab, bar_tab = st.tabs(
-                                ["Données", "Graphique en ligne", "Graphique en barres"]
-                            )
-                            data_tab.dataframe(df)
+                    if st.button("🔄 Actualiser", key=f"refresh_{message_id}_{statement_key}"):
+                        self.refresh_sql_result(message_id, item["statement"])
+                    try:
+                        result = self.get_sql_result(message_id, item["statement"])
+                    except Exception as e:
+                        st.error(f"Erreur lors de l'exécution de la requête : {str(e)}")
+                        continue
+                    if result is None:
+                        st.info("Requête annulée. Cliquez sur 🔄 Actualiser pour la relancer.")
+                        continue
+                    df = result.df
+                    if not df.empty:
+                        data_tab, line_tab, bar_tab = st.tabs(
+                            ["Données", "Graphique en ligne", "Graphique en barres"]
+                        )
+                        data_tab.dataframe(df)
+                        data_tab.caption(f"{result.loaded_rows} ligne(s) affichée(s) sur {result.total_rows} (limite : {result.max_rows})")
+                        if result.can_load_more:
+                            if data_tab.button("Charger plus", key=f"load_more_{message_id}_{statement_key}"):
+                                try:
+                                    self.load_more_sql_result(message_id, item["statement"])
+                                    st.rerun()
+                                except Exception as e:
+                                    st.error(f"Erreur lors du chargement des lignes suivantes : {str(e)}")
+                        with current_trace().span("chart_preparation", rows=len(df)):
                             if len(df.columns) > 1:
-                                df = df.set_index(df.columns[0])
-                                df_numeric = df.apply(pd.to_numeric, errors='coerce')
+                                chart_df = df.set_index(df.columns[0])
+                                df_numeric = chart_df.apply(pd.to_numeric, errors='coerce')
                                 df_numeric = df_numeric.dropna(axis=1, how='all')
+                                chart_points = df_numeric
+                                if len(df_numeric) > self.CHART_MAX_POINTS:
+                                    full_resolution = line_tab.toggle(
+                                        "Pleine résolution", key=f"full_resolution_{message_id}_{statement_key}")
+                                    if not full_resolution:
+                                        chart_points = downsample_frame(df_numeric, self.CHART_MAX_POINTS)
                                 with line_tab:
-                                    st.line_chart(df_numeric)
+                                    st.line_chart(chart_points)
                                 with bar_tab:
-                                    st.bar_chart(df_numeric)
+                                    st.bar_chart(chart_points)
+                                if len(chart_points) < len(df_numeric):
+                                    line_tab.caption(f"Graphique réduit à {len(chart_points)} points sur {len(df_numeric)}")
                             else:
                                 st.info("Le DataFrame n'a pas assez de colonnes pour générer un graphique.")
-                            col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
-                            with col1:
-                                csv = df.to_csv(index=False)
-                                st.download_button(
-                                    label="Télécharger les résultats en CSV",
-                                    data=csv,
-                                    file_name="resultats_requete.csv",
-                                    mime="text/csv",
-                                    key=f"download_{message_index}_{hash(df.to_string())}_{time.time()}"
-                                )
-                        else:
-                            st.info("Aucun résultat trouvé pour cette requête.")
+                        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+                        with col1:
+                            csv = df.to_csv(index=False)
+                            st.download_button(
+                                label="Télécharger les résultats en CSV",
+                                data=csv,
+                                file_name="resultats_requete.csv",
+                                mime="text/csv",
+                                key=f"download_{message_id}_{statement_key}"
+                            )
+                    else:
+                        st.info("Aucun résultat trouvé pour cette requête.")
 
     def process_message(self, prompt: str):
         yaml_file = self.FILES[st.session_state.selected_model]
 
         with st.chat_message("user"):
             st.markdown(prompt)
-        with st.chat_message("assistant"):
-            with st.spinner("Génération de la réponse..."):
-                response = self.send_message(prompt=prompt, yaml_file=yaml_file)
+        message_id = uuid.uuid4().hex
+        trace = RequestTrace(message_id)
+        token = set_current_trace(trace)
+        response = None
+        try:
+            with st.chat_message("assistant"):
+                if self.STREAMING:
+                    response = self.stream_message(prompt=prompt, yaml_file=yaml_file, message_id=message_id)
+                else:
+                    with st.spinner("Génération de la réponse..."):
+                        response = self.send_message(prompt=prompt, yaml_file=yaml_file)
                 if response:
                     content = response["message"]["content"]
-                    self.display_content(content=content, prompt=prompt, yaml_file=yaml_file)
-                    st.session_state.messages.append({"role": "assistant", "content": content})
+                    self.display_content(content=content, prompt=prompt, yaml_file=yaml_file, message_id=message_id)
+                    st.session_state.messages.append({"role": "assistant", "content": content, "id": message_id})
+        finally:
+            reset_current_trace(token)
+            if response:
+                # ELAPSED_TIME : appel Analyst (NULL si la réponse vient du cache) ;
+                # RESOLUTION_TIME : question -> réponse affichée
+                cached = bool(trace.first_attribute("analyst_api", "cached"))
+                self.log_to_snowflake(
+                    username="",
+                    input_text=prompt,
+                    output_json=response,
+                    elapsed_time=None if cached else trace.total_ms("analyst_api"),
+                    resolution_time=trace.elapsed_ms(),
+                    yaml_file=yaml_file,
+                    trace=trace,
+                    cached=cached
+                )
 
-    def send_message(self, prompt: str, yaml_file: str):
-        session = get_active_session()
-        start_time = time.time()
+    def build_request_body(self, prompt: str, yaml_file: str, stream: bool = False):
         request_body = {
             "messages": [
                 {
@@ -363,38 +707,103 @@ class BaseAnalystApp:
             ],
             "semantic_model_file": f"@{self.DATABASE}.{self.SCHEMA}.{self.STAGE}/{yaml_file}",
         }
-        try:
-            resp = _snowflake.send_snow_api_request(
-                "POST",
-                f"/api/v2/cortex/analyst/message",
-                {},
-                {},
-                request_body,
-                {},
-                30000,
-            )
-            elapsed_time = int((time.time() - start_time) * 1000)
-            if resp["status"] < 400:
-                output_json = json.loads(resp["content"])
-                resolution_time = self.calculate_resolution_time(elapsed_time)
-                self.log_to_snowflake(
-                    username="",
-                    input_text=prompt,
-                    output_json=output_json,
-                    elapsed_time=elapsed_time,
-                    resolution_time=resolution_time, 
-                    yaml_file=yaml_file
-                )
-                return output_json
-            else:
-                st.error(f"Erreur de l'API : {resp['status']} - {resp.get('content', 'Pas de détails')}")
+        if stream:
+            request_body["stream"] = True
+        return request_body
+
+    def response_cache_key(self, prompt: str, yaml_file: str):
+        model_version = load_model_version(f"@{self.DATABASE}.{self.SCHEMA}.{self.STAGE}/{yaml_file}")
+        return get_response_cache().make_key(self.APP_ID, yaml_file, prompt, model_version)
+
+    def get_cached_response(self, cache_key):
+        cache = get_response_cache()
+        cached_output = cache.get(cache_key)
+        if cached_output is not None:
+            logging.info(f"Réponse servie depuis le cache : {cache.stats()}")
+        return cached_output
+
+    def stream_message(self, prompt: str, yaml_file: str, message_id: str):
+        # Mode streamé : le texte s'affiche au fil de l'eau et le SQL part dès qu'il est complet
+        with current_trace().span("analyst_api", cached=False, streaming=True) as span:
+            timer = StreamTimer()
+            cache_key = self.response_cache_key(prompt, yaml_file)
+            cached_output = self.get_cached_response(cache_key)
+            if cached_output is not None:
+                span["attributes"]["cached"] = True
+                return cached_output
+
+            session = get_session()
+            parser = RESPONSE_PARSERS[self.RESPONSE_PARSER]()
+            live = st.empty()
+            placeholders = {}
+            output_json = None
+            try:
+                lines = open_analyst_stream(self.build_request_body(prompt, yaml_file, stream=True))
+                with live.container():
+                    status_placeholder = st.empty()
+                    for kind, index, value in parser.parse(lines):
+                        if kind == "status":
+                            status_placeholder.caption(value)
+                        elif kind == "text_delta":
+                            timer.mark_token()
+                            placeholders.setdefault(index, st.empty()).markdown(value)
+                        elif kind == "block_done" and value["type"] == "text":
+                            timer.mark_token()
+                            placeholders.setdefault(index, st.empty()).markdown(value["text"])
+                        elif kind == "block_done" and value["type"] == "sql":
+                            placeholders.setdefault(index, st.empty()).code(value["statement"], language="sql")
+                            self.prefetch_sql(session, message_id, value["statement"])
+                        elif kind == "done":
+                            output_json = value
+            except Exception as e:
+                live.empty()
+                st.error(f"Une erreur est survenue : {str(e)}")
+                return None
+            live.empty()
+
+            span["attributes"]["first_token_ms"] = timer.first_token_ms
+            logging.info(f"Réponse streamée : premier fragment en {timer.first_token_ms} ms, complète en {timer.elapsed_ms()} ms")
+            get_response_cache().put(cache_key, output_json)
+            return output_json
+
+    def send_message(self, prompt: str, yaml_file: str):
+        with current_trace().span("analyst_api", cached=False, streaming=False) as span:
+            cache_key = self.response_cache_key(prompt, yaml_file)
+            cached_output = self.get_cached_response(cache_key)
+            if cached_output is not None:
+                span["attributes"]["cached"] = True
+                return cached_output
+            cache = get_response_cache()
+            request_body = self.build_request_body(prompt, yaml_file)
+            try:
+                # Les questions identiques déjà en cours partagent la même réponse de l'API
+                single_flight = get_single_flight()
+                resp = single_flight.do(("analyst",) + cache_key, lambda: send_api_request(
+                    "POST",
+                    f"/api/v2/cortex/analyst/message",
+                    {},
+                    {},
+                    request_body,
+                    {},
+                    30000,
+                ))
+                logging.info(f"Appel Analyst : {single_flight.stats()}")
+                span["attributes"]["status"] = resp["status"]
+                if resp["status"] < 400:
+                    output_json = json.loads(resp["content"])
+                    cache.put(cache_key, output_json)
+                    logging.info(f"Réponse mise en cache : {cache.stats()}")
+                    return output_json
+                else:
+                    st.error(f"Erreur de l'API : {resp['status']} - {resp.get('content', 'Pas de détails')}")
+                    return None
+            except Exception as e:
+                st.error(f"Une erreur est survenue : {str(e)}")
                 return None
-        except Exception as e:
-            st.error(f"Une erreur est survenue : {str(e)}")
-            return None 
 
     def clear_chat_history(self):
         st.session_state.messages = []
+        self.get_result_cache().clear()
 
     def run(self):
         if 'selected_model' not in st.session_state:
@@ -407,6 +816,8 @@ class BaseAnalystApp:
         if 'active_suggestion' not in st.session_state:
             st.session_state.active_suggestion = None
 
+        self.display_write_notices()
+
         # Affichage des messages existants
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
@@ -433,6 +844,8 @@ class BaseAnalystApp:
             st.session_state.editing_bookmark_index = None                    
 
         st.sidebar.button("Effacer l'historique du chat", on_click=self.clear_chat_history, key="clear_history_button")
+        if self.STREAMING:
+            st.sidebar.caption("⚙️ Réponses streamées : mode de développement (CORTEX_ANALYST_URL), non disponible dans Streamlit in Snowflake")
         self.display_user_bookmarks_and_popular_questions()
 
         if self.FILES:
@@ -447,6 +860,7 @@ class BaseAnalystApp:
 
             if previous_model != st.session_state.selected_model:
                 st.session_state.messages = []
+                self.get_result_cache().clear()
                 st.session_state.suggestions = []
                 st.session_state.active_suggestion = None
 
@@ -464,7 +878,8 @@ class BaseAnalystApp:
                             content=message["content"],
                             message_index=message_index,
                             prompt=st.session_state.messages[message_index-1]["content"][0]["text"],
-                            yaml_file=self.FILES[st.session_state.selected_model]
+                            yaml_file=self.FILES[st.session_state.selected_model],
+                            message_id=message.get("id")
                         )
 
             if user_input := st.chat_input("Quelle est votre question ?"):
@@ -0,0 +1,361 @@
+import argparse
+import csv
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import MagicMock
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.pages_manager import PagesManager
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+from streamlit.testing.v1.util import patch_config_options
+from common.backend import set_backend
+from common.local_backend import LocalBackend
+from bench.workloads import seed_logs
+
+# Rejeu de questions enregistrées par des utilisateurs simulés concurrents, chacun avec sa propre
+# session Streamlit (AppTest), contre le backend local : API Analyst factice et entrepôt SQLite à
+# latence et concurrence réglables. Les caches partagés (réponses, single-flight, registre) sont
+# ceux de l'application : leur effet sous charge est mesuré tel quel.
+#
+# Mode ouvert : arrivées de Poisson (--rate req/s), servies par --users sessions ; l'attente
+#   avant prise en charge est le délai de file.
+# Mode fermé : --users sessions qui enchaînent question, réponse, temps de réflexion (--think-time).
+# Rejeu d'un export CSV de CORTEX_LOGS avec --preserve-timing : intervalles d'origine / --speedup.
+#
+# Usage : python -m bench.load_replay --mode open --rate 2 --users 8 --requests 200
+#         python -m bench.load_replay --questions-csv cortex_logs.csv --preserve-timing --speedup 60
+#         python -m bench.load_replay --questions-file questions.jsonl --mode closed --users 20
+
+QUESTION_FIELDS = ("question", "prompt", "INPUT_TEXT", "input_text", "text", "title")
+
+
+def user_session_script():
+    from apps.app_registry import get_app_registry
+    get_app_registry().get(1).run()
+
+
+# --- Sources de questions ------------------------------------------------------------------
+
+def load_questions_jsonl(path, field=None):
+    questions = []
+    with open(path, encoding="utf-8") as questions_file:
+        for line in questions_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                questions.append((record, None))
+                continue
+            key = field or next((f for f in QUESTION_FIELDS if record.get(f)), None)
+            if key and record.get(key):
+                questions.append((str(record[key]), None))
+    return questions
+
+
+def load_questions_csv(path):
+    # Export de CORTEX_LOGS : INPUT_TEXT et, si présent, DATETIME pour rejouer le rythme d'origine
+    questions = []
+    with open(path, encoding="utf-8", newline="") as questions_file:
+        for record in csv.DictReader(questions_file):
+            record = {key.upper(): value for key, value in record.items()}
+            if record.get("INPUT_TEXT"):
+                timestamp = datetime.fromisoformat(record["DATETIME"]) if record.get("DATETIME") else None
+                questions.append((record["INPUT_TEXT"], timestamp))
+    return sorted(questions, key=lambda q: q[1] or datetime.min)
+
+
+def load_questions_from_logs(session):
+    rows = session.sql("""
+        SELECT INPUT_TEXT, DATETIME FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+        WHERE INPUT_TEXT IS NOT NULL
+        ORDER BY DATETIME
+    """).collect()
+    return [(row["INPUT_TEXT"], row["DATETIME"]) for row in rows]
+
+
+def arrival_offsets(questions, options, rng):
+    # Instant d'arrivée (s depuis le début) de chaque requête, en mode ouvert
+    if options.preserve_timing and all(timestamp is not None for _, timestamp in questions):
+        origin = questions[0][1]
+        return [(timestamp - origin).total_seconds() / options.speedup for _, timestamp in questions]
+    offsets, current = [], 0.0
+    for _ in questions:
+        current += rng.expovariate(options.rate)
+        offsets.append(current)
+    return offsets
+
+
+# --- Utilisateurs simulés --------------------------------------------------------------------
+
+@contextmanager
+def shared_runtime():
+    # Runtime factice unique pour tout le rejeu, comme celui qu'AppTest installe le temps d'un run
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    try:
+        with patch_config_options({"global.appTest": True}):
+            yield runtime
+    finally:
+        Runtime._instance = None
+
+
+class SessionAppTest(AppTest):
+    # AppTest installe puis retire le Runtime global à chaque run, ce qui interrompt les autres
+    # sessions en cours : ici les runs concurrents partagent le Runtime de shared_runtime()
+
+    @classmethod
+    def from_function(cls, script, *, default_timeout=3, args=None, kwargs=None):
+        # AppTest.from_function instancie toujours AppTest : même script, classe dérivée
+        app_test = AppTest.from_function(script, default_timeout=default_timeout, args=args, kwargs=kwargs)
+        return cls(app_test._script_path, default_timeout=default_timeout, args=args, kwargs=kwargs)
+
+    def _run(self, widget_state=None, timeout=None):
+        script_runner = LocalScriptRunner(
+            self._script_path,
+            self.session_state,
+            PagesManager(self._script_path, setup_watcher=False),
+            args=self.args,
+            kwargs=self.kwargs,
+        )
+        self._tree = script_runner.run(widget_state, self.query_params, timeout or self.default_timeout, self._page_hash)
+        self._tree._runner = self
+        return self
+
+
+class SimulatedUser:
+    # Une session Streamlit : historique, caches de session et requêtes en cours propres
+
+    def __init__(self, user_id, options):
+        self.user_id = user_id
+        self.options = options
+        self.questions_asked = 0
+        self.open_session()
+
+    def open_session(self):
+        # Premier affichage de la page, hors mesure
+        self.app_test = SessionAppTest.from_function(user_session_script, default_timeout=self.options.timeout)
+        self.app_test.run()
+
+    def ask(self, question):
+        if self.options.reset_every and self.questions_asked and self.questions_asked % self.options.reset_every == 0:
+            self.open_session()
+        self.app_test.session_state["active_suggestion"] = question
+        self.app_test.run()
+        self.questions_asked += 1
+        errors = [element.value for element in self.app_test.error]
+        if self.app_test.exception:
+            errors.append(str(self.app_test.exception[0].value))
+        return errors
+
+
+def run_request(user, question, arrival, started_at):
+    start = time.perf_counter()
+    try:
+        errors = user.ask(question)
+    except Exception as e:
+        errors = [str(e)]
+    end = time.perf_counter()
+    return {
+        "user": user.user_id,
+        "question": question,
+        "arrival": arrival - started_at,
+        "start": start - started_at,
+        "end": end - started_at,
+        "queue_ms": (start - arrival) * 1000,
+        "latency_ms": (end - arrival) * 1000,
+        "service_ms": (end - start) * 1000,
+        "error": errors[0] if errors else None,
+    }
+
+
+def run_open(questions, options, rng):
+    # File d'arrivées partagée, servie par options.users sessions
+    offsets = arrival_offsets(questions, options, rng)
+    pending = queue.Queue()
+    records, lock = [], threading.Lock()
+    users = [SimulatedUser(i, options) for i in range(options.users)]
+    started_at = time.perf_counter()
+    for (question, _), offset in zip(questions, offsets):
+        pending.put((started_at + offset, question))
+
+    def worker(user):
+        while True:
+            try:
+                arrival, question = pending.get_nowait()
+            except queue.Empty:
+                return
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            record = run_request(user, question, arrival, started_at)
+            with lock:
+                records.append(record)
+
+    threads = [threading.Thread(target=worker, args=(user,), name=f"user-{user.user_id}") for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - started_at
+
+
+def run_closed(questions, options, rng):
+    # Chaque session enchaîne ses questions, séparées par un temps de réflexion exponentiel
+    pending = queue.Queue()
+    for question, _ in questions:
+        pending.put(question)
+    records, lock = [], threading.Lock()
+    users = [SimulatedUser(i, options) for i in range(options.users)]
+    started_at = time.perf_counter()
+
+    def worker(user, user_rng):
+        while True:
+            try:
+                question = pending.get_nowait()
+            except queue.Empty:
+                return
+            record = run_request(user, question, time.perf_counter(), started_at)
+            with lock:
+                records.append(record)
+            if options.think_time > 0:
+                time.sleep(user_rng.expovariate(1 / options.think_time))
+
+    threads = [
+        threading.Thread(target=worker, args=(user, random.Random(rng.random())), name=f"user-{user.user_id}")
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - started_at
+
+
+# --- Rapport ---------------------------------------------------------------------------------
+
+def percentile(values, quantile):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(quantile * (len(values) - 1))))]
+
+
+def summarize(records, duration, backend_stats):
+    completed = [r for r in records if r["error"] is None]
+    latencies = [r["latency_ms"] for r in completed]
+    queues = [r["queue_ms"] for r in records]
+    requests = max(len(records), 1)
+    return {
+        "requests": len(records),
+        "errors": len(records) - len(completed),
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(len(completed) / duration, 3) if duration else None,
+        "latency_p50_ms": round(percentile(latencies, 0.5) or 0, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) or 0, 1),
+        "queue_p50_ms": round(percentile(queues, 0.5) or 0, 1),
+        "queue_p99_ms": round(percentile(queues, 0.99) or 0, 1),
+        "service_p50_ms": round(percentile([r["service_ms"] for r in completed], 0.5) or 0, 1),
+        # Amplification : appels aux services par question posée (< 1 grâce aux caches et au single-flight)
+        "analyst_calls_per_request": round(backend_stats["analyst_calls"] / requests, 3),
+        "queries_per_request": round(backend_stats["queries"] / requests, 2),
+        "rows_per_request": round(backend_stats["rows"] / requests, 1),
+        "bytes_per_request": round(backend_stats["bytes"] / requests),
+    }
+
+
+def print_summary(summary, options):
+    print(f"Mode {options.mode}, {options.users} session(s), "
+          + (f"{options.rate} req/s" if options.mode == "open" else f"réflexion {options.think_time} s"))
+    for key, value in summary.items():
+        if key != "error_samples":
+            print(f"  {key:<26} {value}")
+    errors = summary.get("error_samples")
+    if errors:
+        print("  Exemples d'erreurs :")
+        for error in errors:
+            print(f"    - {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu de charge multi-sessions")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--questions-file", help="JSONL de questions (champ --field, ou question/prompt/INPUT_TEXT/title)")
+    source.add_argument("--questions-csv", help="export CSV de CORTEX_LOGS (INPUT_TEXT, DATETIME)")
+    parser.add_argument("--field", help="champ de la question dans le JSONL")
+    parser.add_argument("--synthetic-logs", type=int, default=500, help="sans fichier : questions de logs synthétiques")
+    parser.add_argument("--requests", type=int, default=100, help="nombre de requêtes rejouées")
+    parser.add_argument("--mode", choices=("open", "closed"), default="open")
+    parser.add_argument("--users", type=int, default=8, help="sessions simulées concurrentes")
+    parser.add_argument("--rate", type=float, default=2.0, help="mode ouvert : arrivées par seconde")
+    parser.add_argument("--think-time", type=float, default=5.0, help="mode fermé : réflexion moyenne (s)")
+    parser.add_argument("--preserve-timing", action="store_true", help="rejoue les intervalles d'origine (DATETIME)")
+    parser.add_argument("--speedup", type=float, default=60.0, help="accélération du rythme d'origine")
+    parser.add_argument("--cache-busting", action="store_true", help="questions rendues uniques (sans cache de réponses)")
+    parser.add_argument("--reset-every", type=int, default=0, help="nouvelle session toutes les n questions (0 : jamais)")
+    parser.add_argument("--analyst-latency", type=float, default=2.0, help="latence de l'API Analyst factice (s)")
+    parser.add_argument("--analyst-error-rate", type=float, default=0.0)
+    parser.add_argument("--query-latency", type=float, default=0.2, help="latence de chaque requête SQL (s)")
+    parser.add_argument("--warehouse-concurrency", type=int, default=8, help="requêtes asynchrones simultanées")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="écrit le résumé et le détail des requêtes dans ce fichier")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logging.disable(logging.WARNING)
+    rng = random.Random(options.seed)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    backend = LocalBackend(
+        analyst_latency=options.analyst_latency,
+        analyst_error_rate=options.analyst_error_rate,
+        query_latency=options.query_latency,
+        warehouse_concurrency=options.warehouse_concurrency,
+    )
+    set_backend(backend)
+
+    if options.questions_file:
+        questions = load_questions_jsonl(options.questions_file, options.field)
+    elif options.questions_csv:
+        questions = load_questions_csv(options.questions_csv)
+    else:
+        seed_logs(backend.session(), options.synthetic_logs, seed=options.seed)
+        questions = load_questions_from_logs(backend.session())
+    if not questions:
+        print("Aucune question à rejouer")
+        return 2
+    # Cycle sur les questions si la source est plus courte que le nombre de requêtes demandé
+    questions = [questions[i % len(questions)] for i in range(options.requests)]
+    if options.cache_busting:
+        questions = [(f"{question} [{i}]", timestamp) for i, (question, timestamp) in enumerate(questions)]
+
+    backend.stats.update({key: 0 for key in backend.stats})
+    runner = run_open if options.mode == "open" else run_closed
+    with shared_runtime():
+        records, duration = runner(questions, options, rng)
+    summary = summarize(records, duration, dict(backend.stats))
+    summary["error_samples"] = sorted({r["error"] for r in records if r["error"]})[:5]
+    print_summary(summary, options)
+    if options.json:
+        with open(options.json, "w") as output:
+            json.dump({"options": vars(options), "summary": summary, "requests": records}, output, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
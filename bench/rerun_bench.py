@@ -0,0 +1,224 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from common.backend import set_backend
+from common.local_backend import LocalBackend
+from bench.workloads import make_history, seed_bookmarks, seed_logs
+
+# Coût d'un rerun Streamlit (BaseAnalystApp.run, display_content, monitoring main()) en fonction
+# du volume : historique de N messages, M favoris, K lignes de logs. Exécuté sans navigateur avec
+# AppTest, contre le backend local (SQLite + Analyst factice sans latence).
+#
+# Usage : python -m bench.rerun_bench --messages 50 --bookmarks 20 --logs 5000
+#         python -m bench.rerun_bench --save-baseline bench/baseline.json
+#         python -m bench.rerun_bench --baseline bench/baseline.json   (code retour 1 si régression)
+
+BENCH_USER = "BENCH_USER"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Mesures comparées à la référence et tolérance relative (les temps dépendent de la machine :
+# la référence est à régénérer avec --save-baseline sur la machine qui compare)
+REGRESSION_TOLERANCES = {
+    "queries": 0.0,
+    "bytes": 0.05,
+    "wall_ms": 0.25,
+    "peak_kb": 0.25,
+}
+# Écart absolu minimal pour signaler une régression (bruit de mesure sur les petites valeurs)
+REGRESSION_MIN_DELTAS = {"wall_ms": 50, "peak_kb": 256}
+
+
+# --- Scripts exécutés par AppTest (le corps de chaque fonction devient le script) ----------
+
+def analyst_app_script():
+    from apps.app_registry import get_app_registry
+    get_app_registry().get(1).run()
+
+
+def display_content_script(result_rows):
+    import streamlit as st
+    from apps.app_registry import get_app_registry
+    from bench.workloads import analyst_content
+    st.session_state.setdefault("messages", [])
+    prompt = "Évolution du nombre de participants par édition"
+    get_app_registry().get(1).display_content(
+        analyst_content(prompt, result_rows), message_index=1, prompt=prompt,
+        yaml_file="demo.yaml", message_id="bench-display")
+
+
+def monitoring_script():
+    from pages.monitoring import main
+    main()
+
+
+def ask_question_script():
+    import streamlit as st
+    from apps.app_registry import get_app_registry
+    st.session_state.active_suggestion = "Combien de médailles par pays ?"
+    get_app_registry().get(1).run()
+
+
+SCENARIOS = {
+    "analyst_run": "Rerun de BaseAnalystApp.run avec l'historique",
+    "display_content": "display_content d'une réponse avec un résultat SQL",
+    "monitoring": "Rerun de la page monitoring",
+    "ask_question": "Rerun avec une nouvelle question (appel Analyst + SQL)",
+}
+
+
+def build_app_test(scenario, options):
+    if scenario == "display_content":
+        app_test = AppTest.from_function(display_content_script, args=(options.result_rows,), default_timeout=options.timeout)
+    else:
+        script = {"analyst_run": analyst_app_script, "monitoring": monitoring_script, "ask_question": ask_question_script}[scenario]
+        app_test = AppTest.from_function(script, default_timeout=options.timeout)
+    if scenario in ("analyst_run", "ask_question"):
+        app_test.session_state["messages"] = make_history(options.messages, options.result_rows)
+    return app_test
+
+
+# --- Mesure -------------------------------------------------------------------------------
+
+def create_backend(options):
+    backend = LocalBackend(user=BENCH_USER, analyst_latency=0.0, query_latency=options.query_latency)
+    session = backend.session()
+    seed_bookmarks(session, options.bookmarks, BENCH_USER)
+    seed_logs(session, options.logs)
+    backend.stats.update({key: 0 for key in backend.stats})
+    return backend
+
+
+def measure(app_test, backend, trace_memory=False):
+    before = dict(backend.stats)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    app_test.run()
+    wall_ms = (time.perf_counter() - start) * 1000
+    peak_kb = None
+    if trace_memory:
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    if app_test.exception:
+        raise RuntimeError(f"Exception dans le script : {app_test.exception[0].value}")
+    result = {key: backend.stats[key] - before[key] for key in backend.stats}
+    result["wall_ms"] = round(wall_ms, 1)
+    if peak_kb is not None:
+        result["peak_kb"] = round(peak_kb, 1)
+    return result
+
+
+def run_scenario(scenario, options):
+    # Caches partagés vidés : chaque scénario démarre à froid, sur une base neuve
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    backend = create_backend(options)
+    previous = set_backend(backend)
+    try:
+        app_test = build_app_test(scenario, options)
+        cold = measure(app_test, backend)
+        if scenario == "ask_question":
+            # Les reruns suivants réaffichent la réponse ajoutée à l'historique
+            app_test.session_state["active_suggestion"] = None
+        warm_runs = [measure(app_test, backend) for _ in range(options.reruns)]
+        memory = measure(app_test, backend, trace_memory=True)
+    finally:
+        set_backend(previous)
+    warm = {key: statistics.median(run[key] for run in warm_runs) for key in warm_runs[0]}
+    warm["wall_ms_p90"] = round(sorted(run["wall_ms"] for run in warm_runs)[int(0.9 * (len(warm_runs) - 1))], 1)
+    warm["peak_kb"] = memory["peak_kb"]
+    return {"cold": cold, "warm": warm}
+
+
+def workload_key(options):
+    return f"messages={options.messages},bookmarks={options.bookmarks},logs={options.logs},rows={options.result_rows}"
+
+
+def compare(results, baseline, tolerance_scale=1.0):
+    # Régressions : mesures au-delà de la référence (plus la tolérance) pour la même charge
+    regressions = []
+    for scenario, phases in results.items():
+        for phase, metrics in phases.items():
+            reference = baseline.get(scenario, {}).get(phase, {})
+            for metric, tolerance in REGRESSION_TOLERANCES.items():
+                if metric not in metrics or metric not in reference:
+                    continue
+                # Premier rerun : imports et caches à froid, temps trop bruité pour être comparé
+                if phase == "cold" and metric == "wall_ms":
+                    continue
+                limit = reference[metric] * (1 + tolerance * tolerance_scale)
+                if metrics[metric] > limit and metrics[metric] - reference[metric] > REGRESSION_MIN_DELTAS.get(metric, 0):
+                    regressions.append(f"{scenario}/{phase} {metric} : {metrics[metric]} > {reference[metric]} (+{tolerance:.0%})")
+    return regressions
+
+
+def print_report(results):
+    columns = ("queries", "rows", "bytes", "analyst_calls", "wall_ms", "peak_kb")
+    print(f"{'scénario':<16} {'phase':<5} " + " ".join(f"{c:>13}" for c in columns))
+    for scenario, phases in results.items():
+        for phase, metrics in phases.items():
+            print(f"{scenario:<16} {phase:<5} " + " ".join(f"{metrics.get(c, ''):>13}" for c in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du coût d'un rerun Streamlit")
+    parser.add_argument("--messages", type=int, default=20, help="échanges dans l'historique (N)")
+    parser.add_argument("--bookmarks", type=int, default=20, help="favoris de l'utilisateur (M)")
+    parser.add_argument("--logs", type=int, default=2000, help="lignes de CORTEX_LOGS (K)")
+    parser.add_argument("--result-rows", type=int, default=200, help="lignes de chaque résultat SQL")
+    parser.add_argument("--reruns", type=int, default=5, help="reruns mesurés après le premier")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="latence simulée de l'entrepôt (s)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--baseline", help="fichier de référence à comparer")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="enregistre les résultats comme référence")
+    parser.add_argument("--tolerance-scale", type=float, default=1.0, help="multiplie les tolérances (machines bruitées)")
+    parser.add_argument("--json", help="écrit les résultats bruts dans ce fichier")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logging.disable(logging.WARNING)
+    results = {}
+    for scenario in options.scenarios:
+        print(f"… {scenario} : {SCENARIOS[scenario]}", file=sys.stderr)
+        results[scenario] = run_scenario(scenario, options)
+    print(f"Charge : {workload_key(options)}")
+    print_report(results)
+
+    if options.json:
+        with open(options.json, "w") as output:
+            json.dump({"workload": workload_key(options), "results": results}, output, indent=2)
+    if options.save_baseline:
+        baselines = {}
+        if os.path.exists(options.save_baseline):
+            with open(options.save_baseline) as baseline_file:
+                baselines = json.load(baseline_file)
+        baselines[workload_key(options)] = results
+        with open(options.save_baseline, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"Référence enregistrée dans {options.save_baseline}")
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file).get(workload_key(options))
+        if baseline is None:
+            print(f"Pas de référence pour la charge {workload_key(options)}")
+            return 2
+        regressions = compare(results, baseline, options.tolerance_scale)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}")
+        if regressions:
+            return 1
+        print("Aucune régression par rapport à la référence")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+from common.fake_analyst_server import canned_content
+
+# Données synthétiques pour les benchmarks : historique de conversation, favoris et logs,
+# insérés dans le backend local (common/local_backend.py)
+
+DEMO_APP_ID = 1
+DEMO_APP_NAME = "Démo locale"
+DEMO_YAML_FILE = "demo.yaml"
+
+QUESTIONS = [
+    "Combien de médailles par pays ?",
+    "Quels sont les athlètes les plus titrés ?",
+    "Évolution du nombre de participants par édition",
+    "Répartition des médailles par discipline",
+    "Quelle région a le plus progressé cette année ?",
+    "Top 10 des sports par nombre d'épreuves",
+]
+
+
+def series_statement(rows):
+    # SELECT renvoyant `rows` lignes (jour, total) : résultat affiché en tableau et en graphiques
+    return f"""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {int(rows)})
+        SELECT i AS JOUR, (i * 37) % 101 AS TOTAL FROM n
+    """
+
+
+def analyst_content(prompt, result_rows=50):
+    content = canned_content(prompt)
+    for item in content:
+        if item["type"] == "sql":
+            item["statement"] = series_statement(result_rows)
+    return content
+
+
+def make_history(messages, result_rows=50, seed=0):
+    # `messages` échanges question / réponse, au format de st.session_state.messages
+    rng = random.Random(seed)
+    history = []
+    for index in range(messages):
+        prompt = f"{rng.choice(QUESTIONS)} (#{index})"
+        history.append({"role": "user", "content": [{"type": "text", "text": prompt}]})
+        history.append({"role": "assistant", "content": analyst_content(prompt, result_rows), "id": uuid.UUID(int=rng.getrandbits(128)).hex})
+    return history
+
+
+def seed_bookmarks(session, count, username, app_id=DEMO_APP_ID):
+    rows = [(app_id, username, f"{QUESTIONS[i % len(QUESTIONS)]} [favori {i}]", "fr") for i in range(count)]
+    if rows:
+        session.sql(
+            "INSERT INTO CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS (APP_ID, BK_USERNAME, BK_QUESTION, BK_LANG) VALUES "
+            + ", ".join(["(?, ?, ?, ?)"] * len(rows)),
+            [value for row in rows for value in row],
+        ).collect()
+
+
+def seed_logs(session, count, users=5, days=30, vote_ratio=0.1, seed=0, batch_size=200):
+    # `count` lignes de CORTEX_LOGS réparties sur `days` jours, et une part de votes liés par REQUEST_ID
+    rng = random.Random(seed)
+    now = datetime.now()
+    logs, votes = [], []
+    for index in range(count):
+        prompt = rng.choice(QUESTIONS)
+        request_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        elapsed = rng.lognormvariate(7.5, 0.5)
+        sql_time = rng.lognormvariate(6, 0.8)
+        logs.append((
+            now - timedelta(seconds=rng.uniform(0, days * 86400)),
+            f"USER_{index % users}", DEMO_APP_NAME, DEMO_APP_ID, DEMO_YAML_FILE, prompt,
+            json.dumps({"message": {"role": "analyst", "content": canned_content(prompt)}, "request_id": request_id}),
+            elapsed, elapsed + sql_time, sql_time, f"bench-{index}", "{}", request_id,
+        ))
+        if rng.random() < vote_ratio:
+            votes.append((f"USER_{index % users}", prompt, DEMO_YAML_FILE, rng.choice([1, 1, -1]), DEMO_APP_ID, request_id))
+    columns = ("DATETIME", "USERNAME", "APP_NAME", "APP_ID", "YAML_FILE", "INPUT_TEXT", "OUTPUT_JSON",
+               "ELAPSED_TIME", "RESOLUTION_TIME", "SQL_TIME", "QUERY_ID", "TRACE_JSON", "REQUEST_ID")
+    insert_rows(session, "CORTEX_DB.PUBLIC.CORTEX_LOGS", columns, logs, batch_size)
+    insert_rows(session, "CORTEX_DB.PUBLIC.CORTEX_VOTES",
+                ("VOTE_USERNAME", "QUESTION_TEXT", "YAML_FILE", "VOTE_VALUE", "APP_ID", "REQUEST_ID"), votes, batch_size)
+
+
+def insert_rows(session, table, columns, rows, batch_size=200):
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        session.sql(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+            + ", ".join([f"({', '.join('?' * len(columns))})"] * len(batch)),
+            [value for row in batch for value in row],
+        ).collect()
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import time
+
+
+def iter_sse_events(lines):
+    # Découpe un flux Server-Sent Events en couples (événement, données JSON)
+    event, data_lines = "message", []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r\n")
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
+
+
+class JsonResponseParser:
+    # Réponse complète (mode non streamé) : un seul corps JSON
+
+    def parse(self, lines):
+        body = json.loads("".join(line.decode("utf-8") if isinstance(line, bytes) else line for line in lines))
+        for index, item in enumerate(body["message"]["content"]):
+            yield ("block_done", index, item)
+        yield ("done", None, body)
+
+
+class AnalystStreamParser:
+    # Événements streamés de l'API Cortex Analyst, reconstitués au format du mode non streamé.
+    # Produit des tuples (type, index, valeur) :
+    #   ("status", None, message), ("text_delta", index, texte cumulé),
+    #   ("block_done", index, item), ("done", None, réponse complète)
+
+    def __init__(self):
+        self.content = []
+        self.request_id = None
+        self.warnings = []
+
+    def parse(self, lines):
+        current_index = None
+        for event, data in iter_sse_events(lines):
+            if event == "status":
+                yield ("status", None, data.get("status_message") or data.get("status"))
+            elif event == "message.content.delta":
+                index = data.get("index", 0)
+                if current_index is not None and index != current_index:
+                    yield ("block_done", current_index, self.content[current_index])
+                current_index = index
+                item = self._apply_delta(index, data)
+                if item["type"] == "text":
+                    yield ("text_delta", index, item["text"])
+            elif event == "warnings":
+                self.warnings.extend(data.get("warnings", []))
+            elif event == "response_metadata":
+                self.request_id = data.get("request_id", self.request_id)
+            elif event == "error":
+                raise RuntimeError(f"{data.get('code', '')} {data.get('message', 'Erreur de streaming')}".strip())
+            elif event == "done":
+                break
+        if current_index is not None:
+            yield ("block_done", current_index, self.content[current_index])
+        yield ("done", None, {
+            "message": {"role": "analyst", "content": self.content},
+            "request_id": self.request_id,
+            "warnings": self.warnings,
+        })
+
+    def _apply_delta(self, index, data):
+        while len(self.content) <= index:
+            self.content.append(None)
+        item_type = data["type"]
+        if self.content[index] is None:
+            self.content[index] = {"type": item_type}
+        item = self.content[index]
+        if item_type == "text":
+            item["text"] = item.get("text", "") + data.get("text_delta", "")
+        elif item_type == "sql":
+            item["statement"] = item.get("statement", "") + data.get("statement_delta", "")
+            if "confidence" in data:
+                item["confidence"] = data["confidence"]
+        elif item_type == "suggestions":
+            suggestions = item.setdefault("suggestions", [])
+            delta = data.get("suggestions_delta", {})
+            position = delta.get("index", len(suggestions))
+            while len(suggestions) <= position:
+                suggestions.append("")
+            suggestions[position] += delta.get("suggestion_delta", "")
+        return item
+
+
+RESPONSE_PARSERS = {
+    "json": JsonResponseParser,
+    "sse": AnalystStreamParser,
+}
+
+
+def streaming_enabled():
+    # Réponse streamée : mode de développement uniquement (CORTEX_ANALYST_STREAMING=1), effectif avec
+    # le transport HTTP direct (CORTEX_ANALYST_URL : serveur factice local, ou compte hors Streamlit
+    # in Snowflake avec CORTEX_ANALYST_TOKEN). En production, l'API interne de Streamlit in Snowflake
+    # renvoie le flux complet en une fois : le mode streamé n'y affiche rien plus tôt et reste désactivé.
+    if os.environ.get("CORTEX_ANALYST_STREAMING", "0") != "1":
+        return False
+    if not os.environ.get("CORTEX_ANALYST_URL"):
+        logging.warning("CORTEX_ANALYST_STREAMING=1 ignoré : le streaming nécessite CORTEX_ANALYST_URL (développement)")
+        return False
+    return True
+
+
+def open_analyst_stream(request_body, timeout=30000):
+    # Transport HTTP direct (serveur factice local ou compte avec jeton) si CORTEX_ANALYST_URL est défini,
+    # sinon l'API interne de Streamlit in Snowflake (ou son équivalent local), qui renvoie le flux complet en une fois
+    base_url = os.environ.get("CORTEX_ANALYST_URL")
+    if base_url:
+        import requests
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        token = os.environ.get("CORTEX_ANALYST_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        resp = requests.post(
+            f"{base_url.rstrip('/')}/api/v2/cortex/analyst/message",
+            json=request_body,
+            headers=headers,
+            stream=True,
+            timeout=timeout / 1000,
+        )
+        resp.raise_for_status()
+        return resp.iter_lines(chunk_size=None, decode_unicode=True)
+
+    from common.backend import send_api_request
+    resp = send_api_request(
+        "POST",
+        "/api/v2/cortex/analyst/message",
+        {},
+        {},
+        request_body,
+        {},
+        timeout,
+    )
+    if resp["status"] >= 400:
+        raise RuntimeError(f"Erreur de l'API : {resp['status']} - {resp.get('content', 'Pas de détails')}")
+    return resp["content"].splitlines()
+
+
+class StreamTimer:
+    # Mesure du temps jusqu'au premier fragment de texte (time-to-first-token)
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.first_token_ms = None
+
+    def mark_token(self):
+        if self.first_token_ms is None:
+            self.first_token_ms = int((time.time() - self.start_time) * 1000)
+
+    def elapsed_ms(self):
+        return int((time.time() - self.start_time) * 1000)
@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+from common.profiling import current_profile, wrap_session
+
+# Point d'accès unique à Snowflake (session Snowpark) et à l'API REST interne (Cortex Analyst).
+# CORTEX_BACKEND=local remplace les deux par des équivalents locaux (common/local_backend.py) :
+# l'application, les pages et les benchmarks tournent alors sans compte Snowflake.
+# Usage : CORTEX_BACKEND=local streamlit run Home.py
+# Réponses Analyst streamées (développement uniquement) : CORTEX_ANALYST_STREAMING=1 avec
+# CORTEX_ANALYST_URL (common/fake_analyst_server.py), voir common/analyst_stream.streaming_enabled.
+
+BACKEND_ENV = "CORTEX_BACKEND"
+
+
+class SnowflakeBackend:
+    # Production : Streamlit in Snowflake (session active et _snowflake), importés à la demande
+
+    name = "snowflake"
+
+    def session(self):
+        from snowflake.snowpark.context import get_active_session
+        return get_active_session()
+
+    def send_api_request(self, method, path, headers, params, body, request_guid, timeout):
+        import _snowflake
+        return _snowflake.send_snow_api_request(method, path, headers, params, body, request_guid, timeout)
+
+
+def create_backend(name=None):
+    name = (name or os.environ.get(BACKEND_ENV) or "snowflake").lower()
+    if name == "snowflake":
+        return SnowflakeBackend()
+    if name == "local":
+        from common.local_backend import LocalBackend
+        return LocalBackend.from_env()
+    raise ValueError(f"{BACKEND_ENV} inconnu : {name}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    # Partagé par le processus (comme la session Snowpark), créé au premier appel
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logging.info(f"Backend {_backend.name} initialisé")
+    return _backend
+
+
+def set_backend(backend):
+    # Injection d'un backend déjà configuré (benchmarks, rejeu de charge) ; renvoie le précédent
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
+def get_session():
+    # Session chronométrée quand le rerun est profilé (common/profiling.py)
+    return wrap_session(get_backend().session())
+
+
+def send_api_request(method, path, headers, params, body, request_guid, timeout):
+    # Même signature et même réponse ({"status", "content"}) que _snowflake.send_snow_api_request
+    profile = current_profile()
+    if profile is None:
+        return get_backend().send_api_request(method, path, headers, params, body, request_guid, timeout)
+    with profile.record("analyst", f"{method} {path}") as record:
+        response = get_backend().send_api_request(method, path, headers, params, body, request_guid, timeout)
+        record["status"] = response.get("status")
+    return response
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Réduction du nombre de points envoyés au navigateur pour les séries longues
+
+DEFAULT_MAX_POINTS = 1000
+
+# Granularités temporelles (DATE_TRUNC), de la plus fine à la plus grossière, avec leur durée en jours
+TIME_GRAINS = {"DAY": 1, "WEEK": 7, "MONTH": 30, "QUARTER": 91}
+
+
+def choose_time_grain(span_days, max_points=180):
+    # Granularité la plus fine qui garde la série sous max_points intervalles
+    for grain, days in TIME_GRAINS.items():
+        if span_days / days <= max_points:
+            return grain
+    return list(TIME_GRAINS)[-1]
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets : indices des points conservés, forme de la courbe préservée
+    length = len(y)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else length
+        next_end = max(next_end, next_start + 1)
+        average_x = x[next_start:next_end].mean()
+        average_y = np.nanmean(y[next_start:next_end]) if np.isfinite(y[next_start:next_end]).any() else 0.0
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (average_y - y[previous])
+        )
+        previous = start + (int(np.nanargmax(areas)) if np.isfinite(areas).any() else 0)
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax_indices(values, buckets):
+    # Minimum et maximum de chaque intervalle, pour chaque colonne : aucun pic n'est perdu
+    length = len(values)
+    edges = np.linspace(0, length, buckets + 1).astype(np.int64)
+    selected = {0, length - 1}
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        window = values[start:end]
+        for column in range(window.shape[1]):
+            if np.isfinite(window[:, column]).any():
+                selected.add(start + int(np.nanargmin(window[:, column])))
+                selected.add(start + int(np.nanargmax(window[:, column])))
+    return np.array(sorted(selected))
+
+
+def downsample_frame(df, max_points=DEFAULT_MAX_POINTS):
+    # DataFrame indexé par l'axe des x (numérique ou date), colonnes numériques.
+    # Renvoie le frame d'origine si l'axe n'est pas ordonnable ou si la série est déjà courte.
+    if len(df) <= max_points or df.empty:
+        return df
+    index = df.index
+    if index.dtype == object:
+        # Colonnes DATE rapatriées en objets datetime.date
+        try:
+            index = pd.DatetimeIndex(pd.to_datetime(index))
+        except (ValueError, TypeError):
+            return df
+        df = df.set_axis(index)
+    if pd.api.types.is_datetime64_any_dtype(index):
+        x = index.asi8
+    elif pd.api.types.is_numeric_dtype(index):
+        x = index.to_numpy()
+    else:
+        return df
+    order = np.argsort(x, kind="stable")
+    df, x = df.iloc[order], np.asarray(x)[order]
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    if values.shape[1] == 1:
+        selected = lttb(x, values[:, 0], max_points)
+    else:
+        selected = minmax_indices(values, max(1, max_points // (2 * values.shape[1])))
+    return df.iloc[selected]
@@ -0,0 +1,125 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Serveur local imitant /api/v2/cortex/analyst/message, en mode streamé (SSE) ou non.
+# Usage : python -m common.fake_analyst_server --port 8765
+# puis CORTEX_ANALYST_URL=http://localhost:8765 CORTEX_ANALYST_STREAMING=1 streamlit run Home.py
+# Le mode streamé n'est disponible qu'avec ce transport HTTP direct (développement, voir streaming_enabled).
+
+
+def canned_content(prompt):
+    return [
+        {"type": "text", "text": f"Voici l'interprétation de votre question : {prompt}"},
+        {"type": "sql", "statement": "SELECT 'Athlètes' AS CATEGORIE, 42 AS TOTAL"},
+        {"type": "suggestions", "suggestions": [
+            "Combien de médailles par pays ?",
+            "Quels sont les athlètes les plus titrés ?",
+        ]},
+    ]
+
+
+def split_chunks(text, chunk_size):
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+
+
+def stream_events(content, request_id, chunk_size=8):
+    # Transforme une réponse complète en suite d'événements SSE de l'API Analyst
+    yield "status", {"status": "interpreting_question", "status_message": "Interprétation de la question"}
+    for index, item in enumerate(content):
+        if item["type"] == "text":
+            for chunk in split_chunks(item["text"], chunk_size):
+                yield "message.content.delta", {"index": index, "type": "text", "text_delta": chunk}
+        elif item["type"] == "sql":
+            for chunk in split_chunks(item["statement"], chunk_size * 4):
+                yield "message.content.delta", {"index": index, "type": "sql", "statement_delta": chunk}
+        elif item["type"] == "suggestions":
+            for position, suggestion in enumerate(item["suggestions"]):
+                yield "message.content.delta", {
+                    "index": index,
+                    "type": "suggestions",
+                    "suggestions_delta": {"index": position, "suggestion_delta": suggestion},
+                }
+    yield "response_metadata", {"request_id": request_id}
+    yield "done", {}
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def analyst_payload(content, request_id):
+    # Corps de réponse du mode non streamé
+    return {"message": {"role": "analyst", "content": content}, "request_id": request_id}
+
+
+class FakeAnalystHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 + Transfer-Encoding: chunked, comme l'API réelle, pour que le client lise au fil de l'eau
+    protocol_version = "HTTP/1.1"
+    first_token_delay = 0.5
+    chunk_delay = 0.05
+    responses = {}
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = body["messages"][-1]["content"][0]["text"]
+        content = self.responses.get(prompt) or canned_content(prompt)
+        request_id = uuid.uuid4().hex
+
+        events = list(stream_events(content, request_id))
+        time.sleep(self.first_token_delay)
+        if not body.get("stream"):
+            # Même temps de génération qu'en streaming, mais tout arrive à la fin
+            time.sleep(self.chunk_delay * len(events))
+            payload = json.dumps(analyst_payload(content, request_id)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event, data in events:
+            chunk = format_sse(event, data).encode()
+            self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server(port=0, first_token_delay=0.5, chunk_delay=0.05, responses=None):
+    # Démarre le serveur dans un thread ; renvoie (serveur, url)
+    handler = type("ConfiguredFakeAnalystHandler", (FakeAnalystHandler,), {
+        "first_token_delay": first_token_delay,
+        "chunk_delay": chunk_delay,
+        "responses": responses or {},
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur Cortex Analyst factice")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    args = parser.parse_args()
+    server, url = start_fake_server(args.port, args.first_token_delay, args.chunk_delay)
+    print(f"Serveur Cortex Analyst factice sur {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,226 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+
+
+def fetch_stage_file(session, stage_path):
+    with session.file.get_stream(stage_path) as file_stream:
+        return file_stream.read()
+
+
+def stage_file_version(session, stage_path):
+    # Empreinte (md5, date de modification) d'un fichier de stage d'après LIST ; None si absent
+    rows = session.sql(f"LIST {stage_path}").collect()
+    file_name = stage_path.rsplit("/", 1)[-1]
+    for row in rows:
+        if row["name"].rsplit("/", 1)[-1] == file_name:
+            return f"{row['md5']}|{row['last_modified']}"
+    return None
+
+
+class ImageService:
+    # Logos stockés sur les stages : téléchargements en parallèle et miniatures déjà
+    # redimensionnées, gardées en mémoire et sur disque. Les fichiers sur disque sont nommés
+    # par le hash de leur contenu ; l'index (chemin du stage, taille, version) -> hash est persistant.
+    # La version (LIST) est revérifiée toutes les version_ttl secondes : un logo remplacé sous le
+    # même chemin, y compris par un autre outil que la page d'administration, change de clé.
+
+    def __init__(self, cache_dir=None, max_workers=4, max_memory_items=256, fetch=fetch_stage_file,
+                 version=stage_file_version, version_ttl=60):
+        self.cache_dir = cache_dir or os.environ.get(
+            "CORTEX_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cortex_thumbnails"))
+        self.max_memory_items = max_memory_items
+        self.fetch = fetch
+        self.version = version
+        self.version_ttl = version_ttl
+        self._versions = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-fetch")
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index_path = os.path.join(self.cache_dir, "index.json")
+        self._index = self._load_index()
+        self._removed = set()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _atomic_write(self, path, data):
+        # Fichier temporaire unique dans le même répertoire puis renommage : un lecteur ne voit
+        # jamais un fichier partiel, et deux écrivains (threads ou processus) ne se mélangent pas
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as temporary_file:
+                temporary_file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def _save_index(self):
+        # Fusion avec l'index sur disque : les entrées ajoutées par un autre processus partageant
+        # le répertoire sont conservées, sauf celles invalidées ici
+        merged = self._load_index()
+        for key in self._removed:
+            merged.pop(key, None)
+        merged.update(self._index)
+        self._index = merged
+        self._removed = set()
+        self._atomic_write(self._index_path, json.dumps(self._index).encode())
+
+    @staticmethod
+    def make_key(stage_path, size=None, keep_aspect=True, version=None):
+        if size is None:
+            key = f"{stage_path}|original"
+        else:
+            key = f"{stage_path}|{size[0]}x{size[1]}|{'fit' if keep_aspect else 'exact'}"
+        return f"{key}|{version}" if version else key
+
+    def _stage_version(self, session, stage_path):
+        try:
+            version = self.version(session, stage_path)
+        except Exception as e:
+            logging.warning(f"Version de l'image {stage_path} indisponible : {e}")
+            version = None
+        with self._lock:
+            self._versions[stage_path] = (version, time.time())
+        return version
+
+    def get_versions(self, session, stage_paths):
+        # Chemin -> version ; seules les versions plus anciennes que version_ttl sont relues (en parallèle)
+        versions, pending = {}, {}
+        now = time.time()
+        for stage_path in stage_paths:
+            with self._lock:
+                known = self._versions.get(stage_path)
+            if known is not None and now < known[1] + self.version_ttl:
+                versions[stage_path] = known[0]
+            else:
+                pending[stage_path] = self._executor.submit(self._stage_version, session, stage_path)
+        for stage_path, future in pending.items():
+            versions[stage_path] = future.result()
+        return versions
+
+    @staticmethod
+    def resize(data, size=None, keep_aspect=True):
+        if size is None:
+            return data
+        # PIL n'est chargé qu'au premier redimensionnement (les miniatures en cache n'en ont pas besoin)
+        from PIL import Image
+        image = Image.open(io.BytesIO(data))
+        if keep_aspect:
+            image.thumbnail(size)
+        else:
+            image = image.resize(size)
+        # Modes sans équivalent PNG (CMYK, YCbCr...) : conversion, en gardant la transparence éventuelle
+        if image.mode not in ("1", "L", "LA", "P", "I", "I;16", "RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.mode else "RGB")
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
+
+    def _cached(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            digest = self._index.get(key)
+        if digest is None:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, f"{digest}.png"), "rb") as blob:
+                data = blob.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, data, superseded=None):
+        # superseded : préfixe des clés des autres versions de la même miniature, retirées de l'index
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = os.path.join(self.cache_dir, f"{digest}.png")
+        if not os.path.exists(blob_path):
+            self._atomic_write(blob_path, data)
+        self._remember(key, data)
+        with self._lock:
+            if superseded is not None:
+                for stale_key in list(self._index) + list(self._memory):
+                    if stale_key != key and (stale_key == superseded or stale_key.startswith(superseded + "|")):
+                        self._index.pop(stale_key, None)
+                        self._memory.pop(stale_key, None)
+                        self._removed.add(stale_key)
+            self._index[key] = digest
+            self._save_index()
+
+    def _load(self, session, stage_path, size, keep_aspect, version=None):
+        data = self.resize(self.fetch(session, stage_path), size, keep_aspect)
+        self._store(self.make_key(stage_path, size, keep_aspect, version), data,
+                    superseded=self.make_key(stage_path, size, keep_aspect))
+        return data
+
+    def get_many(self, session, stage_paths, size=None, keep_aspect=True):
+        # Chemin -> octets de l'image (None si le téléchargement a échoué)
+        results, pending = {}, {}
+        stage_paths = list(dict.fromkeys(stage_paths))
+        versions = self.get_versions(session, [stage_path for stage_path in stage_paths if stage_path])
+        for stage_path in stage_paths:
+            if not stage_path:
+                results[stage_path] = None
+                continue
+            version = versions[stage_path]
+            data = self._cached(self.make_key(stage_path, size, keep_aspect, version))
+            if data is not None:
+                results[stage_path] = data
+            else:
+                pending[stage_path] = self._executor.submit(self._load, session, stage_path, size, keep_aspect, version)
+        for stage_path, future in pending.items():
+            try:
+                results[stage_path] = future.result()
+            except Exception as e:
+                logging.error(f"Erreur lors du chargement de l'image {stage_path} : {e}")
+                results[stage_path] = None
+        return results
+
+    def get(self, session, stage_path, size=None, keep_aspect=True):
+        return self.get_many(session, [stage_path], size, keep_aspect)[stage_path]
+
+    def invalidate(self, stage_path=None):
+        # Les blobs restent sur disque (adressés par contenu) ; seules les entrées d'index sont retirées
+        with self._lock:
+            # Entrées ajoutées entre-temps par un autre processus comprises
+            self._index = {**self._load_index(), **self._index}
+            for key in list(self._index) + list(self._memory):
+                if stage_path is None or key.split("|", 1)[0] == stage_path:
+                    self._index.pop(key, None)
+                    self._memory.pop(key, None)
+                    self._removed.add(key)
+            if stage_path is None:
+                self._versions.clear()
+            else:
+                self._versions.pop(stage_path, None)
+            self._save_index()
+
+
+@st.cache_resource
+def get_image_service():
+    return ImageService()
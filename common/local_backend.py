@@ -0,0 +1,822 @@
+import calendar
+import email.utils
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import random
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from common.fake_analyst_server import analyst_payload, canned_content, format_sse, stream_events
+
+# Équivalents locaux de Snowflake et de Cortex Analyst, pour développer, tester et mesurer
+# sans compte : SQLite (bibliothèque standard) pour les tables CORTEX_*, créées à partir du
+# script « Setup Tables de configurations », et une API Analyst factice à latence réglable.
+# Le SQL de l'application est traduit à la volée (dialecte Snowflake -> SQLite) ; seules les
+# constructions effectivement utilisées dans l'application sont prises en charge.
+
+SETUP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Setup Tables de configurations")
+ANALYST_PATH = "/api/v2/cortex/analyst/message"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+# --- Schéma ----------------------------------------------------------------------------------
+
+TABLE_PATTERN = re.compile(r"create\s+or\s+replace\s+TABLE\s+(\w+)\s*\((.*?)\n\);", re.I | re.S)
+
+
+def setup_statements(script):
+    # CREATE TABLE du script Snowflake, adaptés à SQLite (autoincrement, valeurs par défaut)
+    for table, body in TABLE_PATTERN.findall(script):
+        lines = [line.strip().rstrip(",") for line in body.strip().splitlines() if line.strip()]
+        has_autoincrement = any("autoincrement" in line.lower() for line in lines)
+        columns = []
+        for line in lines:
+            if line.lower().startswith("primary key") and has_autoincrement:
+                continue
+            if "autoincrement" in line.lower():
+                line = f"{line.split()[0]} INTEGER PRIMARY KEY AUTOINCREMENT"
+            line = re.sub(r"DEFAULT CURRENT_TIMESTAMP\(\)",
+                          "DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))", line, flags=re.I)
+            columns.append(line)
+        yield f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(columns) + "\n)"
+
+
+# --- Traduction du dialecte ----------------------------------------------------------------
+
+# FILTER(CONTENT, c -> c:type::STRING = 'sql')[0]:statement::STRING
+FILTER_PATTERN = re.compile(
+    r"FILTER\((\w+),\s*(\w+)\s*->\s*\2:type::STRING\s*=\s*'(\w+)'\)\[0\]:(\w+)(?:::\w+)?", re.I)
+# TRY_PARSE_JSON(OUTPUT_JSON):message:content
+JSON_PATH_PATTERN = re.compile(r"TRY_PARSE_JSON\(([^()]*)\)((?::\w+)+)", re.I)
+# TABLE(FLATTEN(INPUT => PARSE_JSON(?))) : éléments d'un tableau JSON passé en paramètre
+FLATTEN_PATTERN = re.compile(r"\bTABLE\(\s*FLATTEN\(\s*INPUT\s*=>\s*PARSE_JSON\(([^()]*)\)\s*\)\s*\)", re.I)
+
+
+def matching_paren(text, start):
+    depth, quote = 0, None
+    for position in range(start, len(text)):
+        char = text[position]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return position
+    raise ValueError(f"Parenthèse non fermée : {text[start:start + 40]}")
+
+
+def paren_depths(text):
+    depths, depth, quote = [], 0, None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        depths.append(depth)
+    return depths
+
+
+def split_top_level(text):
+    parts, start, depths = [], 0, paren_depths(text)
+    for position, char in enumerate(text):
+        if char == "," and depths[position] == 0:
+            parts.append(text[start:position].strip())
+            start = position + 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+def normalize_expression(expression):
+    return re.sub(r"\s+", "", expression).upper()
+
+
+def split_alias(item):
+    match = re.match(r"(.*?)\s+AS\s+(\"?\w+\"?)\s*$", item, re.I | re.S)
+    if match:
+        return match.group(1).strip(), match.group(2)
+    return item, None
+
+
+def replace_grouping_calls(expression, grouped):
+    # GROUPING(expr) -> 0 si expr fait partie de l'ensemble de regroupement courant, 1 sinon
+    result, position = [], 0
+    for match in re.finditer(r"\bGROUPING\s*\(", expression, re.I):
+        if match.start() < position:
+            continue
+        end = matching_paren(expression, match.end() - 1)
+        argument = normalize_expression(expression[match.end():end])
+        result.append(expression[position:match.start()])
+        result.append("0" if argument in grouped else "1")
+        position = end + 1
+    result.append(expression[position:])
+    return "".join(result)
+
+
+def number_placeholders(query):
+    # ? -> ?1, ?2... : les paramètres restent liés une seule fois quand une clause est dupliquée
+    parts, quote, count = [], None, 0
+    for char in query:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "?":
+            count += 1
+            char = f"?{count}"
+        parts.append(char)
+    return "".join(parts)
+
+
+def expand_grouping_sets(query):
+    # GROUP BY GROUPING SETS (...) -> UNION ALL d'un GROUP BY par ensemble
+    match = re.search(r"\bGROUP\s+BY\s+GROUPING\s+SETS\s*\(", query, re.I)
+    if not match:
+        return query
+    query = number_placeholders(query)
+    match = re.search(r"\bGROUP\s+BY\s+GROUPING\s+SETS\s*\(", query, re.I)
+    sets_end = matching_paren(query, match.end() - 1)
+    grouping_sets = []
+    for grouping_set in split_top_level(query[match.end():sets_end]):
+        grouping_set = grouping_set.strip()
+        if grouping_set.startswith("("):
+            grouping_set = grouping_set[1:-1]
+        grouping_sets.append(split_top_level(grouping_set))
+    head, tail = query[:match.start()], query[sets_end + 1:]
+
+    depths = paren_depths(head)
+    level = depths[-1] if depths else 0
+    select = [m for m in re.finditer(r"\bSELECT\b", head, re.I) if depths[m.start()] == level][-1]
+    from_clause = [m for m in re.finditer(r"\bFROM\b", head, re.I)
+                   if m.start() > select.end() and depths[m.start()] == level][0]
+    items = split_top_level(head[select.end():from_clause.start()])
+    all_grouped = {normalize_expression(e) for grouping_set in grouping_sets for e in grouping_set}
+
+    parts = []
+    for grouping_set in grouping_sets:
+        grouped = {normalize_expression(e) for e in grouping_set}
+        projected = []
+        for item in items:
+            expression, alias = split_alias(item)
+            if normalize_expression(expression) in all_grouped - grouped:
+                projected.append(f"NULL AS {alias or expression.split('.')[-1]}")
+            else:
+                projected.append(replace_grouping_calls(item, grouped))
+        group_by = f" GROUP BY {', '.join(grouping_set)}" if grouping_set else ""
+        parts.append(f"SELECT {', '.join(projected)} {head[from_clause.start():].strip()}{group_by}")
+    return head[:select.start()] + " UNION ALL ".join(parts) + tail
+
+
+def translate(query):
+    query = re.sub(r"\bCORTEX_DB\.PUBLIC\.", "", query, flags=re.I)
+    query = re.sub(r"\bSYSTEM\$(\w+)", r"SYSTEM_\1", query)
+    # Empreinte de version (registre des applications) : change à chaque écriture sur la connexion
+    query = re.sub(r"\bHASH_AGG\(\*\)", "(COUNT(*) || ':' || total_changes())", query, flags=re.I)
+    query = FILTER_PATTERN.sub(r"SF_CONTENT_FIELD(\1, '\3', '\4')", query)
+    query = JSON_PATH_PATTERN.sub(
+        lambda m: f"SF_JSON_PATH({m.group(1)}, '{m.group(2)[1:].replace(':', '.')}')", query)
+    query = FLATTEN_PATTERN.sub(r"json_each(\1)", query)
+    query = re.sub(r"::\w+(\([\d\s,]*\))?", "", query)
+    query = re.sub(r"\bDATEADD\(\s*(\w+)\s*,", r"DATEADD('\1',", query, flags=re.I)
+    query = re.sub(r"\b(CURRENT_USER|CURRENT_TIMESTAMP|CURRENT_DATE)\(\)", r"SF_\1()", query, flags=re.I)
+    query = re.sub(r"\bILIKE\b", "LIKE", query, flags=re.I)
+    return expand_grouping_sets(query)
+
+
+RESULT_SCAN_PATTERN = re.compile(r"\bTABLE\(\s*RESULT_SCAN\(\s*'([^']+)'\s*\)\s*\)", re.I)
+
+
+def result_table(query_id):
+    return "RESULT_SCAN_" + re.sub(r"\W", "_", query_id)
+
+
+# EXECUTE IMMEDIATE $$ BEGIN … END; $$ : bloc Snowflake Scripting
+SCRIPT_PATTERN = re.compile(r"^\s*EXECUTE\s+IMMEDIATE\s+\$\$(.*)\$\$\s*;?\s*$", re.I | re.S)
+
+
+def script_statements(body):
+    # Instructions d'un bloc BEGIN … END. La transaction explicite et le gestionnaire d'exception
+    # sont remplacés par une transaction SQLite englobant tout le bloc (execute_script).
+    body = re.sub(r"^\s*BEGIN\b", "", body, flags=re.I)
+    body = re.sub(r"\bEXCEPTION\b.*$|\bEND\s*;?\s*$", "", body, flags=re.I | re.S)
+    statements, current, quote = [], [], None
+    for char in body:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == ";":
+            statements.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    statements.append("".join(current).strip())
+    return [statement for statement in statements
+            if statement and not re.fullmatch(r"(BEGIN\s+TRANSACTION|COMMIT|ROLLBACK)", statement, re.I)]
+
+
+# LIST @BASE.SCHEMA.STAGE/chemin : fichiers du répertoire local des stages
+LIST_PATTERN = re.compile(r"^\s*(?:LIST|LS)\s+'?(@[^\s']+)'?\s*;?\s*$", re.I)
+LIST_COLUMNS = ("name", "size", "md5", "last_modified")
+
+
+# --- Fonctions Snowflake -------------------------------------------------------------------
+
+def parse_timestamp(value):
+    # (datetime, date seule ?) ; les dates sont stockées en texte ISO
+    if value is None:
+        return None, False
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value), False
+    value = str(value)
+    return datetime.fromisoformat(value), len(value) == 10
+
+
+def format_timestamp(value, date_only=False):
+    return value.strftime("%Y-%m-%d") if date_only else value.strftime(TIMESTAMP_FORMAT)
+
+
+def date_trunc(unit, value):
+    timestamp, date_only = parse_timestamp(value)
+    if timestamp is None:
+        return None
+    unit = unit.upper()
+    if unit == "HOUR":
+        timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    elif unit in ("DAY", "WEEK", "MONTH", "QUARTER", "YEAR"):
+        timestamp = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        if unit == "WEEK":
+            timestamp -= timedelta(days=timestamp.weekday())
+        elif unit == "MONTH":
+            timestamp = timestamp.replace(day=1)
+        elif unit == "QUARTER":
+            timestamp = timestamp.replace(month=3 * ((timestamp.month - 1) // 3) + 1, day=1)
+        elif unit == "YEAR":
+            timestamp = timestamp.replace(month=1, day=1)
+    else:
+        raise ValueError(f"DATE_TRUNC : unité non prise en charge {unit}")
+    return format_timestamp(timestamp, date_only)
+
+
+def date_add(unit, amount, value):
+    timestamp, date_only = parse_timestamp(value)
+    if timestamp is None:
+        return None
+    unit, amount = unit.upper(), int(amount)
+    if unit in ("MONTH", "YEAR"):
+        months = timestamp.month - 1 + amount * (12 if unit == "YEAR" else 1)
+        year, month = timestamp.year + months // 12, months % 12 + 1
+        timestamp = timestamp.replace(year=year, month=month,
+                                      day=min(timestamp.day, calendar.monthrange(year, month)[1]))
+    else:
+        timestamp += timedelta(**{f"{unit.lower()}s": amount})
+    return format_timestamp(timestamp, date_only)
+
+
+def to_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def try_parse_json(value):
+    try:
+        json.loads(value)
+        return value
+    except (TypeError, ValueError):
+        return None
+
+
+def json_path(value, path):
+    try:
+        data = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    for key in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return None if data is None else json.dumps(data)
+
+
+def content_field(content, kind, field):
+    # Premier élément de type kind d'un tableau de contenu Analyst, champ field
+    try:
+        items = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get("type") == kind:
+            value = item.get(field)
+            return json.dumps(value) if isinstance(value, (list, dict)) else value
+    return None
+
+
+def array_to_string(value, separator):
+    try:
+        values = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    return separator.join(str(v) for v in values) if isinstance(values, list) else None
+
+
+def width_bucket(value, low, high, buckets):
+    if value is None:
+        return None
+    if value < low:
+        return 0
+    if value >= high:
+        return buckets + 1
+    return int((value - low) * buckets / (high - low)) + 1
+
+
+def exact_percentile(values, quantile):
+    # Interpolation linéaire (équivalent numpy.percentile) : les percentiles locaux sont exacts
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * quantile
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def percentile_estimate(sketch, quantile):
+    values = json.loads(sketch) if sketch else []
+    return exact_percentile(values, quantile)
+
+
+def least(*values):
+    return None if any(v is None for v in values) else min(values)
+
+
+def greatest(*values):
+    return None if any(v is None for v in values) else max(values)
+
+
+class CountIf:
+    def __init__(self):
+        self.count = 0
+
+    def step(self, condition):
+        if condition:
+            self.count += 1
+
+    def finalize(self):
+        return self.count
+
+
+class AnyValue:
+    def __init__(self):
+        self.value = None
+
+    def step(self, value):
+        if self.value is None:
+            self.value = value
+
+    def finalize(self):
+        return self.value
+
+
+class ApproxPercentile:
+    def __init__(self):
+        self.values, self.quantile = [], 0.5
+
+    def step(self, value, quantile):
+        self.quantile = quantile
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return exact_percentile(self.values, self.quantile)
+
+
+class PercentileAccumulate:
+    # Le « sketch » local est la liste triée des valeurs, sérialisée en JSON
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return json.dumps(sorted(self.values))
+
+
+class PercentileCombine(PercentileAccumulate):
+    def step(self, sketch):
+        if sketch:
+            self.values.extend(json.loads(sketch))
+
+
+# --- Conversions Python <-> SQLite ----------------------------------------------------------
+
+sqlite3.register_adapter(datetime, format_timestamp)
+sqlite3.register_adapter(pd.Timestamp, lambda value: format_timestamp(value.to_pydatetime()))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+for numpy_type, python_type in ((np.int64, int), (np.int32, int), (np.float64, float), (np.bool_, bool)):
+    sqlite3.register_adapter(numpy_type, python_type)
+sqlite3.register_converter("BOOLEAN", lambda value: value not in (b"0", b""))
+
+
+# --- Résultats -----------------------------------------------------------------------------
+
+TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2}(\.\d+)?)?")
+
+
+def convert_value(value):
+    # Les dates reviennent de SQLite en texte : rendues en date/datetime comme avec Snowpark
+    if isinstance(value, str) and len(value) <= 26 and TIMESTAMP_PATTERN.fullmatch(value):
+        timestamp = datetime.fromisoformat(value)
+        return timestamp.date() if len(value) == 10 else timestamp
+    return value
+
+
+class LocalRow(tuple):
+    # Équivalent de snowflake.snowpark.Row : accès par position, par nom ou par attribut
+
+    def __new__(cls, values, fields):
+        row = super().__new__(cls, values)
+        row._fields = fields
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return super().__getitem__(self._fields.index(key))
+        return super().__getitem__(key)
+
+    def __reduce__(self):
+        return LocalRow, (tuple(self), self._fields)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except ValueError:
+            raise AttributeError(name)
+
+    def as_dict(self):
+        return dict(zip(self._fields, self))
+
+
+class LocalAsyncJob:
+    # Équivalent de AsyncJob : requête exécutée par le pool de l'entrepôt local
+
+    BATCH_ROWS = 500
+
+    def __init__(self, query_id, future, dataframe):
+        self.query_id = query_id
+        self._future = future
+        self._dataframe = dataframe
+
+    def is_done(self):
+        return self._future.done()
+
+    def cancel(self):
+        self._future.cancel()
+
+    def result(self, result_type="row"):
+        columns, rows = self._future.result()
+        if result_type == "row":
+            return rows
+        if result_type == "pandas_batches":
+            # Lots successifs comme les morceaux de résultat Snowflake, construits à la demande
+            return (pd.DataFrame(rows[start:start + self.BATCH_ROWS], columns=columns)
+                    for start in range(0, max(len(rows), 1), self.BATCH_ROWS))
+        return pd.DataFrame(rows, columns=columns)
+
+
+class LocalDataFrame:
+    # Sous-ensemble de snowflake.snowpark.DataFrame utilisé par l'application
+
+    def __init__(self, backend, query, params=None):
+        self.backend = backend
+        self.query = query
+        self.params = tuple(params or ())
+
+    def collect(self):
+        return self.backend.execute(self.query, self.params)[1]
+
+    def to_pandas(self):
+        columns, rows = self.backend.execute(self.query, self.params)
+        return pd.DataFrame(rows, columns=columns)
+
+    def limit(self, n, offset=0):
+        return LocalDataFrame(self.backend, f"SELECT * FROM ({self.query}) LIMIT {int(n)} OFFSET {int(offset)}", self.params)
+
+    def collect_nowait(self):
+        return self.backend.submit(self)
+
+    def to_pandas_batches(self, block=True):
+        if block:
+            return iter([self.to_pandas()])
+        return self.backend.submit(self)
+
+
+class LocalFileAccess:
+    # session.file : fichiers des stages lus depuis un répertoire local (@BASE.SCHEMA.STAGE/chemin)
+
+    def __init__(self, stage_dir):
+        self.stage_dir = stage_dir
+
+    def get_stream(self, stage_path):
+        relative_path = stage_path.split("/", 1)[1] if "/" in stage_path else stage_path
+        if self.stage_dir:
+            path = os.path.join(self.stage_dir, relative_path)
+            if os.path.exists(path):
+                with open(path, "rb") as stage_file:
+                    return io.BytesIO(stage_file.read())
+        logging.debug(f"Fichier de stage absent en local, image de remplacement : {stage_path}")
+        return io.BytesIO(placeholder_png())
+
+
+def placeholder_png(width=64, height=64, color=(30, 144, 255)):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + bytes(color) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+class LocalSession:
+    # Équivalent de la session Snowpark active
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.file = LocalFileAccess(backend.stage_dir)
+
+    def sql(self, query, params=None):
+        return LocalDataFrame(self.backend, query, params)
+
+    def table(self, name):
+        return LocalDataFrame(self.backend, f"SELECT * FROM {name}")
+
+    def create_async_job(self, query_id):
+        job = self.backend.jobs.get(query_id)
+        if job is None:
+            raise LookupError(f"Requête {query_id} inconnue")
+        return job
+
+
+# --- Données de démonstration --------------------------------------------------------------
+
+DEMO_DATA = {
+    "CORTEX_APPS": (
+        ("APP_ID", "APP_NAME", "APP_LOGO_URL", "APP_URL", "APP_ACTIVE", "APP_ACCESS_ROLE",
+         "APP_DATABASE", "APP_SCHEMA", "APP_STAGE"),
+        [
+            ("1", "Démo locale", "@CORTEX_DB.PUBLIC.RAW_DATA/logos/demo.png", "analyst_demo", True, "PUBLIC", "CORTEX_DB", "PUBLIC", "RAW_DATA"),
+            ("4", "Monitoring", "@CORTEX_DB.PUBLIC.RAW_DATA/logos/monitoring.png", "monitoring", True, "PUBLIC", "CORTEX_DB", "PUBLIC", "RAW_DATA"),
+            ("5", "Administration", "@CORTEX_DB.PUBLIC.RAW_DATA/logos/admin.png", "admin", True, "PUBLIC", "CORTEX_DB", "PUBLIC", "RAW_DATA"),
+        ],
+    ),
+    "CORTEX_MODELS": (
+        ("APP_ID", "CORTEX_YAML_FILE", "CORTEX_YAML_NAME", "CORTEX_YAML_ACTIVE"),
+        [("1", "demo.yaml", "Démo", True)],
+    ),
+    "CORTEX_BOOKMARKS": (
+        ("APP_ID", "BK_USERNAME", "BK_QUESTION", "BK_LANG"),
+        [
+            (1, "ALL", "Combien de médailles par pays ?", "fr"),
+            (1, "ALL", "Quels sont les athlètes les plus titrés ?", "fr"),
+        ],
+    ),
+}
+
+
+class LocalBackend:
+    # Base SQLite partagée (une connexion protégée par un verrou), pool de requêtes asynchrones
+    # imitant l'entrepôt, API Analyst factice
+
+    name = "local"
+
+    def __init__(self, database=":memory:", stage_dir=None, user="LOCAL_USER", seed=True,
+                 analyst_latency=0.5, chunk_delay=0.0, analyst_error_rate=0.0, query_latency=0.0,
+                 warehouse_concurrency=8, responses=None):
+        self.stage_dir = stage_dir
+        self.user = user
+        self.analyst_latency = analyst_latency
+        self.chunk_delay = chunk_delay
+        self.analyst_error_rate = analyst_error_rate
+        self.query_latency = query_latency
+        self.responses = responses or {}
+        self.jobs = OrderedDict()
+        self.stats = {"queries": 0, "rows": 0, "bytes": 0, "analyst_calls": 0}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=warehouse_concurrency, thread_name_prefix="local-warehouse")
+        self.connection = sqlite3.connect(database, check_same_thread=False, isolation_level=None,
+                                          detect_types=sqlite3.PARSE_DECLTYPES)
+        self._register_functions()
+        self.create_tables()
+        if seed:
+            self.seed_demo_data()
+        self._session = LocalSession(self)
+
+    @classmethod
+    def from_env(cls):
+        responses = None
+        responses_path = os.environ.get("CORTEX_LOCAL_RESPONSES")
+        if responses_path:
+            with open(responses_path) as responses_file:
+                responses = json.load(responses_file)
+        return cls(
+            database=os.environ.get("CORTEX_LOCAL_DB", ":memory:"),
+            stage_dir=os.environ.get("CORTEX_LOCAL_STAGE_DIR"),
+            user=os.environ.get("CORTEX_LOCAL_USER", "LOCAL_USER"),
+            seed=os.environ.get("CORTEX_LOCAL_SEED", "1") == "1",
+            analyst_latency=float(os.environ.get("CORTEX_LOCAL_ANALYST_LATENCY", 0.5)),
+            chunk_delay=float(os.environ.get("CORTEX_LOCAL_CHUNK_DELAY", 0.0)),
+            analyst_error_rate=float(os.environ.get("CORTEX_LOCAL_ANALYST_ERROR_RATE", 0.0)),
+            query_latency=float(os.environ.get("CORTEX_LOCAL_QUERY_LATENCY", 0.0)),
+            responses=responses,
+        )
+
+    def _register_functions(self):
+        connection = self.connection
+        connection.create_function("SF_CURRENT_USER", 0, lambda: self.user)
+        connection.create_function("SF_CURRENT_TIMESTAMP", 0, lambda: format_timestamp(datetime.now()))
+        connection.create_function("SF_CURRENT_DATE", 0, lambda: date.today().isoformat())
+        connection.create_function("DATEADD", 3, date_add)
+        connection.create_function("DATE_TRUNC", 2, date_trunc)
+        connection.create_function("TO_DATE", 1, lambda v: date_trunc("DAY", v)[:10] if v is not None else None)
+        connection.create_function("HOUR", 1, lambda v: parse_timestamp(v)[0].hour if v is not None else None)
+        connection.create_function("TRY_TO_NUMBER", 1, to_number)
+        connection.create_function("TRY_PARSE_JSON", 1, try_parse_json)
+        connection.create_function("SF_JSON_PATH", 2, json_path)
+        connection.create_function("SF_CONTENT_FIELD", 3, content_field)
+        connection.create_function("ARRAY_TO_STRING", 2, array_to_string)
+        connection.create_function("WIDTH_BUCKET", 4, width_bucket)
+        connection.create_function("LEAST", -1, least)
+        connection.create_function("GREATEST", -1, greatest)
+        connection.create_function("APPROX_PERCENTILE_ESTIMATE", 2, percentile_estimate)
+        connection.create_function("SYSTEM_CANCEL_QUERY", 1, self.cancel_query)
+        connection.create_aggregate("COUNT_IF", 1, CountIf)
+        connection.create_aggregate("ANY_VALUE", 1, AnyValue)
+        connection.create_aggregate("APPROX_PERCENTILE", 2, ApproxPercentile)
+        connection.create_aggregate("APPROX_PERCENTILE_ACCUMULATE", 1, PercentileAccumulate)
+        connection.create_aggregate("APPROX_PERCENTILE_COMBINE", 1, PercentileCombine)
+
+    def create_tables(self, script_path=SETUP_SCRIPT):
+        with open(script_path, encoding="utf-8") as script_file:
+            statements = list(setup_statements(script_file.read()))
+        with self._lock:
+            for statement in statements:
+                self.connection.execute(statement)
+
+    def seed_demo_data(self):
+        with self._lock:
+            if self.connection.execute("SELECT COUNT(*) FROM CORTEX_APPS").fetchone()[0]:
+                return
+            for table, (columns, rows) in DEMO_DATA.items():
+                self.connection.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+    def session(self):
+        return self._session
+
+    # --- Exécution SQL ---
+
+    def execute(self, query, params=()):
+        match = LIST_PATTERN.match(query)
+        if match:
+            return self.list_stage(match.group(1))
+        match = SCRIPT_PATTERN.match(query)
+        if match:
+            return self.execute_script(match.group(1))
+        translated = translate(RESULT_SCAN_PATTERN.sub(self.materialize_result, query))
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        with self._lock:
+            try:
+                cursor = self.connection.execute(translated, tuple(params))
+            except sqlite3.Error as e:
+                raise RuntimeError(f"{e} dans la requête traduite :\n{translated}") from e
+            description = cursor.description or []
+            raw_rows = cursor.fetchall()
+        quoted = set(re.findall(r'AS\s+"(\w+)"', query, re.I))
+        columns = tuple(name if name in quoted else name.upper() for name, *_ in description)
+        rows = [LocalRow([convert_value(value) for value in row], columns) for row in raw_rows]
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["rows"] += len(rows)
+            self.stats["bytes"] += sum(len(value) if isinstance(value, (str, bytes)) else 8
+                                       for row in raw_rows for value in row)
+        return columns, rows
+
+    def materialize_result(self, match):
+        # TABLE(RESULT_SCAN('<query id>')) : résultat d'une requête asynchrone recopié une fois
+        # dans une table temporaire, sans réexécuter la requête
+        query_id = match.group(1)
+        table = result_table(query_id)
+        job = self.jobs.get(query_id)
+        if job is None:
+            raise LookupError(f"Requête {query_id} inconnue")
+        columns, rows = job._future.result()
+        with self._lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM sqlite_temp_master WHERE name = ?", (table,)).fetchone()
+            if not exists:
+                self.connection.execute(f"CREATE TEMP TABLE {table} ({', '.join(columns)})")
+                self.connection.executemany(
+                    f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})", [tuple(row) for row in rows])
+        return table
+
+    def execute_script(self, body):
+        # Bloc exécuté d'un seul tenant : le verrou de la connexion tient les autres sessions à
+        # l'écart de la transaction, annulée entièrement en cas d'erreur
+        with self._lock:
+            self.connection.execute("BEGIN")
+            try:
+                for statement in script_statements(body):
+                    self.execute(statement)
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        return ("anonymous block",), [LocalRow([None], ("anonymous block",))]
+
+    def list_stage(self, stage_path):
+        # Mêmes colonnes que LIST sur Snowflake, pour les fichiers dont le chemin commence par le préfixe
+        stage, _, prefix = stage_path.partition("/")
+        rows = []
+        if self.stage_dir:
+            for directory, _, files in os.walk(self.stage_dir):
+                for file_name in files:
+                    path = os.path.join(directory, file_name)
+                    relative_path = os.path.relpath(path, self.stage_dir).replace(os.sep, "/")
+                    if not relative_path.startswith(prefix):
+                        continue
+                    with open(path, "rb") as stage_file:
+                        digest = hashlib.md5(stage_file.read()).hexdigest()
+                    rows.append(LocalRow([
+                        f"{stage.split('.')[-1].lower()}/{relative_path}", os.path.getsize(path), digest,
+                        email.utils.formatdate(os.path.getmtime(path), usegmt=True),
+                    ], LIST_COLUMNS))
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["rows"] += len(rows)
+        return LIST_COLUMNS, sorted(rows)
+
+    def submit(self, dataframe):
+        query_id = f"local-{uuid.uuid4()}"
+        future = self._executor.submit(self.execute, dataframe.query, dataframe.params)
+        job = LocalAsyncJob(query_id, future, dataframe)
+        with self._lock:
+            self.jobs[query_id] = job
+            while len(self.jobs) > 1000:
+                evicted_id, _ = self.jobs.popitem(last=False)
+                self.connection.execute(f"DROP TABLE IF EXISTS temp.{result_table(evicted_id)}")
+        return job
+
+    def cancel_query(self, query_id):
+        job = self.jobs.get(query_id)
+        if job is not None:
+            job.cancel()
+        return f"query [{query_id}] terminated."
+
+    # --- API Cortex Analyst ---
+
+    def send_api_request(self, method, path, headers, params, body, request_guid, timeout):
+        # Même forme de réponse que _snowflake.send_snow_api_request : corps complet en une fois
+        if method != "POST" or path != ANALYST_PATH:
+            return {"status": 404, "content": f"Point d'accès non simulé : {method} {path}"}
+        with self._lock:
+            self.stats["analyst_calls"] += 1
+        prompt = body["messages"][-1]["content"][0]["text"]
+        content = self.responses.get(prompt) or canned_content(prompt)
+        request_id = uuid.uuid4().hex
+        events = list(stream_events(content, request_id))
+        time.sleep(self.analyst_latency + self.chunk_delay * len(events))
+        if self.analyst_error_rate and random.random() < self.analyst_error_rate:
+            return {"status": 503, "content": "Service Cortex Analyst indisponible (erreur simulée)"}
+        if body.get("stream"):
+            return {"status": 200, "content": "".join(format_sse(event, data) for event, data in events)}
+        return {"status": 200, "content": json.dumps(analyst_payload(content, request_id))}
@@ -0,0 +1,162 @@
+import bisect
+import html
+import re
+import threading
+import time
+import logging
+from collections import defaultdict
+from datetime import timedelta
+import pandas as pd
+from common.response_cache import normalize_prompt
+
+WORD_PATTERN = re.compile(r"\w+")
+# Colonnes identifiant une ligne de log antérieure à REQUEST_ID (REQUEST_ID NULL)
+LEGACY_KEY_COLUMNS = ['DATETIME', 'USERNAME', 'APP_ID', 'INPUT_TEXT']
+
+
+def row_keys(frame):
+    # Clé de chaque ligne : REQUEST_ID, unique par requête journalisée. Plusieurs lignes d'un même
+    # lot du sink partagent DATETIME (heure d'écriture) et USERNAME (propriétaire du service) :
+    # le contenu ne sert de clé qu'aux lignes antérieures à REQUEST_ID.
+    legacy = pd.Series(list(frame[LEGACY_KEY_COLUMNS].itertuples(index=False, name=None)),
+                       index=frame.index, dtype=object)
+    if 'REQUEST_ID' not in frame:
+        return legacy
+    request_ids = frame['REQUEST_ID']
+    return request_ids.where(request_ids.notna() & (request_ids != ''), legacy).astype(object)
+
+
+def tokenize(text):
+    # Mots normalisés (casse et accents) : la recherche « region » trouve « Région »
+    if not isinstance(text, str):
+        return []
+    return WORD_PATTERN.findall(normalize_prompt(text))
+
+
+def highlight(text, terms):
+    # Texte HTML échappé, les mots commençant par un terme recherché entourés de <mark>
+    if not isinstance(text, str):
+        return ""
+    parts, last = [], 0
+    for match in WORD_PATTERN.finditer(text):
+        word = normalize_prompt(match.group())
+        if any(word.startswith(term) for term in terms):
+            parts.append(html.escape(text[last:match.start()]))
+            parts.append(f"<mark>{html.escape(match.group())}</mark>")
+            last = match.end()
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
+
+
+def snippet(text, terms, width=160):
+    # Extrait centré sur la première occurrence, pour les textes longs (SQL généré)
+    if not isinstance(text, str):
+        return ""
+    start = 0
+    for match in WORD_PATTERN.finditer(text):
+        if any(normalize_prompt(match.group()).startswith(term) for term in terms):
+            start = max(0, match.start() - width // 4)
+            break
+    excerpt = text[start:start + width]
+    return ("…" if start else "") + highlight(excerpt, terms) + ("…" if start + width < len(text) else "")
+
+
+class LogSearchIndex:
+    # Index inversé en mémoire sur la question et le SQL généré des logs. L'index ne conserve que
+    # les clés des lignes (row_keys) : la table, les KPI et les graphiques sont lus côté serveur
+    # pour les clés renvoyées par search. Alimenté par filigrane (DATETIME) : chaque rafraîchissement
+    # ne récupère que les lignes nouvelles, avec un recouvrement de quelques minutes pour les
+    # lignes écrites en différé (file de logs).
+
+    def __init__(self, text_columns=("INPUT_TEXT", "output_sql"), overlap_minutes=5,
+                 retention_days=90, refresh_interval=60):
+        self.text_columns = list(text_columns)
+        self.overlap = timedelta(minutes=overlap_minutes)
+        self.retention_days = retention_days
+        self.refresh_interval = refresh_interval
+        self.postings = defaultdict(set)
+        self.vocabulary = []
+        self.documents = {}
+        self.watermark = None
+        self.last_refresh = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, fetch_since, force=False):
+        # fetch_since(since, retention_days) : lignes écrites depuis since (toute la rétention si None)
+        with self._lock:
+            if self.last_refresh and not force and time.time() < self.last_refresh + self.refresh_interval:
+                return 0
+            since = self.watermark - self.overlap if self.watermark is not None else None
+            rows = fetch_since(since, self.retention_days)
+            self.last_refresh = time.time()
+        added = self.update(rows)
+        self.prune(pd.Timestamp.now() - pd.Timedelta(days=self.retention_days))
+        logging.info(f"Index des logs : {added} ligne(s) indexée(s) depuis {since}, {len(self.documents)} au total")
+        return added
+
+    def update(self, frame):
+        with self._lock:
+            if frame is None or frame.empty:
+                return 0
+            rows = frame
+            if self.watermark is not None:
+                rows = frame[frame['DATETIME'] >= self.watermark - self.overlap]
+            added = 0
+            new_terms = set()
+            columns = ['APP_NAME', 'USERNAME', 'DATETIME'] + self.text_columns
+            for key, values in zip(row_keys(rows), rows[columns].itertuples(index=False, name=None)):
+                if key in self.documents:
+                    continue
+                self.documents[key] = values[:3]
+                for text in values[3:]:
+                    for term in tokenize(text):
+                        if term not in self.postings:
+                            new_terms.add(term)
+                        self.postings[term].add(key)
+                added += 1
+            if new_terms:
+                self.vocabulary = sorted(set(self.vocabulary) | new_terms)
+            watermark = frame['DATETIME'].max()
+            self.watermark = watermark if self.watermark is None else max(self.watermark, watermark)
+            return added
+
+    def prune(self, cutoff):
+        # Retire les lignes sorties de la fenêtre de rétention
+        with self._lock:
+            expired = {key for key, document in self.documents.items() if document[2] < cutoff}
+            if not expired:
+                return 0
+            for key in expired:
+                del self.documents[key]
+            for term in list(self.postings):
+                self.postings[term] -= expired
+                if not self.postings[term]:
+                    del self.postings[term]
+            self.vocabulary = sorted(self.postings)
+            return len(expired)
+
+    def _prefix_matches(self, term):
+        position = bisect.bisect_left(self.vocabulary, term)
+        matches = set()
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            matches |= self.postings[self.vocabulary[position]]
+            position += 1
+        return matches
+
+    def search(self, query, app_name=None, username=None):
+        # Tous les mots doivent être présents (préfixe accepté, pour la saisie en cours)
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            keys = None
+            for term in sorted(terms, key=len, reverse=True):
+                matches = self._prefix_matches(term)
+                keys = matches if keys is None else keys & matches
+                if not keys:
+                    return []
+            return [
+                key for key in keys
+                if (app_name is None or self.documents[key][0] == app_name)
+                and (username is None or self.documents[key][1] == username)
+            ]
@@ -0,0 +1,161 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class PendingWrite:
+    # Ligne en attente d'insertion ; future est résolu une fois la ligne écrite (ou abandonnée)
+
+    def __init__(self, session, table, columns, placeholders, values):
+        self.session = session
+        self.table = table
+        self.columns = columns
+        self.placeholders = placeholders
+        self.values = values
+        self.attempts = 0
+        self.future = Future()
+
+
+class BufferedLogSink:
+    # Écritures de télémétrie (logs, votes, favoris) mises en file et insérées par lots
+    # depuis un thread de fond, pour que l'interface n'attende jamais Snowflake.
+    # Un lot en échec est retenté aux vidages suivants (max_retries fois) ; les lignes
+    # abandonnées sont gardées dans dead_letters et leur future porte l'erreur.
+
+    def __init__(self, max_batch_size=100, flush_interval=2.0, max_queue_size=5000, max_retries=3,
+                 max_dead_letters=1000):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._retries = []
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self.dead_letters = deque(maxlen=max_dead_letters)
+        self.written = 0
+        self.retried = 0
+        self.failed = 0
+        self.overflowed = 0
+        self._worker = threading.Thread(target=self._run, name="cortex-log-sink", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, session, table, columns, values, placeholders=None, urgent=False):
+        # placeholders permet de garder des expressions SQL comme CURRENT_USER() dans la ligne
+        # Renvoie un Future résolu quand la ligne est écrite, en erreur si elle est abandonnée
+        placeholders = tuple(placeholders or ("?",) * len(columns))
+        record = PendingWrite(session, table, tuple(columns), placeholders, tuple(values))
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # File pleine : on écrit directement plutôt que de perdre l'enregistrement
+            self.overflowed += 1
+            logging.warning(f"File de logs pleine, écriture synchrone dans {table}")
+            with self._flush_lock:
+                self._write_batch([record])
+            return record.future
+        if urgent or self._queue.qsize() >= self.max_batch_size:
+            self._wakeup.set()
+        return record.future
+
+    def flush(self):
+        with self._flush_lock:
+            # Lignes en échec au vidage précédent d'abord, une par INSERT pour isoler une ligne
+            # invalide du reste de son lot : une nouvelle tentative par vidage
+            retries, self._retries = self._retries, []
+            if retries:
+                self._write_batch(retries, isolate=True)
+            while True:
+                batch = self._drain()
+                if not batch:
+                    return
+                self._write_batch(batch)
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._worker.join(timeout=10)
+        # Dernières tentatives sans attendre l'intervalle : chaque ligne finit écrite ou abandonnée
+        for _ in range(self.max_retries + 1):
+            self.flush()
+            if not self._retries:
+                break
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "retrying": len(self._retries),
+            "written": self.written,
+            "retried": self.retried,
+            "failed": self.failed,
+            "overflowed": self.overflowed,
+        }
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Erreur lors du vidage de la file de logs : {str(e)}")
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch, isolate=False):
+        # Regroupement par session et par forme d'INSERT, puis un INSERT multi-lignes par groupe
+        groups = {}
+        for record in batch:
+            key = (id(record.session), record.table, record.columns, record.placeholders, id(record) if isolate else None)
+            groups.setdefault(key, []).append(record)
+
+        for (_, table, columns, placeholders, _), records in groups.items():
+            row_template = "(" + ", ".join(placeholders) + ")"
+            query = f"""
+                INSERT INTO {table}
+                ({", ".join(columns)})
+                VALUES {", ".join([row_template] * len(records))}
+            """
+            params = [value for record in records for value in record.values]
+            start_time = time.time()
+            try:
+                records[0].session.sql(query, params).collect()
+            except Exception as e:
+                self._handle_failure(table, records, e)
+                continue
+            self.written += len(records)
+            for record in records:
+                record.future.set_result(True)
+            logging.info(f"{len(records)} ligne(s) insérée(s) dans {table} en {int((time.time() - start_time) * 1000)} ms")
+
+    def _handle_failure(self, table, records, error):
+        # Lot en échec (réseau, colonne manquante…) : retenté au vidage suivant, puis abandonné
+        retry, abandoned = [], []
+        for record in records:
+            record.attempts += 1
+            (retry if record.attempts <= self.max_retries else abandoned).append(record)
+        if retry:
+            self.retried += len(retry)
+            self._retries.extend(retry)
+            logging.warning(f"Échec de l'insertion de {len(retry)} ligne(s) dans {table}, nouvelle tentative au prochain vidage : {error}")
+        if abandoned:
+            self.failed += len(abandoned)
+            self.dead_letters.extend(abandoned)
+            for record in abandoned:
+                record.future.set_exception(error)
+            logging.error(f"Insertion abandonnée après {self.max_retries} nouvelle(s) tentative(s) : "
+                          f"{len(abandoned)} ligne(s) de {table} conservée(s) dans dead_letters : {error}")
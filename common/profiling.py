@@ -0,0 +1,409 @@
+import contextlib
+import contextvars
+import cProfile
+import json
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+# Profilage opt-in d'un rerun Streamlit : chaque appel au backend (requêtes SQL, jobs asynchrones,
+# fichiers de stage, API Analyst) est chronométré et attribué à la ligne de l'application qui l'a
+# déclenché, puis listé dans un panneau de la barre latérale avec export du profil.
+# Activation : CORTEX_PROFILE=1 ou ?profile=1 dans l'URL ; « cprofile » ajoute cProfile (export
+# .pstats), « sample » un échantillonneur de piles (export au format folded pour les flamegraphs).
+# Usage : CORTEX_PROFILE=cprofile streamlit run Home.py  ou  https://…/?profile=sample
+
+PROFILE_ENV = "CORTEX_PROFILE"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_MODES = ("queries", "cprofile", "sample")
+SAMPLE_INTERVAL = 0.005
+HISTORY_SIZE = 20
+STATEMENT_PREVIEW = 200
+
+_current_profile = contextvars.ContextVar("cortex_current_profile", default=None)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cadres ignorés pour l'attribution : ce module, la passerelle common/backend.py et contextlib
+_SKIPPED_FILES = (os.path.abspath(__file__), os.path.join(_PROJECT_ROOT, "common", "backend.py"),
+                  os.path.abspath(contextlib.__file__))
+
+
+def parse_mode(value):
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "off", "no"):
+        return None
+    return value if value in PROFILE_MODES else "queries"
+
+
+def requested_mode():
+    # Paramètre d'URL prioritaire sur la variable d'environnement (?profile=0 désactive)
+    import streamlit as st
+    try:
+        value = st.query_params.get(PROFILE_QUERY_PARAM)
+    except Exception:
+        value = None
+    if value is None:
+        value = os.environ.get(PROFILE_ENV)
+    return parse_mode(value)
+
+
+def call_site():
+    # Première ligne appelante hors du profilage et de la passerelle : « fichier:ligne (fonction) »
+    frame = sys._getframe(1)
+    while frame is not None and os.path.abspath(frame.f_code.co_filename) in _SKIPPED_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    filename = os.path.abspath(frame.f_code.co_filename)
+    if filename.startswith(_PROJECT_ROOT + os.sep):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    return f"{filename}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+
+def row_count(result):
+    if result is None:
+        return None
+    if isinstance(result, (int, float)):
+        return 1
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+class StackSampler:
+    # Échantillonneur de piles du thread du script (sys._current_frames), agrégées au format folded
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="cortex-profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class RerunProfile:
+    # Appels au backend et sections (pages) mesurés pendant un rerun
+
+    def __init__(self, name, mode="queries"):
+        self.name = name
+        self.mode = mode
+        self.start_time = time.time()
+        self.duration_ms = None
+        self.calls = []
+        self.sections = []
+        self.profiler = None
+        self.sampler = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def record(self, kind, statement, site=None):
+        start = time.time()
+        record = {
+            "kind": kind,
+            "statement": " ".join(str(statement).split())[:STATEMENT_PREVIEW],
+            "call_site": site or call_site(),
+            "thread": threading.current_thread().name,
+            "start_ms": int((start - self.start_time) * 1000),
+            "rows": None,
+            "error": None,
+        }
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["duration_ms"] = round((time.time() - start) * 1000, 1)
+            with self._lock:
+                self.calls.append(record)
+
+    def wrap_session(self, session):
+        return ProfiledSession(session, self)
+
+    def start_profilers(self):
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError as e:
+                # Un autre profileur est déjà actif dans ce thread
+                logging.warning(f"cProfile indisponible pour ce rerun : {e}")
+                self.profiler = None
+        elif self.mode == "sample":
+            self.sampler = StackSampler(threading.get_ident())
+            self.sampler.start()
+
+    def stop_profilers(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.duration_ms = round((time.time() - self.start_time) * 1000, 1)
+
+    def summary(self):
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "duration_ms": self.duration_ms,
+            "calls": len(calls),
+            "queries": sum(1 for call in calls if call["kind"] != "analyst"),
+            "backend_ms": round(sum(call["duration_ms"] for call in calls), 1),
+            "rows": sum(call["rows"] or 0 for call in calls),
+            "errors": sum(1 for call in calls if call["error"]),
+        }
+
+    def by_call_site(self):
+        # Temps cumulé par ligne appelante, du plus coûteux au moins coûteux
+        totals = {}
+        with self._lock:
+            for call in self.calls:
+                site = totals.setdefault(call["call_site"], {"call_site": call["call_site"], "calls": 0, "duration_ms": 0.0, "rows": 0})
+                site["calls"] += 1
+                site["duration_ms"] = round(site["duration_ms"] + call["duration_ms"], 1)
+                site["rows"] += call["rows"] or 0
+        return sorted(totals.values(), key=lambda site: site["duration_ms"], reverse=True)
+
+    def to_json(self, history=None):
+        with self._lock:
+            calls = sorted(self.calls, key=lambda call: call["start_ms"])
+            sections = list(self.sections)
+        return json.dumps({
+            "summary": self.summary(),
+            "started_at": self.start_time,
+            "sections": sections,
+            "calls": calls,
+            "by_call_site": self.by_call_site(),
+            "history": history or [],
+        }, default=str, indent=2)
+
+    def pstats_bytes(self):
+        # Même format que cProfile.Profile.dump_stats : lisible par pstats.Stats / snakeviz
+        if self.profiler is None:
+            return None
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+    def folded_stacks(self):
+        return self.sampler.folded() if self.sampler is not None else None
+
+
+class ProfiledSession:
+    # Session Snowpark (ou locale) dont les DataFrames, jobs et fichiers sont chronométrés
+
+    def __init__(self, session, profile):
+        self._session = session
+        self._profile = profile
+        self.file = ProfiledFileAccess(session.file, profile)
+
+    def sql(self, query, params=None):
+        dataframe = self._session.sql(query, params) if params is not None else self._session.sql(query)
+        return ProfiledDataFrame(dataframe, self._profile, query)
+
+    def table(self, name):
+        return ProfiledDataFrame(self._session.table(name), self._profile, f"TABLE {name}")
+
+    def create_async_job(self, query_id):
+        return ProfiledAsyncJob(self._session.create_async_job(query_id), self._profile, f"ASYNC JOB {query_id}", call_site())
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class ProfiledDataFrame:
+    # Les actions (collect, to_pandas…) sont mesurées ; les transformations renvoient un DataFrame profilé
+
+    ACTIONS = ("collect", "to_pandas", "count", "first")
+
+    def __init__(self, dataframe, profile, statement):
+        self._dataframe = dataframe
+        self._profile = profile
+        self._statement = statement
+
+    def __getattr__(self, name):
+        attribute = getattr(self._dataframe, name)
+        if not callable(attribute):
+            return attribute
+        if name in self.ACTIONS:
+            @wraps(attribute)
+            def action(*args, **kwargs):
+                with self._profile.record(name, self._statement) as record:
+                    result = attribute(*args, **kwargs)
+                    record["rows"] = row_count(result)
+                return result
+            return action
+
+        @wraps(attribute)
+        def transformation(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return ProfiledDataFrame(result, self._profile, self._statement) if hasattr(result, "collect") else result
+        return transformation
+
+    def collect_nowait(self):
+        return ProfiledAsyncJob(self._dataframe.collect_nowait(), self._profile, self._statement, call_site())
+
+    def to_pandas_batches(self, *args, **kwargs):
+        site = call_site()
+        result = self._dataframe.to_pandas_batches(*args, **kwargs)
+        if hasattr(result, "result"):
+            return ProfiledAsyncJob(result, self._profile, self._statement, site)
+        return profiled_batches(result, self._profile, "to_pandas_batches", self._statement, site)
+
+
+class ProfiledAsyncJob:
+    # Durée mesurée de la soumission (ou du rattachement) jusqu'à la fin de result()
+
+    def __init__(self, job, profile, statement, site):
+        self._job = job
+        self._profile = profile
+        self._statement = statement
+        self._site = site
+        self._submitted_at = time.time()
+
+    def result(self, *args, **kwargs):
+        result = self._job.result(*args, **kwargs)
+        if hasattr(result, "__next__"):
+            return profiled_batches(result, self._profile, "async", self._statement, self._site, self._submitted_at)
+        with self._profile.record("async", self._statement, self._site) as record:
+            record["rows"] = row_count(result)
+        record["duration_ms"] = round((time.time() - self._submitted_at) * 1000, 1)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+
+def profiled_batches(batches, profile, kind, statement, site, started_at=None):
+    # Itérateur de lots : durée et lignes enregistrées une fois l'itération terminée
+    started_at = started_at or time.time()
+    with profile.record(kind, statement, site) as record:
+        record["rows"] = 0
+        for batch in batches:
+            record["rows"] += len(batch)
+            yield batch
+    record["duration_ms"] = round((time.time() - started_at) * 1000, 1)
+
+
+class ProfiledFileAccess:
+
+    def __init__(self, file_access, profile):
+        self._file_access = file_access
+        self._profile = profile
+
+    def get_stream(self, stage_path, *args, **kwargs):
+        with self._profile.record("file", stage_path):
+            return self._file_access.get_stream(stage_path, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._file_access, name)
+
+
+def current_profile():
+    return _current_profile.get()
+
+
+def wrap_session(session):
+    profile = current_profile()
+    return profile.wrap_session(session) if profile is not None else session
+
+
+@contextlib.contextmanager
+def profile_rerun(name):
+    # Rerun profilé si demandé ; imbriqué (page lancée depuis Home), simple section du rerun englobant
+    import streamlit as st
+    parent = current_profile()
+    if parent is not None:
+        start = time.time()
+        try:
+            yield parent
+        finally:
+            parent.sections.append({"name": name, "start_ms": int((start - parent.start_time) * 1000),
+                                    "duration_ms": round((time.time() - start) * 1000, 1)})
+        return
+    mode = requested_mode()
+    if mode is None:
+        yield None
+        return
+
+    profile = RerunProfile(name, mode)
+    token = _current_profile.set(profile)
+    profile.start_profilers()
+    completed = False
+    try:
+        yield profile
+        completed = True
+    finally:
+        profile.stop_profilers()
+        _current_profile.reset(token)
+        history = st.session_state.setdefault("profile_history", [])
+        history.append(profile.summary())
+        del history[:-HISTORY_SIZE]
+        logging.info(f"Profil du rerun {name} : {profile.summary()}")
+    # st.rerun / st.stop / exception : le panneau n'est affiché que pour un rerun terminé
+    if completed:
+        render_profile_panel(profile, history)
+
+
+def render_profile_panel(profile, history):
+    import pandas as pd
+    import streamlit as st
+    summary = profile.summary()
+    with st.sidebar.expander(f"⏱️ Profil du rerun : {summary['duration_ms']:.0f} ms", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Appels backend", summary["calls"])
+        col2.metric("Temps backend", f"{summary['backend_ms']:.0f} ms")
+        col3.metric("Lignes", summary["rows"])
+        with profile._lock:
+            calls = sorted(profile.calls, key=lambda call: call["start_ms"])
+        if calls:
+            st.markdown("**Appels de ce rerun**")
+            st.dataframe(pd.DataFrame(calls)[["start_ms", "duration_ms", "kind", "rows", "call_site", "statement", "thread", "error"]],
+                         hide_index=True, use_container_width=True)
+            st.markdown("**Par ligne appelante**")
+            st.dataframe(pd.DataFrame(profile.by_call_site()), hide_index=True, use_container_width=True)
+        else:
+            st.caption("Aucun appel au backend pendant ce rerun (résultats en cache).")
+        if profile.sections:
+            st.markdown("**Sections**")
+            st.dataframe(pd.DataFrame(profile.sections), hide_index=True, use_container_width=True)
+        if len(history) > 1:
+            st.markdown("**Reruns précédents**")
+            st.line_chart(pd.DataFrame(history)[["duration_ms", "backend_ms"]])
+
+        st.download_button("Exporter le profil (JSON)", profile.to_json(history), file_name=f"profile_{profile.name}.json",
+                           mime="application/json", key="profile_export_json")
+        pstats_data = profile.pstats_bytes()
+        if pstats_data is not None:
+            st.download_button("Exporter cProfile (.pstats)", pstats_data, file_name=f"profile_{profile.name}.pstats",
+                               mime="application/octet-stream", key="profile_export_pstats")
+        folded = profile.folded_stacks()
+        if folded:
+            st.download_button("Exporter les piles échantillonnées (folded)", folded, file_name=f"profile_{profile.name}.folded",
+                               mime="text/plain", key="profile_export_folded")
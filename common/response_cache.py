@@ -0,0 +1,93 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import logging
+
+
+def normalize_prompt(prompt):
+    # Normalisation de la question : casse, accents et espaces ne changent pas la clé
+    text = unicodedata.normalize('NFKD', prompt or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+class ResponseCache:
+    # Cache LRU avec TTL des réponses Cortex Analyst, partagé entre les sessions Streamlit
+
+    def __init__(self, max_entries=500, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._model_files = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, app_id, yaml_file, prompt, model_version=None):
+        # model_version : empreinte du fichier YAML sur le stage, qui peut être remplacé sous le même nom
+        return (str(app_id), yaml_file, normalize_prompt(prompt), model_version)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def sync_models(self, app_id, files):
+        # Invalide les réponses d'une application dont le CORTEX_YAML_FILE a changé
+        app_id = str(app_id)
+        with self._lock:
+            previous = self._model_files.get(app_id)
+            self._model_files[app_id] = dict(files)
+            if previous is None or previous == files:
+                return 0
+            stale_files = {
+                yaml_file for name, yaml_file in previous.items()
+                if files.get(name) != yaml_file
+            }
+            stale_keys = [k for k in self._entries if k[0] == app_id and k[1] in stale_files]
+            for k in stale_keys:
+                del self._entries[k]
+        if stale_keys:
+            logging.info(f"Cache des réponses : {len(stale_keys)} entrée(s) invalidée(s) pour l'app {app_id}")
+        return len(stale_keys)
+
+    def invalidate_app(self, app_id):
+        app_id = str(app_id)
+        with self._lock:
+            stale_keys = [k for k in self._entries if k[0] == app_id]
+            for k in stale_keys:
+                del self._entries[k]
+        return len(stale_keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def statement_hash(statement):
+    return hashlib.sha256(statement.strip().encode()).hexdigest()[:16]
+
+
+def frame_size(value):
+    # Lignes affichées, plus celles gardées par le curseur pour les pages suivantes
+    frames = [getattr(value, "df", value)]
+    cursor = getattr(value, "cursor", None)
+    if cursor is not None:
+        frames.append(cursor.buffer)
+    try:
+        return sum(int(df.memory_usage(index=True, deep=True).sum()) for df in frames)
+    except Exception:
+        return 0
+
+
+class ResultCursor:
+    # Lecture progressive d'un seul jeu de résultats (itérateur de lots to_pandas_batches) :
+    # chaque page reprend là où la précédente s'est arrêtée, sans réexécuter la requête.
+    # Partagé entre sessions par le single-flight, d'où le verrou.
+
+    def __init__(self, batches, max_rows, query_id=None):
+        self.query_id = query_id
+        self.max_rows = max_rows
+        self.exhausted = False
+        self._batches = iter(batches)
+        self._df = pd.DataFrame()
+        self._lock = threading.Lock()
+
+    @property
+    def buffer(self):
+        return self._df
+
+    @property
+    def fetched_rows(self):
+        return len(self._df)
+
+    def read(self, offset, limit):
+        end = min(offset + limit, self.max_rows)
+        with self._lock:
+            frames = [self._df]
+            fetched = len(self._df)
+            while fetched < end and not self.exhausted:
+                try:
+                    batch = next(self._batches)
+                except StopIteration:
+                    self.exhausted = True
+                    break
+                frames.append(batch)
+                fetched += len(batch)
+            if len(frames) > 1:
+                self._df = pd.concat([f for f in frames if len(f.columns)], ignore_index=True).iloc[:self.max_rows]
+            if len(self._df) >= self.max_rows and not self.exhausted:
+                # Limite atteinte : les lots restants ne seront jamais lus
+                self._batches = iter(())
+            return self._df.iloc[offset:end].reset_index(drop=True)
+
+
+class PagedResult:
+    # Premières lignes d'un résultat, avec le total calculé côté serveur ; les lignes suivantes
+    # sont lues dans le même jeu de résultats (cursor)
+
+    def __init__(self, df, total_rows, max_rows, cursor=None):
+        self.df = df
+        self.total_rows = total_rows
+        self.max_rows = max_rows
+        self.cursor = cursor
+
+    @property
+    def loaded_rows(self):
+        return len(self.df)
+
+    @property
+    def can_load_more(self):
+        return self.loaded_rows < min(self.total_rows, self.max_rows)
+
+
+class ResultSetCache:
+    # Résultats des requêtes SQL d'une session, gardés sous un budget mémoire (LRU)
+
+    def __init__(self, max_bytes=100 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+
+    def make_key(self, message_id, statement):
+        return (str(message_id), statement_hash(statement))
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, df):
+        self.evict(key)
+        size = frame_size(df)
+        if size > self.max_bytes:
+            # Trop gros pour le budget : le résultat sera réexécuté au prochain affichage
+            return False
+        self._entries[key] = (df, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+        return True
+
+    def evict(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,257 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+# Tables d'agrégats (rollups) de CORTEX_LOGS et CORTEX_VOTES, à la maille heure et jour.
+# Rafraîchissement incrémental : seuls les intervalles touchés par des lignes postérieures
+# au filigrane (moins un recouvrement pour les écritures différées) sont recalculés.
+
+ROLLUPS = {
+    "CORTEX_LOGS_ROLLUP_HOURLY": {"source": "LOGS", "grain": "HOUR"},
+    "CORTEX_LOGS_ROLLUP_DAILY": {"source": "LOGS", "grain": "DAY"},
+    "CORTEX_VOTES_ROLLUP_HOURLY": {"source": "VOTES", "grain": "HOUR"},
+    "CORTEX_VOTES_ROLLUP_DAILY": {"source": "VOTES", "grain": "DAY"},
+}
+
+SOURCE_TABLES = {
+    "LOGS": ("CORTEX_DB.PUBLIC.CORTEX_LOGS", "DATETIME"),
+    "VOTES": ("CORTEX_DB.PUBLIC.CORTEX_VOTES", "VOTE_CREATED_AT"),
+}
+
+
+def truncate(timestamp, grain):
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.floor("h") if grain == "HOUR" else timestamp.normalize()
+
+
+class RollupRefresher:
+    # Logique de rafraîchissement commune, indépendante du moteur (Snowflake ou pandas)
+
+    def __init__(self, backend, overlap_minutes=5, refresh_interval=60):
+        self.backend = backend
+        self.overlap = timedelta(minutes=overlap_minutes)
+        self.refresh_interval = refresh_interval
+        self.last_refresh = 0
+        self._lock = threading.Lock()
+
+    def refresh_if_stale(self, force=False):
+        with self._lock:
+            if not force and time.time() < self.last_refresh + self.refresh_interval:
+                return {}
+            refreshed = self.refresh()
+            self.last_refresh = time.time()
+            return refreshed
+
+    def refresh(self):
+        refreshed = {}
+        for name, spec in ROLLUPS.items():
+            source_max = self.backend.max_source_time(spec["source"])
+            if source_max is None:
+                continue
+            watermark = self.backend.get_watermark(name)
+            if watermark is not None and pd.Timestamp(source_max) <= pd.Timestamp(watermark):
+                continue
+            start = truncate(pd.Timestamp(watermark) - self.overlap, spec["grain"]) if watermark is not None else None
+            self.backend.recompute(name, spec, start)
+            self.backend.set_watermark(name, source_max)
+            refreshed[name] = start
+            logging.info(f"Rollup {name} recalculé depuis {start}")
+        return refreshed
+
+
+class SnowflakeRollupBackend:
+    # Agrégats calculés en SQL (Snowflake, ou SQLite via le backend local)
+
+    # Les réponses servies par le cache (CACHED) comptent comme requêtes mais pas dans les latences
+    # Analyst et de résolution ; ELAPSED_COUNT est en dernier, comme la colonne ajoutée par migration
+    LOG_MEASURES = """
+        COUNT(*) AS REQUEST_COUNT,
+        SUM(ANALYST_TIME) AS ELAPSED_SUM,
+        MAX(ANALYST_TIME) AS ELAPSED_MAX,
+        SUM(UNCACHED_RESOLUTION_TIME) AS RESOLUTION_SUM,
+        COUNT(UNCACHED_RESOLUTION_TIME) AS RESOLUTION_COUNT,
+        MAX(UNCACHED_RESOLUTION_TIME) AS RESOLUTION_MAX,
+        SUM(SQL_TIME) AS SQL_TIME_SUM,
+        COUNT(SQL_TIME) AS SQL_TIME_COUNT,
+        MAX(SQL_TIME) AS SQL_TIME_MAX,
+        APPROX_PERCENTILE_ACCUMULATE(ANALYST_TIME) AS ELAPSED_SKETCH,
+        APPROX_PERCENTILE_ACCUMULATE(UNCACHED_RESOLUTION_TIME) AS RESOLUTION_SKETCH,
+        APPROX_PERCENTILE_ACCUMULATE(SQL_TIME) AS SQL_TIME_SKETCH,
+        COUNT(ANALYST_TIME) AS ELAPSED_COUNT
+    """
+
+    def __init__(self, get_session):
+        # La session est résolue à chaque appel (ressource partagée entre les sessions Streamlit)
+        self.get_session = get_session
+
+    @property
+    def session(self):
+        return self.get_session()
+
+    def max_source_time(self, source):
+        table, time_column = SOURCE_TABLES[source]
+        return self.session.sql(f"SELECT MAX({time_column}) AS MAX_TIME FROM {table}").collect()[0]['MAX_TIME']
+
+    def get_watermark(self, name):
+        rows = self.session.sql("""
+            SELECT WATERMARK FROM CORTEX_DB.PUBLIC.CORTEX_ROLLUP_STATE WHERE ROLLUP_NAME = ?
+        """, (name,)).collect()
+        return rows[0]['WATERMARK'] if rows else None
+
+    def set_watermark(self, name, watermark):
+        # DELETE + INSERT plutôt que MERGE : même SQL sur Snowflake et sur le backend local
+        if isinstance(watermark, pd.Timestamp):
+            watermark = watermark.to_pydatetime()
+        self.session.sql("DELETE FROM CORTEX_DB.PUBLIC.CORTEX_ROLLUP_STATE WHERE ROLLUP_NAME = ?", (name,)).collect()
+        self.session.sql("""
+            INSERT INTO CORTEX_DB.PUBLIC.CORTEX_ROLLUP_STATE (ROLLUP_NAME, WATERMARK, UPDATED_AT)
+            VALUES (?, ?, CURRENT_TIMESTAMP())
+        """, (name, watermark)).collect()
+
+    @staticmethod
+    def timestamp_literal(timestamp):
+        # Borne calculée à partir du filigrane (jamais saisie) : littéral, un bloc de script
+        # n'acceptant pas de paramètres liés
+        return f"'{pd.Timestamp(timestamp):%Y-%m-%d %H:%M:%S.%f}'::TIMESTAMP_NTZ"
+
+    def select_query(self, spec, start):
+        table, time_column = SOURCE_TABLES[spec["source"]]
+        if start is not None:
+            where = f"WHERE {time_column} >= {self.timestamp_literal(start)}"
+        else:
+            where = f"WHERE {time_column} IS NOT NULL"
+        if spec["source"] == "LOGS":
+            return f"""
+                SELECT DATE_TRUNC('{spec["grain"]}', DATETIME) AS BUCKET_START,
+                    APP_ID, APP_NAME, YAML_FILE, USERNAME,
+                    {self.LOG_MEASURES}
+                FROM (
+                    SELECT *,
+                        CASE WHEN CACHED THEN NULL ELSE ELAPSED_TIME END AS ANALYST_TIME,
+                        CASE WHEN CACHED THEN NULL ELSE RESOLUTION_TIME END AS UNCACHED_RESOLUTION_TIME
+                    FROM {table}
+                    {where}
+                )
+                GROUP BY 1, 2, 3, 4, 5
+            """
+        # Votes antérieurs à APP_ID : rattachés à l'application via le fichier YAML du modèle
+        return f"""
+            SELECT DATE_TRUNC('{spec["grain"]}', v.VOTE_CREATED_AT) AS BUCKET_START,
+                COALESCE(v.APP_ID, m.APP_ID) AS APP_ID, v.YAML_FILE, v.VOTE_USERNAME AS USERNAME,
+                COUNT(*) AS VOTE_COUNT,
+                COUNT_IF(v.VOTE_VALUE > 0) AS UP_VOTES,
+                COUNT_IF(v.VOTE_VALUE < 0) AS DOWN_VOTES
+            FROM {table} v
+            LEFT JOIN (
+                SELECT CORTEX_YAML_FILE, MIN(TRY_TO_NUMBER(APP_ID)) AS APP_ID
+                FROM CORTEX_DB.PUBLIC.CORTEX_MODELS
+                GROUP BY CORTEX_YAML_FILE
+            ) m ON m.CORTEX_YAML_FILE = v.YAML_FILE
+            {where.replace(time_column, 'v.' + time_column)}
+            GROUP BY 1, 2, 3, 4
+        """
+
+    def recompute(self, name, spec, start):
+        # Suppression puis réinsertion des intervalles touchés, dans une transaction confinée à un
+        # seul bloc Snowflake Scripting : la session est partagée avec la file de logs et les autres
+        # sessions Streamlit, aucune transaction n'y est ouverte entre deux appels
+        where = f" WHERE BUCKET_START >= {self.timestamp_literal(start)}" if start is not None else ""
+        self.session.sql(f"""
+            EXECUTE IMMEDIATE $$
+            BEGIN
+                BEGIN TRANSACTION;
+                DELETE FROM CORTEX_DB.PUBLIC.{name}{where};
+                INSERT INTO CORTEX_DB.PUBLIC.{name} {self.select_query(spec, start)};
+                COMMIT;
+            EXCEPTION
+                WHEN OTHER THEN
+                    ROLLBACK;
+                    RAISE;
+            END;
+            $$
+        """).collect()
+
+
+class PandasRollupBackend:
+    # Équivalent local en pandas, pour exercer la logique de rafraîchissement hors Snowflake.
+    # Les « sketches » sont ici la liste triée des valeurs (percentiles exacts).
+
+    def __init__(self, logs_df, votes_df, models_df=None):
+        self.sources = {"LOGS": logs_df, "VOTES": votes_df}
+        self.models_df = models_df
+        self.tables = {}
+        self.state = {}
+        self.recomputed_rows = 0
+
+    def max_source_time(self, source):
+        df = self.sources[source]
+        column = SOURCE_TABLES[source][1]
+        return None if df.empty or df[column].isna().all() else df[column].max()
+
+    def get_watermark(self, name):
+        return self.state.get(name)
+
+    def set_watermark(self, name, watermark):
+        self.state[name] = watermark
+
+    def recompute(self, name, spec, start):
+        column = SOURCE_TABLES[spec["source"]][1]
+        source = self.sources[spec["source"]]
+        source = source[source[column].notna()]
+        if start is not None:
+            source = source[source[column] >= start]
+        self.recomputed_rows += len(source)
+        fresh = self.aggregate(source, spec)
+        table = self.tables.get(name)
+        if table is not None and start is not None:
+            table = table[table["BUCKET_START"] < start]
+            fresh = pd.concat([table, fresh], ignore_index=True)
+        self.tables[name] = fresh.sort_values("BUCKET_START").reset_index(drop=True)
+
+    def aggregate(self, source, spec):
+        column = SOURCE_TABLES[spec["source"]][1]
+        source = source.assign(BUCKET_START=source[column].map(lambda t: truncate(t, spec["grain"])))
+        if spec["source"] == "LOGS":
+            if "CACHED" in source:
+                cached = source["CACHED"].fillna(False).astype(bool)
+                source = source.assign(ELAPSED_TIME=source["ELAPSED_TIME"].mask(cached),
+                                       RESOLUTION_TIME=source["RESOLUTION_TIME"].mask(cached))
+            grouped = source.groupby(["BUCKET_START", "APP_ID", "APP_NAME", "YAML_FILE", "USERNAME"], dropna=False)
+            return grouped.agg(
+                REQUEST_COUNT=("ELAPSED_TIME", "size"),
+                ELAPSED_SUM=("ELAPSED_TIME", "sum"),
+                ELAPSED_MAX=("ELAPSED_TIME", "max"),
+                RESOLUTION_SUM=("RESOLUTION_TIME", "sum"),
+                RESOLUTION_COUNT=("RESOLUTION_TIME", "count"),
+                RESOLUTION_MAX=("RESOLUTION_TIME", "max"),
+                SQL_TIME_SUM=("SQL_TIME", "sum"),
+                SQL_TIME_COUNT=("SQL_TIME", "count"),
+                SQL_TIME_MAX=("SQL_TIME", "max"),
+                ELAPSED_SKETCH=("ELAPSED_TIME", lambda v: sorted(v.dropna())),
+                RESOLUTION_SKETCH=("RESOLUTION_TIME", lambda v: sorted(v.dropna())),
+                SQL_TIME_SKETCH=("SQL_TIME", lambda v: sorted(v.dropna())),
+                ELAPSED_COUNT=("ELAPSED_TIME", "count"),
+            ).reset_index()
+        if self.models_df is not None:
+            app_ids = self.models_df.groupby("CORTEX_YAML_FILE")["APP_ID"].min()
+            yaml_app_ids = source["YAML_FILE"].map(app_ids)
+            source = source.assign(APP_ID=source["APP_ID"].fillna(yaml_app_ids) if "APP_ID" in source else yaml_app_ids)
+        elif "APP_ID" not in source:
+            source = source.assign(APP_ID=None)
+        grouped = source.groupby(["BUCKET_START", "APP_ID", "YAML_FILE", "VOTE_USERNAME"], dropna=False)
+        return grouped.agg(
+            VOTE_COUNT=("VOTE_VALUE", "size"),
+            UP_VOTES=("VOTE_VALUE", lambda v: int((v > 0).sum())),
+            DOWN_VOTES=("VOTE_VALUE", lambda v: int((v < 0).sum())),
+        ).reset_index().rename(columns={"VOTE_USERNAME": "USERNAME"})
+
+    def percentile(self, name, sketch_column, quantile, by):
+        # Équivalent de APPROX_PERCENTILE_ESTIMATE(APPROX_PERCENTILE_COMBINE(sketch), q)
+        def estimate(sketches):
+            values = [value for sketch in sketches for value in sketch]
+            return float(np.percentile(values, quantile * 100)) if values else None
+
+        return self.tables[name].groupby(by)[sketch_column].agg(estimate)
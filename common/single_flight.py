@@ -0,0 +1,136 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class CoalescedCallAborted(Exception):
+    # L'appel meneur a été interrompu (rerun Streamlit, arrêt du script) : l'appelant doit réessayer
+    pass
+
+
+class SingleFlight:
+    # Déduplication des appels identiques en cours : le premier appelant exécute,
+    # les suivants attendent le même Future et partagent son résultat
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                self.calls += 1
+                future = self._in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._in_flight[key] = future
+                    self.executions += 1
+                else:
+                    self.coalesced += 1
+
+            if not leader:
+                try:
+                    return future.result()
+                except CoalescedCallAborted:
+                    with self._lock:
+                        self.calls -= 1
+                        self.coalesced -= 1
+                    continue
+
+            try:
+                result = fn()
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            except BaseException:
+                future.set_exception(CoalescedCallAborted())
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
+
+
+class SharedQueries:
+    # Requêtes SQL identiques en cours, toutes sessions confondues : le premier appelant soumet la
+    # requête, les suivants se rattachent à son query id. Chacun attend, lit et pagine le résultat
+    # avec son propre handle ; la requête n'est annulée côté serveur que lorsque plus aucun
+    # appelant ne l'attend (release).
+
+    def __init__(self, max_age=3600):
+        # max_age : une entrée jamais libérée (session abandonnée en cours d'attente) est remplacée
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._queries = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def acquire(self, key, submit):
+        # submit() soumet la requête et renvoie (query_id, submitted_at), partagé par les appelants
+        while True:
+            with self._lock:
+                self.calls += 1
+                entry = self._queries.get(key)
+                leader = entry is None or entry["created_at"] < time.time() - self.max_age
+                if leader:
+                    entry = {"future": Future(), "waiters": 1, "created_at": time.time()}
+                    self._queries[key] = entry
+                    self.executions += 1
+                else:
+                    entry["waiters"] += 1
+                    self.coalesced += 1
+
+            if leader:
+                try:
+                    entry["future"].set_result(submit())
+                except BaseException as e:
+                    with self._lock:
+                        if self._queries.get(key) is entry:
+                            del self._queries[key]
+                    entry["future"].set_exception(e if isinstance(e, Exception) else CoalescedCallAborted())
+                    raise
+            try:
+                return entry["future"].result()
+            except CoalescedCallAborted:
+                with self._lock:
+                    self.calls -= 1
+                    self.coalesced -= 1
+                continue
+
+    def release(self, key, query_id):
+        # Détache un appelant ; True s'il était le dernier à attendre cette requête
+        with self._lock:
+            entry = self._queries.get(key)
+            future = entry["future"] if entry is not None else None
+            if future is None or not future.done() or future.exception() is not None or future.result()[0] != query_id:
+                return True
+            entry["waiters"] -= 1
+            if entry["waiters"] > 0:
+                return False
+            del self._queries[key]
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._queries),
+            }
@@ -0,0 +1,75 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_current_trace = contextvars.ContextVar("cortex_current_trace", default=None)
+
+
+class RequestTrace:
+    # Spans mesurés pour une question : appel Analyst, exécution SQL, conversion, graphiques, log
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self.start_time = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        start = time.time()
+        record = {
+            "name": name,
+            "start_ms": int((start - self.start_time) * 1000),
+            "attributes": attributes,
+        }
+        try:
+            yield record
+        finally:
+            record["duration_ms"] = int((time.time() - start) * 1000)
+            with self._lock:
+                self.spans.append(record)
+
+    def total_ms(self, name):
+        with self._lock:
+            return sum(span["duration_ms"] for span in self.spans if span["name"] == name)
+
+    def first_attribute(self, name, attribute):
+        with self._lock:
+            for span in self.spans:
+                if span["name"] == name and span["attributes"].get(attribute) is not None:
+                    return span["attributes"][attribute]
+        return None
+
+    def elapsed_ms(self):
+        return int((time.time() - self.start_time) * 1000)
+
+    def to_json(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return json.dumps({"request_id": self.request_id, "started_at": datetime.fromtimestamp(self.start_time).isoformat(),
+                           "total_ms": self.elapsed_ms(), "spans": spans}, default=str)
+
+
+class NullTrace:
+    # Utilisé hors d'une question (rerun, « Charger plus ») : les spans ne sont pas conservés
+
+    request_id = None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        yield {"name": name, "attributes": attributes}
+
+
+def current_trace():
+    return _current_trace.get() or NullTrace()
+
+
+def set_current_trace(trace):
+    return _current_trace.set(trace)
+
+
+def reset_current_trace(token):
+    _current_trace.reset(token)
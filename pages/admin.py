@@ -1,36 +1,24 @@
 import streamlit as st
 import pandas as pd
-import snowflake.snowpark.functions as F
-from snowflake.snowpark.context import get_active_session
-from PIL import Image
-from snowflake.snowpark.types import StringType, BooleanType
-import io
 import logging
+from common.backend import get_session
+from common.profiling import profile_rerun
+from apps.app_registry import get_app_registry
+from common.image_service import get_image_service
 
 def main():
 
     logging.basicConfig(level=logging.DEBUG)
     logger = logging.getLogger(__name__)
 
-    # Fonction pour charger une image depuis un stage Snowflake
-    def load_image_from_snowflake(stage_path):
-        session = get_active_session()
-        try:
-            with session.file.get_stream(stage_path) as file_stream:
-                image_data = file_stream.read()
-                return Image.open(io.BytesIO(image_data))
-        except Exception as e:
-            st.error(f"Erreur lors du chargement de l'image : {e}")
-            return None
-
     # Fonction pour charger les données d'une table
     def load_table_data(table_name):
-        session = get_active_session()
+        session = get_session()
         return session.table(f"CORTEX_DB.PUBLIC.{table_name}").to_pandas()
 
     # Fonction pour insérer une nouvelle application dans la table CORTEX_APPS
     def insert_new_app(app_name, app_logo_url, app_url, app_active, app_access_role, app_database, app_schema, app_stage):
-        session = get_active_session()
+        session = get_session()
         try:
             new_app_id = session.sql("SELECT COALESCE(MAX(APP_ID), 0) + 1 AS new_id FROM CORTEX_DB.PUBLIC.CORTEX_APPS").collect()[0]['NEW_ID']
             session.sql(f"""
@@ -39,16 +27,17 @@ def main():
                 VALUES 
                 ({new_app_id}, '{app_name}', '{app_logo_url}', '{app_url}', {app_active}, '{app_access_role}', '{app_database}', '{app_schema}', '{app_stage}')
             """).collect()
+            get_app_registry().invalidate()
             st.success(f"✔️ Nouvelle application '{app_name}' ajoutée avec succès !")
         except Exception as e:
             st.error(f"❌ Erreur lors de l'ajout de l'application : {e}")
 
     def load_top_questions(app_id, limit=10, days=30):
-        session = get_active_session()
+        session = get_session()
         query = f"""
         SELECT INPUT_TEXT, COUNT(*) as QUESTION_COUNT, 
-            AVG(ELAPSED_TIME) as AVG_ELAPSED_TIME,
-            AVG(RESOLUTION_TIME) as AVG_RESOLUTION_TIME
+            AVG(CASE WHEN CACHED THEN NULL ELSE ELAPSED_TIME END) as AVG_ELAPSED_TIME,
+            AVG(CASE WHEN CACHED THEN NULL ELSE RESOLUTION_TIME END) as AVG_RESOLUTION_TIME
         FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
         WHERE APP_ID = {app_id}
         AND DATETIME >= DATEADD(day, -{days}, CURRENT_TIMESTAMP())
@@ -61,8 +50,8 @@ def main():
         return result
 
     # Fonction pour modifier une application dans la table CORTEX_APPS
-    def update_app(app_id, app_name, app_logo_url, app_url, app_active, app_access_role, app_database, app_schema, app_stage):
-        session = get_active_session()
+    def update_app(app_id, app_name, app_logo_url, app_url, app_active, app_access_role, app_database, app_schema, app_stage, previous_logo_url=None):
+        session = get_session()
         try:
             session.sql(f"""
                 UPDATE CORTEX_DB.PUBLIC.CORTEX_APPS 
@@ -71,6 +60,11 @@ def main():
                     APP_DATABASE = '{app_database}', APP_SCHEMA = '{app_schema}', APP_STAGE = '{app_stage}' 
                 WHERE APP_ID = {app_id}
             """).collect()
+            get_app_registry().invalidate(app_id)
+            # Le fichier du logo a pu être remplacé sur le stage ; l'ancienne URL n'est plus référencée
+            get_image_service().invalidate(app_logo_url)
+            if previous_logo_url and previous_logo_url != app_logo_url:
+                get_image_service().invalidate(previous_logo_url)
             st.success(f"✔️ Application '{app_name}' modifiée avec succès !")
         except Exception as e:
             st.error(f"❌ Erreur lors de la modification de l'application : {e}")
@@ -98,12 +92,12 @@ def main():
 
 
     def load_models(app_id):
-        session = get_active_session()
-        return session.table(f"CORTEX_DB.PUBLIC.CORTEX_MODELS").filter(F.col("APP_ID") == str(app_id)).to_pandas()
+        session = get_session()
+        return session.sql("SELECT * FROM CORTEX_DB.PUBLIC.CORTEX_MODELS WHERE APP_ID = ?", (str(app_id),)).to_pandas()
 
 
     def update_model(app_id, yaml_file, yaml_name, yaml_active):
-        session = get_active_session()
+        session = get_session()
         try:
             yaml_active_bool = yaml_active.lower() == 'true'
             session.sql(f"""
@@ -111,13 +105,14 @@ def main():
                 SET CORTEX_YAML_FILE = '{yaml_file}', CORTEX_YAML_ACTIVE = {yaml_active_bool}
                 WHERE APP_ID = '{app_id}' AND CORTEX_YAML_NAME = '{yaml_name}'
             """).collect()
+            get_app_registry().invalidate(app_id)
             st.success(f"✔️ Modèle '{yaml_name}' modifié avec succès !")
         except Exception as e:
             st.error(f"❌ Erreur lors de la modification du modèle : {e}")
 
     # Fonction pour insérer un nouveau modèle dans la table CORTEX_MODELS
     def insert_new_model(app_id, yaml_file, yaml_name, yaml_active):
-        session = get_active_session()
+        session = get_session()
         try:
             yaml_active_bool = yaml_active.lower() == 'true'
             session.sql(f"""
@@ -126,6 +121,7 @@ def main():
                 VALUES 
                 ('{app_id}', '{yaml_file}', '{yaml_name}', {yaml_active_bool})
             """).collect()
+            get_app_registry().invalidate(app_id)
             st.success(f"✔️ Nouveau modèle '{yaml_name}' ajouté avec succès !")
         except Exception as e:
             st.error(f"❌ Erreur lors de l'ajout du modèle : {e}")
@@ -172,7 +168,7 @@ def main():
                 
     # Fonction pour charger les signets d'une application
     def load_bookmarks(app_id):
-        session = get_active_session()
+        session = get_session()
         query = f"""
         SELECT BK_ID, APP_ID, BK_USERNAME, BK_QUESTION, BK_LANG, BK_CREATED_AT, BK_UPDATED_AT
         FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
@@ -183,7 +179,7 @@ def main():
 
     # Fonction pour supprimer un signet
     def delete_bookmark(bookmark_id):
-        session = get_active_session()
+        session = get_session()
         try:
             query = f"""
             DELETE FROM CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
@@ -197,7 +193,7 @@ def main():
 
     # Fonction pour mettre à jour un signet
     def update_bookmark(bookmark_id, new_question, new_lang):
-        session = get_active_session()
+        session = get_session()
         try:
             query = f"""
             UPDATE CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS
@@ -255,7 +251,8 @@ def main():
                 cancel_button = st.form_submit_button("Annuler")
 
             if submit_button:
-                success = update_app(app['APP_ID'], new_name, new_logo_url, new_app_url, new_active, new_access_role, new_database, new_schema, new_stage)
+                success = update_app(app['APP_ID'], new_name, new_logo_url, new_app_url, new_active, new_access_role, new_database, new_schema, new_stage,
+                                     previous_logo_url=app['APP_LOGO_URL'])
                 if success:
                     st.success("✔️ Application modifiée avec succès!")
                     # Fermer le formulaire en supprimant la clé de session_state
@@ -347,6 +344,9 @@ def main():
         else:
             return "🤖"  # Icone par défaut pour les autres applications
 
+    # Logos de toutes les applications téléchargés en parallèle (miniatures en cache)
+    logos = get_image_service().get_many(get_session(), apps_data_filtered["APP_LOGO_URL"].tolist(), (200, 200))
+
     # Création des onglets principaux pour chaque application avec l'icône appropriée
     app_tabs = st.tabs([f"{get_app_icon(app['APP_NAME'])} {app['APP_NAME']}" for _, app in apps_data_filtered.iterrows()])
 
@@ -357,7 +357,7 @@ def main():
             
             # Afficher les détails pour toutes les applications
             st.subheader(f"Détails de {app['APP_NAME']}")
-            logo_image = load_image_from_snowflake(app["APP_LOGO_URL"])
+            logo_image = logos.get(app["APP_LOGO_URL"])
             display_app_details(app, logo_image)
 
             # Bouton pour modifier l'application (pour toutes les applications)
@@ -481,9 +481,12 @@ def main():
                         for index, row in top_questions.iterrows():
                             st.write(f"{index + 1}. **{row['INPUT_TEXT']}**")
                             st.write(f"   - Nombre de fois posée : {row['QUESTION_COUNT']}")
-                            st.write(f"   - Temps moyen d'exécution : {row['AVG_ELAPSED_TIME']:.2f} secondes")
-                            st.write(f"   - Temps moyen de résolution : {row['AVG_RESOLUTION_TIME']:.2f} secondes")
+                            # Moyennes vides si la question n'a été servie que par le cache
+                            for label, column in (("d'exécution", 'AVG_ELAPSED_TIME'), ("de résolution", 'AVG_RESOLUTION_TIME')):
+                                value = f"{row[column]:.2f} secondes" if pd.notna(row[column]) else "— (réponses du cache)"
+                                st.write(f"   - Temps moyen {label} : {value}")
                         st.write("---")
 # Condition pour exécuter main() si le script est exécuté directement
 if __name__ == "__main__":
-    main()
+    with profile_rerun("admin"):
+        main()
@@ -1,9 +1,569 @@
 import streamlit as st
 import pandas as pd
 import json
+import html
 import plotly.express as px
 import plotly.graph_objects as go
-from snowflake.snowpark.context import get_active_session
+from common.backend import get_session
+from common.profiling import profile_rerun
+from common.log_search import LogSearchIndex, highlight, snippet, tokenize
+from common.rollups import RollupRefresher, SnowflakeRollupBackend
+from common.downsample import TIME_GRAINS, choose_time_grain
+
+LOG_PAGE_SIZE = 100
+
+
+# Projection côté serveur des seuls champs utiles de OUTPUT_JSON (PARSE_JSON + chemins VARIANT) :
+# le JSON complet n'est rapatrié qu'à la demande, pour une entrée (load_log_output_json)
+LOG_PROJECTION = """
+    SELECT DATETIME, USERNAME, APP_NAME, APP_ID, YAML_FILE, INPUT_TEXT,
+        ELAPSED_TIME, RESOLUTION_TIME, SQL_TIME, CACHED, QUERY_ID, REQUEST_ID,
+        FILTER(CONTENT, c -> c:type::STRING = 'text')[0]:text::STRING AS "output_text",
+        FILTER(CONTENT, c -> c:type::STRING = 'sql')[0]:statement::STRING AS "output_sql",
+        ARRAY_TO_STRING(FILTER(CONTENT, c -> c:type::STRING = 'suggestions')[0]:suggestions::ARRAY, ' | ') AS "output_suggestions"
+    FROM (
+        SELECT *, TRY_PARSE_JSON(OUTPUT_JSON):message:content AS CONTENT
+        FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+    )
+"""
+
+
+# Champs lus pour l'index de recherche : la clé des lignes (row_keys) et les textes indexés
+LOG_INDEX_PROJECTION = """
+    SELECT DATETIME, REQUEST_ID, USERNAME, APP_ID, APP_NAME, INPUT_TEXT,
+        FILTER(CONTENT, c -> c:type::STRING = 'sql')[0]:statement::STRING AS "output_sql"
+    FROM (
+        SELECT *, TRY_PARSE_JSON(OUTPUT_JSON):message:content AS CONTENT
+        FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+    )
+"""
+
+
+def fetch_index_rows(since, retention_days):
+    session = get_session()
+    if since is None:
+        rows = session.sql(f"""
+            {LOG_INDEX_PROJECTION}
+            WHERE DATETIME >= DATEADD(day, -{int(retention_days)}, CURRENT_TIMESTAMP())
+        """).to_pandas()
+    else:
+        rows = session.sql(f"""
+            {LOG_INDEX_PROJECTION}
+            WHERE DATETIME >= ?
+        """, (since.to_pydatetime(),)).to_pandas()
+    return prepare_log_rows(rows)
+
+
+def prepare_log_rows(df):
+    df['DATETIME'] = pd.to_datetime(df['DATETIME'])
+    return df
+
+
+def load_log_json_column(column, entry):
+    # Recherche par REQUEST_ID ; les lignes antérieures à cet identifiant sont retrouvées
+    # par (DATETIME, USERNAME, INPUT_TEXT)
+    session = get_session()
+    request_id = entry.get('REQUEST_ID')
+    if isinstance(request_id, str) and request_id:
+        rows = session.sql(f"""
+            SELECT {column} FROM CORTEX_DB.PUBLIC.CORTEX_LOGS WHERE REQUEST_ID = ? LIMIT 1
+        """, (request_id,)).collect()
+    else:
+        rows = session.sql(f"""
+            SELECT {column}
+            FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+            WHERE DATETIME = ? AND USERNAME = ? AND INPUT_TEXT = ?
+            LIMIT 1
+        """, (pd.Timestamp(entry['DATETIME']).to_pydatetime(), entry['USERNAME'], entry['INPUT_TEXT'])).collect()
+    return json.loads(rows[0][column]) if rows and rows[0][column] else None
+
+
+def load_log_output_json(entry):
+    return load_log_json_column('OUTPUT_JSON', entry)
+
+
+@st.cache_resource
+def get_log_search_index():
+    # Index inversé (question, SQL généré) partagé entre les sessions : un rafraîchissement
+    # ne coûte que les nouvelles lignes
+    return LogSearchIndex(retention_days=90, refresh_interval=60)
+
+
+@st.cache_resource
+def get_rollup_refresher():
+    # Les agrégats ne sont recalculés que sur les intervalles touchés depuis le dernier filigrane
+    return RollupRefresher(SnowflakeRollupBackend(get_session), overlap_minutes=5, refresh_interval=60)
+
+
+def keyword_condition(keys, retention_days):
+    # Lignes retrouvées par l'index : REQUEST_ID passés en un seul paramètre JSON ; les lignes
+    # antérieures à REQUEST_ID par (DATETIME, USERNAME, INPUT_TEXT), comme load_log_json_column
+    request_ids = [key for key in keys if isinstance(key, str)]
+    terms = ["REQUEST_ID IN (SELECT VALUE::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))"]
+    params = [json.dumps(request_ids)]
+    for when, username, _, input_text in (key for key in keys if not isinstance(key, str)):
+        terms.append("(COALESCE(REQUEST_ID, '') = '' AND DATETIME = ? AND USERNAME = ? AND INPUT_TEXT = ?)")
+        params += [pd.Timestamp(when).to_pydatetime(), username, input_text]
+    condition = (f"DATETIME >= DATEADD(day, -{int(retention_days)}, CURRENT_TIMESTAMP())"
+                 f" AND ({' OR '.join(terms)})")
+    return condition, params
+
+
+def build_log_filter(app_name, username=None, keyword=None):
+    conditions, params = ["APP_NAME = ?"], [app_name]
+    if username:
+        conditions.append("USERNAME = ?")
+        params.append(username)
+    if keyword:
+        index = get_log_search_index()
+        condition, keyword_params = keyword_condition(index.search(keyword, app_name, username), index.retention_days)
+        conditions.append(condition)
+        params += keyword_params
+    return " AND ".join(conditions), params
+
+
+def load_log_rows(app_name, username=None, keyword=None, page=None):
+    # Lignes de la table des logs, les plus récentes d'abord ; une page de LOG_PAGE_SIZE lignes si page
+    # est fourni (tri total : la pagination côté serveur reste stable d'une page à l'autre)
+    session = get_session()
+    where, params = build_log_filter(app_name, username, keyword)
+    limit = f"LIMIT {LOG_PAGE_SIZE} OFFSET {(int(page) - 1) * LOG_PAGE_SIZE}" if page else ""
+    log_df = session.sql(f"""
+        {LOG_PROJECTION}
+        WHERE {where}
+        ORDER BY DATETIME DESC, USERNAME, INPUT_TEXT
+        {limit}
+    """, params).to_pandas()
+    return prepare_log_rows(log_df)
+
+
+# watermark : filigrane de l'index de recherche, dont dépend le résultat d'une recherche par mot-clé
+@st.cache_data(ttl=60)
+def load_log_page(app_name, username=None, keyword=None, watermark=None, page=1):
+    return load_log_rows(app_name, username, keyword, page)
+
+
+@st.cache_data(ttl=300)
+def load_app_names():
+    session = get_session()
+    rows = session.sql("SELECT DISTINCT APP_NAME FROM CORTEX_DB.PUBLIC.CORTEX_LOGS WHERE APP_NAME IS NOT NULL").collect()
+    return sorted(row['APP_NAME'] for row in rows)
+
+
+@st.cache_data(ttl=60)
+def load_log_aggregates(app_name, username=None, keyword=None, time_grain='DAY', watermark=None):
+    # KPI, requêtes par utilisateur et par intervalle de temps (granularité time_grain, liste blanche
+    # TIME_GRAINS) en une seule requête (GROUPING SETS) : sur le rollup journalier, sauf recherche
+    # par mot-clé (lignes de CORTEX_LOGS retrouvées par l'index, mêmes mesures que le rollup)
+    grain = time_grain if time_grain in TIME_GRAINS else 'DAY'
+    session = get_session()
+    where, params = build_log_filter(app_name, username, keyword)
+    if keyword:
+        source = """
+            SELECT USERNAME, APP_NAME, REQUEST_ID, DATETIME, INPUT_TEXT, DATETIME AS BUCKET_START,
+                1 AS REQUEST_COUNT,
+                ANALYST_TIME AS ELAPSED_SUM,
+                CASE WHEN ANALYST_TIME IS NULL THEN 0 ELSE 1 END AS ELAPSED_COUNT,
+                UNCACHED_RESOLUTION_TIME AS RESOLUTION_SUM,
+                CASE WHEN UNCACHED_RESOLUTION_TIME IS NULL THEN 0 ELSE 1 END AS RESOLUTION_COUNT
+            FROM (
+                SELECT *,
+                    CASE WHEN CACHED THEN NULL ELSE ELAPSED_TIME END AS ANALYST_TIME,
+                    CASE WHEN CACHED THEN NULL ELSE RESOLUTION_TIME END AS UNCACHED_RESOLUTION_TIME
+                FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+            )
+        """
+    else:
+        source = "SELECT * FROM CORTEX_DB.PUBLIC.CORTEX_LOGS_ROLLUP_DAILY"
+    agg_df = session.sql(f"""
+        SELECT USERNAME, DATE_TRUNC('{grain}', TO_DATE(BUCKET_START)) AS REQUEST_DAY,
+            GROUPING(USERNAME) AS G_USER, GROUPING(DATE_TRUNC('{grain}', TO_DATE(BUCKET_START))) AS G_DAY,
+            SUM(REQUEST_COUNT) AS REQUEST_COUNT,
+            SUM(ELAPSED_SUM) / NULLIF(SUM(COALESCE(ELAPSED_COUNT, REQUEST_COUNT)), 0) AS AVG_ELAPSED_TIME,
+            SUM(RESOLUTION_SUM) / NULLIF(SUM(RESOLUTION_COUNT), 0) AS AVG_RESOLUTION_TIME
+        FROM ({source})
+        WHERE {where}
+        GROUP BY GROUPING SETS ((USERNAME), (DATE_TRUNC('{grain}', TO_DATE(BUCKET_START))), ())
+    """, params).to_pandas()
+
+    totals = agg_df[(agg_df['G_USER'] == 1) & (agg_df['G_DAY'] == 1)]
+    kpis = totals.iloc[0] if not totals.empty else None
+    user_requests = agg_df[agg_df['G_USER'] == 0][['USERNAME', 'REQUEST_COUNT']]
+    user_requests = user_requests.rename(columns={'REQUEST_COUNT': 'count'}).sort_values('count', ascending=False)
+    requests_over_time = agg_df[agg_df['G_DAY'] == 0][['REQUEST_DAY', 'REQUEST_COUNT']]
+    requests_over_time = requests_over_time.rename(columns={'REQUEST_DAY': 'Date', 'REQUEST_COUNT': 'count'}).sort_values('Date')
+    return {
+        'total_requests': int(kpis['REQUEST_COUNT']) if kpis is not None else 0,
+        'avg_elapsed_time': float(kpis['AVG_ELAPSED_TIME'] or 0) if kpis is not None else 0.0,
+        'avg_resolution_time': float(kpis['AVG_RESOLUTION_TIME'] or 0) if kpis is not None else 0.0,
+        'user_requests': user_requests,
+        'requests_over_time': requests_over_time,
+    }
+
+# Dimensions et mesures de latence autorisées (listes blanches, injectées dans le SQL)
+LATENCY_METRICS = {
+    "Appel Analyst (ELAPSED_TIME)": "ELAPSED_TIME",
+    "Exécution SQL (SQL_TIME)": "SQL_TIME",
+    "Résolution totale (RESOLUTION_TIME)": "RESOLUTION_TIME",
+}
+# Dimension -> (rollup lu, expression de regroupement)
+LATENCY_DIMENSIONS = {
+    "Application": ("CORTEX_LOGS_ROLLUP_DAILY", "APP_NAME"),
+    "Modèle sémantique": ("CORTEX_LOGS_ROLLUP_DAILY", "YAML_FILE"),
+    "Heure de la journée": ("CORTEX_LOGS_ROLLUP_HOURLY", "HOUR(BUCKET_START)"),
+    "Utilisateur": ("CORTEX_LOGS_ROLLUP_DAILY", "USERNAME"),
+}
+# Mesure -> (compteur, maximum, sketch) dans les rollups (réponses du cache exclues des latences
+# Analyst et de résolution)
+LATENCY_ROLLUP_COLUMNS = {
+    "ELAPSED_TIME": ("ELAPSED_COUNT", "ELAPSED_MAX", "ELAPSED_SKETCH"),
+    "SQL_TIME": ("SQL_TIME_COUNT", "SQL_TIME_MAX", "SQL_TIME_SKETCH"),
+    "RESOLUTION_TIME": ("RESOLUTION_COUNT", "RESOLUTION_MAX", "RESOLUTION_SKETCH"),
+}
+# Mesures dont les réponses servies par le cache sont exclues (le SQL est exécuté dans tous les cas)
+CACHE_EXCLUDED_METRICS = ("ELAPSED_TIME", "RESOLUTION_TIME")
+HISTOGRAM_BUCKETS = 30
+
+
+def latency_condition(metric):
+    condition = f"{metric} IS NOT NULL"
+    if metric in CACHE_EXCLUDED_METRICS:
+        condition += " AND NOT COALESCE(CACHED, FALSE)"
+    return condition
+
+
+@st.cache_data(ttl=300)
+def load_latency_percentiles(metric, dimension, days):
+    # Percentiles fusionnés à partir des sketches des rollups (APPROX_PERCENTILE_COMBINE)
+    session = get_session()
+    rollup, expression = dimension
+    count_column, max_column, sketch_column = LATENCY_ROLLUP_COLUMNS[metric]
+    return session.sql(f"""
+        WITH combined AS (
+            SELECT {expression} AS DIMENSION,
+                SUM({count_column}) AS REQUEST_COUNT,
+                APPROX_PERCENTILE_COMBINE({sketch_column}) AS SKETCH,
+                MAX({max_column}) AS MAX_TIME
+            FROM CORTEX_DB.PUBLIC.{rollup}
+            WHERE BUCKET_START >= DATEADD(day, -{int(days)}, CURRENT_DATE())
+            AND {count_column} > 0
+            GROUP BY 1
+        )
+        SELECT DIMENSION, REQUEST_COUNT,
+            APPROX_PERCENTILE_ESTIMATE(SKETCH, 0.5) AS P50,
+            APPROX_PERCENTILE_ESTIMATE(SKETCH, 0.9) AS P90,
+            APPROX_PERCENTILE_ESTIMATE(SKETCH, 0.99) AS P99,
+            MAX_TIME
+        FROM combined
+        ORDER BY P90 DESC
+    """).to_pandas()
+
+
+@st.cache_data(ttl=300)
+def load_latency_histogram(metric, days):
+    # Histogramme calculé par Snowflake ; la borne haute est le p99 pour ne pas écraser la distribution
+    session = get_session()
+    return session.sql(f"""
+        WITH logs AS (
+            SELECT {metric} AS VALUE
+            FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+            WHERE DATETIME >= DATEADD(day, -{int(days)}, CURRENT_TIMESTAMP())
+            AND {latency_condition(metric)}
+        ),
+        bounds AS (
+            SELECT GREATEST(APPROX_PERCENTILE(VALUE, 0.99), 1) AS HIGH FROM logs
+        )
+        SELECT LEAST(WIDTH_BUCKET(VALUE, 0, bounds.HIGH, {HISTOGRAM_BUCKETS}), {HISTOGRAM_BUCKETS + 1}) AS BUCKET,
+            ANY_VALUE(bounds.HIGH) AS HIGH,
+            COUNT(*) AS REQUEST_COUNT
+        FROM logs, bounds
+        GROUP BY 1
+        ORDER BY 1
+    """).to_pandas()
+
+
+@st.cache_data(ttl=300)
+def load_slowest_requests(metric, days, limit=20):
+    session = get_session()
+    return session.sql(f"""
+        SELECT DATETIME, USERNAME, APP_NAME, YAML_FILE, INPUT_TEXT,
+            ELAPSED_TIME, SQL_TIME, RESOLUTION_TIME, CACHED, QUERY_ID, REQUEST_ID
+        FROM CORTEX_DB.PUBLIC.CORTEX_LOGS
+        WHERE DATETIME >= DATEADD(day, -{int(days)}, CURRENT_TIMESTAMP())
+        AND {latency_condition(metric)}
+        ORDER BY {metric} DESC
+        LIMIT {int(limit)}
+    """).to_pandas()
+
+
+def load_log_trace(entry):
+    return load_log_json_column('TRACE_JSON', entry)
+
+
+# Votes avec le nom de l'application (APP_ID du vote, ou à défaut celui du modèle sémantique pour
+# les votes plus anciens) : lignes brutes, lues uniquement pour la table de détail
+VOTE_PROJECTION = """
+    SELECT v.VOTE_ID, v.VOTE_USERNAME, v.QUESTION_TEXT, v.YAML_FILE, v.VOTE_VALUE,
+        v.VOTE_CREATED_AT, v.REQUEST_ID, a.APP_NAME
+    FROM CORTEX_DB.PUBLIC.CORTEX_VOTES v
+    LEFT JOIN (
+        SELECT CORTEX_YAML_FILE, MIN(TRY_TO_NUMBER(APP_ID)) AS APP_ID
+        FROM CORTEX_DB.PUBLIC.CORTEX_MODELS
+        GROUP BY CORTEX_YAML_FILE
+    ) m ON m.CORTEX_YAML_FILE = v.YAML_FILE
+    LEFT JOIN CORTEX_DB.PUBLIC.CORTEX_APPS a
+        ON TRY_TO_NUMBER(a.APP_ID) = COALESCE(v.APP_ID, m.APP_ID)
+"""
+VOTE_PAGE_SIZE = 100
+
+
+def build_vote_filter(app_name, username=None, keyword=None, user_column='USERNAME'):
+    conditions, params = ["APP_NAME = ?"], [app_name]
+    if username:
+        conditions.append(f"{user_column} = ?")
+        params.append(username)
+    if keyword:
+        conditions.append("QUESTION_TEXT ILIKE ?")
+        params.append(f"%{keyword}%")
+    return " AND ".join(conditions), params
+
+
+@st.cache_data(ttl=60)
+def load_vote_aggregates(app_name, username=None, keyword=None, time_grain='DAY'):
+    # KPI, votes par utilisateur et par intervalle de temps en une seule requête (GROUPING SETS) :
+    # sur le rollup journalier des votes, sauf recherche par mot-clé (texte des questions absent du rollup)
+    grain = time_grain if time_grain in TIME_GRAINS else 'DAY'
+    session = get_session()
+    where, params = build_vote_filter(app_name, username, keyword)
+    if keyword:
+        source = f"""
+            SELECT VOTE_USERNAME AS USERNAME, VOTE_CREATED_AT AS BUCKET_START, APP_NAME, QUESTION_TEXT,
+                1 AS VOTE_COUNT,
+                CASE WHEN VOTE_VALUE > 0 THEN 1 ELSE 0 END AS UP_VOTES,
+                CASE WHEN VOTE_VALUE < 0 THEN 1 ELSE 0 END AS DOWN_VOTES
+            FROM ({VOTE_PROJECTION})
+        """
+    else:
+        source = """
+            SELECT r.USERNAME, r.BUCKET_START, a.APP_NAME, r.VOTE_COUNT, r.UP_VOTES, r.DOWN_VOTES
+            FROM CORTEX_DB.PUBLIC.CORTEX_VOTES_ROLLUP_DAILY r
+            JOIN CORTEX_DB.PUBLIC.CORTEX_APPS a ON TRY_TO_NUMBER(a.APP_ID) = r.APP_ID
+        """
+    agg_df = session.sql(f"""
+        SELECT USERNAME, DATE_TRUNC('{grain}', TO_DATE(BUCKET_START)) AS VOTE_DAY,
+            GROUPING(USERNAME) AS G_USER, GROUPING(DATE_TRUNC('{grain}', TO_DATE(BUCKET_START))) AS G_DAY,
+            SUM(VOTE_COUNT) AS VOTE_COUNT,
+            SUM(UP_VOTES) AS UP_VOTES,
+            SUM(DOWN_VOTES) AS DOWN_VOTES
+        FROM ({source})
+        WHERE {where}
+        GROUP BY GROUPING SETS ((USERNAME), (DATE_TRUNC('{grain}', TO_DATE(BUCKET_START))), ())
+    """, params).to_pandas()
+
+    totals = agg_df[(agg_df['G_USER'] == 1) & (agg_df['G_DAY'] == 1)]
+    kpis = totals.iloc[0] if not totals.empty else None
+    user_votes = agg_df[agg_df['G_USER'] == 0][['USERNAME', 'VOTE_COUNT']]
+    user_votes = user_votes.rename(columns={'VOTE_COUNT': 'count'}).sort_values('count', ascending=False)
+    votes_over_time = agg_df[(agg_df['G_DAY'] == 0) & agg_df['VOTE_DAY'].notna()][['VOTE_DAY', 'VOTE_COUNT']]
+    votes_over_time = votes_over_time.rename(columns={'VOTE_DAY': 'Date', 'VOTE_COUNT': 'count'}).sort_values('Date')
+    return {
+        'total_votes': int(kpis['VOTE_COUNT'] or 0) if kpis is not None else 0,
+        'up_votes': int(kpis['UP_VOTES'] or 0) if kpis is not None else 0,
+        'down_votes': int(kpis['DOWN_VOTES'] or 0) if kpis is not None else 0,
+        'user_votes': user_votes,
+        'votes_over_time': votes_over_time,
+    }
+
+
+@st.cache_data(ttl=60)
+def load_top_voted_questions(app_name, username=None, keyword=None, limit=10):
+    # Regroupement côté serveur : seules les questions les plus votées sont rapatriées
+    session = get_session()
+    where, params = build_vote_filter(app_name, username, keyword, user_column='VOTE_USERNAME')
+    return session.sql(f"""
+        SELECT QUESTION_TEXT, COUNT(*) AS VOTE_COUNT
+        FROM ({VOTE_PROJECTION})
+        WHERE {where}
+        GROUP BY QUESTION_TEXT
+        ORDER BY VOTE_COUNT DESC, QUESTION_TEXT
+        LIMIT {int(limit)}
+    """, params).to_pandas()
+
+
+def load_vote_rows(app_name, username=None, keyword=None, page=None):
+    # Lignes brutes filtrées, les plus récentes d'abord ; une page de VOTE_PAGE_SIZE lignes si page est fourni
+    session = get_session()
+    where, params = build_vote_filter(app_name, username, keyword, user_column='VOTE_USERNAME')
+    limit = f"LIMIT {VOTE_PAGE_SIZE} OFFSET {(int(page) - 1) * VOTE_PAGE_SIZE}" if page else ""
+    vote_df = session.sql(f"""
+        SELECT * FROM ({VOTE_PROJECTION})
+        WHERE {where}
+        ORDER BY VOTE_CREATED_AT DESC NULLS LAST, VOTE_ID
+        {limit}
+    """, params).to_pandas()
+    vote_df['VOTE_VALUE'] = vote_df['VOTE_VALUE'].astype(int)
+    return vote_df
+
+
+@st.cache_data(ttl=60)
+def load_vote_page(app_name, username=None, keyword=None, page=1):
+    return load_vote_rows(app_name, username, keyword, page)
+
+
+@st.cache_data(ttl=60)
+def count_vote_rows(app_name, username=None, keyword=None):
+    # Nombre de lignes de la table de détail (votes sans date compris, absents des rollups)
+    session = get_session()
+    where, params = build_vote_filter(app_name, username, keyword, user_column='VOTE_USERNAME')
+    return session.sql(f"""
+        SELECT COUNT(*) AS VOTE_COUNT FROM ({VOTE_PROJECTION}) WHERE {where}
+    """, params).collect()[0]['VOTE_COUNT']
+
+
+@st.cache_data(ttl=60)
+def load_vote_satisfaction(app_name):
+    # Satisfaction par application et par modèle sémantique : jointure des votes sur REQUEST_ID
+    session = get_session()
+    satisfaction_df = session.sql("""
+        SELECT l.YAML_FILE, GROUPING(l.YAML_FILE) AS G_MODEL,
+            COUNT(*) AS VOTE_COUNT,
+            COUNT_IF(v.VOTE_VALUE > 0) AS UP_VOTES,
+            COUNT_IF(v.VOTE_VALUE < 0) AS DOWN_VOTES,
+            COUNT(DISTINCT v.REQUEST_ID) AS VOTED_REQUESTS
+        FROM CORTEX_DB.PUBLIC.CORTEX_VOTES v
+        JOIN CORTEX_DB.PUBLIC.CORTEX_LOGS l ON l.REQUEST_ID = v.REQUEST_ID
+        WHERE l.APP_NAME = ?
+        GROUP BY GROUPING SETS ((l.YAML_FILE), ())
+    """, (app_name,)).to_pandas()
+    satisfaction_df['SATISFACTION'] = satisfaction_df['UP_VOTES'] / satisfaction_df['VOTE_COUNT'].where(satisfaction_df['VOTE_COUNT'] > 0)
+    totals = satisfaction_df[satisfaction_df['G_MODEL'] == 1]
+    per_model = satisfaction_df[satisfaction_df['G_MODEL'] == 0].drop(columns=['G_MODEL']).sort_values('VOTE_COUNT', ascending=False)
+    return (totals.iloc[0] if not totals.empty else None), per_model
+
+
+TIME_GRAIN_LABELS = {'Jour': 'DAY', 'Semaine': 'WEEK', 'Mois': 'MONTH', 'Trimestre': 'QUARTER'}
+
+
+# Figures mises en cache par état des filtres : un rerun sans changement ne reconstruit aucun graphique.
+# watermark : filigrane de l'index de recherche, dont dépend le résultat d'une recherche par mot-clé
+@st.cache_data(ttl=60)
+def build_log_figures(app_name, username=None, keyword=None, time_grain='DAY', watermark=None):
+    aggregates = load_log_aggregates(app_name, username, keyword, time_grain, watermark)
+    fig_users = px.bar(aggregates['user_requests'],
+                    x='count', y='USERNAME',
+                    orientation='h',
+                    labels={'USERNAME':'Utilisateur', 'count':'Nombre de requêtes'})
+    fig_timeline = px.area(aggregates['requests_over_time'],
+                        x='Date', y='count',
+                        title="Évolution du nombre de requêtes dans le temps",
+                        labels={'Date':'Date', 'count':'Nombre de requêtes'})
+    return fig_users, fig_timeline
+
+
+@st.cache_data(ttl=60)
+def build_vote_figures(app_name, username=None, keyword=None, time_grain='DAY'):
+    aggregates = load_vote_aggregates(app_name, username, keyword, time_grain)
+
+    # Répartition des votes positifs et négatifs (graphique en anneau)
+    vote_counts = pd.DataFrame({'Vote': [1, -1], 'Count': [aggregates['up_votes'], aggregates['down_votes']]})
+    fig_votes = px.pie(vote_counts,
+                    values='Count',
+                    names='Vote',
+                    title="Répartition des votes 👍 et 👎",
+                    hole=0.4,  # Ceci ajoute le trou pour créer l'effet 'donut'
+                    color='Vote',
+                    color_discrete_map={1: 'lightblue', -1: 'darkred'})
+
+    # Top 10 des questions les plus votées (barres avec couleurs progressives)
+    top_questions = load_top_voted_questions(app_name, username, keyword)
+    fig_top_questions = px.bar(top_questions, x='QUESTION_TEXT', y='VOTE_COUNT',
+                            title="Top 10 des questions les plus votées",
+                            color='VOTE_COUNT',
+                            color_continuous_scale='Blues')
+    fig_top_questions.update_xaxes(tickangle=45, title_text="Question")
+    fig_top_questions.update_yaxes(title_text="Nombre de votes")
+
+    # Évolution des votes dans le temps (courbe avec zone d'ombre)
+    fig_vote_timeline = None
+    if not aggregates['votes_over_time'].empty:
+        fig_vote_timeline = px.area(aggregates['votes_over_time'],
+                                    x='Date', y='count',
+                                    title="Évolution du nombre de votes dans le temps",
+                                    labels={'Date':'Date', 'count':'Nombre de votes'})
+    return fig_votes, fig_top_questions, fig_vote_timeline
+
+
+def offer_csv_download(label, df, file_name, key, filter_state):
+    # Le CSV n'est généré qu'à la demande, et conservé tant que les filtres ne changent pas ;
+    # df peut être une fonction, les lignes n'étant alors chargées qu'au moment de l'export
+    exports = st.session_state.setdefault('csv_exports', {})
+    if st.button(f"Préparer l'export CSV ({label.lower()})", key=f'prepare_{key}'):
+        exports[key] = (filter_state, (df() if callable(df) else df).to_csv(index=False))
+    export = exports.get(key)
+    if export is not None and export[0] == filter_state:
+        st.download_button(
+            label=f"Télécharger les {label.lower()} (CSV)",
+            data=export[1],
+            file_name=file_name,
+            mime="text/csv",
+            key=f'download_{key}',
+        )
+
+
+def display_performance_tab():
+    st.markdown("<div class='custom-shadow'><h2>Performance</h2></div>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        metric_label = st.selectbox('Mesure', list(LATENCY_METRICS.keys()), key='perf_metric')
+    with col2:
+        dimension_label = st.selectbox('Répartition par', list(LATENCY_DIMENSIONS.keys()), key='perf_dimension')
+    with col3:
+        days = st.slider('Période (jours)', min_value=1, max_value=365, value=30, key='perf_days')
+    metric = LATENCY_METRICS[metric_label]
+
+    # Percentiles par dimension
+    percentiles = load_latency_percentiles(metric, LATENCY_DIMENSIONS[dimension_label], days)
+    if percentiles.empty:
+        st.info("Aucune mesure disponible sur la période.")
+        return
+    st.subheader(f"p50 / p90 / p99 par {dimension_label.lower()} (ms)")
+    st.dataframe(percentiles)
+    fig_percentiles = px.bar(percentiles.astype({'DIMENSION': str}),
+                             x='DIMENSION', y=['P50', 'P90', 'P99'],
+                             barmode='group',
+                             labels={'DIMENSION': dimension_label, 'value': 'Temps (ms)', 'variable': 'Percentile'})
+    st.plotly_chart(fig_percentiles)
+
+    # Distribution
+    histogram = load_latency_histogram(metric, days)
+    if not histogram.empty:
+        high = float(histogram['HIGH'].iloc[0])
+        bucket_width = high / HISTOGRAM_BUCKETS
+        histogram['Borne basse (ms)'] = (histogram['BUCKET'] - 1).clip(lower=0) * bucket_width
+        fig_histogram = px.bar(histogram, x='Borne basse (ms)', y='REQUEST_COUNT',
+                               title=f"Distribution de {metric_label} (dernier intervalle : au-delà du p99)",
+                               labels={'REQUEST_COUNT': 'Nombre de requêtes'})
+        st.plotly_chart(fig_histogram)
+
+    # Questions les plus lentes, avec le détail des spans de la trace
+    st.subheader("Questions les plus lentes")
+    slowest = load_slowest_requests(metric, days)
+    st.dataframe(slowest)
+    if not slowest.empty:
+        labels = ['—'] + [f"{row[metric]:.0f} ms · {row['APP_NAME']} · {row['INPUT_TEXT']}" for _, row in slowest.iterrows()]
+        selected = st.selectbox('Détail de la requête', range(len(labels)), format_func=lambda i: labels[i], key='perf_slow_entry')
+        if selected:
+            entry = slowest.iloc[selected - 1]
+            st.write(f"**Query id :** {entry['QUERY_ID']}")
+            trace = load_log_trace(entry)
+            if trace and trace.get('spans'):
+                spans_df = pd.DataFrame(trace['spans'])
+                fig_spans = px.bar(spans_df, x='duration_ms', y='name', base='start_ms', orientation='h',
+                                   hover_data=['attributes'],
+                                   labels={'duration_ms': 'Durée (ms)', 'name': 'Phase'})
+                st.plotly_chart(fig_spans)
+            else:
+                st.info("Aucune trace enregistrée pour cette requête.")
 
 def main():
 
@@ -47,223 +607,210 @@ def main():
     </style>
     """, unsafe_allow_html=True)
 
-    # Fonction pour charger les données des logs depuis Snowflake
-    @st.cache_data
-    def load_log_data():
-        session = get_active_session()
-        df = session.sql("SELECT * FROM CORTEX_DB.PUBLIC.CORTEX_LOGS").to_pandas()
-        df['output_parsed'] = df['OUTPUT_JSON'].apply(lambda x: json.loads(x) if pd.notnull(x) else {})
-        json_df = pd.json_normalize(df['output_parsed'])
-        json_df.columns = ['output_' + col for col in json_df.columns]
-        df = pd.concat([df, json_df], axis=1)
-        df['DATETIME'] = pd.to_datetime(df['DATETIME'])
-        return df
-
-    # Fonction pour charger les données des votes depuis Snowflake
-    @st.cache_data
-    def load_vote_data():
-        session = get_active_session()
-        vote_df = session.sql("SELECT * FROM CORTEX_DB.PUBLIC.CORTEX_VOTES").to_pandas()
-        vote_df['VOTE_VALUE'] = vote_df['VOTE_VALUE'].astype(int)
-        return vote_df
-
     # Fonction pour ajouter un nouveau bookmark
     def add_bookmark(app_id, question, lang="fr"):
-        session = get_active_session()
+        session = get_session()
         session.sql(f"""
             INSERT INTO CORTEX_DB.PUBLIC.CORTEX_BOOKMARKS (APP_ID, BK_USERNAME, BK_QUESTION, BK_LANG)
             VALUES ({app_id}, 'ALL', '{question}', '{lang}')
         """)
 
     # Charger les données
-    df = load_log_data()
-    vote_df = load_vote_data()
+    refresh_logs = st.button("🔄 Actualiser les logs")
+    if refresh_logs:
+        load_app_names.clear()
+        load_log_aggregates.clear()
+        load_log_page.clear()
+        load_latency_percentiles.clear()
+        build_log_figures.clear()
+        load_vote_aggregates.clear()
+        load_vote_satisfaction.clear()
+        build_vote_figures.clear()
+        load_top_voted_questions.clear()
+        load_vote_page.clear()
+        count_vote_rows.clear()
+    if get_rollup_refresher().refresh_if_stale(force=refresh_logs):
+        load_log_aggregates.clear()
+        load_latency_percentiles.clear()
+        build_log_figures.clear()
+        load_vote_aggregates.clear()
+        build_vote_figures.clear()
 
     # Récupérer les noms des applications
-    apps = sorted(df['APP_NAME'].unique().tolist())
-
-    # Onglets pour chaque application avec icône
-    app_tabs = st.tabs([f"🤖 {app}" for app in apps])
-
-    # Boucle sur chaque application pour afficher les logs et les votes
-    for i, app in enumerate(apps):
-        with app_tabs[i]:
-            # Ajouter une section avec une ombre pour les logs
-            st.markdown(f"<div class='custom-shadow'><h2>Logs pour {app}</h2></div>", unsafe_allow_html=True)
-            
-            # Filtrer les logs pour l'application sélectionnée
-            app_df = df[df['APP_NAME'] == app]
-
-            # Filtres pour les logs
-            col1, col2 = st.columns(2)
-            with col1:
-                users = ['Tous'] + sorted(app_df['USERNAME'].unique().tolist())
-                selected_user = st.selectbox('Filtrer par utilisateur', users, key=f'user_{app}')
-            with col2:
-                keyword = st.text_input('Rechercher un mot-clé', key=f'keyword_{app}')
-
-            # Appliquer les filtres aux logs
-            filtered_df = app_df.copy()
-            if selected_user != 'Tous':
-                filtered_df = filtered_df[filtered_df['USERNAME'] == selected_user]
-            if keyword:
-                columns_to_search = ['INPUT_TEXT', 'OUTPUT_JSON'] + [col for col in filtered_df.columns if col.startswith('output_')]
-                mask = filtered_df[columns_to_search].astype(str).apply(lambda x: x.str.contains(keyword, case=False)).any(axis=1)
-                filtered_df = filtered_df[mask]
-            # Afficher les logs filtrés
-            all_columns = filtered_df.columns.tolist()
-            default_columns = ['DATETIME', 'USERNAME', 'APP_NAME', 'INPUT_TEXT', 'ELAPSED_TIME']
-            output_columns = [col for col in all_columns if col.startswith('output_')]
-            selected_columns = st.multiselect('Sélectionner les colonnes à afficher', all_columns, default=default_columns + output_columns[:5], key=f'columns_{app}')
-
-            st.write(f"Nombre d'entrées : {len(filtered_df)}")
-            st.dataframe(filtered_df[selected_columns])
-
-            # Calculer le nombre de requêtes par utilisateur
-            user_requests = filtered_df['USERNAME'].value_counts().reset_index()
-            user_requests.columns = ['USERNAME', 'count']  # Renommer les colonnes correctement
-
-            # Visualisation pour les logs
-            st.subheader("Visualisations des Logs")
-            
-            # Trois indicateurs côte à côte
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                # Indicateur pour le total des requêtes
-                total_requests = user_requests['count'].sum()  # Calculer le total des requêtes
-                st.markdown(f"""
-                <div class='kpi-box'>
-                    <div class='kpi-value'>{total_requests}</div>
-                    <div class='kpi-title'>Total Requêtes</div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-            with col2:
-                # Indicateur pour le temps d'exécution moyen (converti en secondes)
-                avg_execution_time_sec = filtered_df['ELAPSED_TIME'].mean() / 1000  # Convertir de ms en secondes
-                st.markdown(f"""
-                <div class='kpi-box'>
-                    <div class='kpi-value'>{avg_execution_time_sec:.2f} s</div>
-                    <div class='kpi-title'>Temps d'exécution moyen</div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col3:
-                # Gérer les valeurs de RESOLUTION_TIME sans null
-                if 'RESOLUTION_TIME' in filtered_df.columns:
-                    avg_resolution_time = filtered_df['RESOLUTION_TIME'].mean() / 1000  # Convertir en secondes
-                else:
-                    avg_resolution_time = 0
-            
-                st.markdown(f"""
-                <div class='kpi-box'>
-                    <div class='kpi-value'>{avg_resolution_time:.2f} s</div>
-                    <div class='kpi-title'>Temps de résolution moyen</div>
-                </div>
-                """, unsafe_allow_html=True)
-
-            
-            # Graphique du nombre de requêtes par utilisateur en bas
-            st.subheader("Nombre de requêtes par utilisateur")
-            fig_users = px.bar(user_requests, 
-                            x='count', y='USERNAME', 
-                            orientation='h',
-                            labels={'USERNAME':'Utilisateur', 'count':'Nombre de requêtes'})
-            st.plotly_chart(fig_users)
-
-            # Graphique 3 : Évolution du nombre de requêtes dans le temps (courbe avec zone d'ombre)
-            filtered_df['Date'] = filtered_df['DATETIME'].dt.date
-            requests_over_time = filtered_df.groupby('Date').size().reset_index(name='count')
-            fig_timeline = px.area(requests_over_time, 
-                                x='Date', y='count', 
-                                title="Évolution du nombre de requêtes dans le temps",
-                                labels={'Date':'Date', 'count':'Nombre de requêtes'})
-            st.plotly_chart(fig_timeline)
-
-            # Option pour télécharger les logs filtrés
-            if not filtered_df.empty:
-                csv = filtered_df[selected_columns].to_csv(index=False)
-                st.download_button(
-                    label="Télécharger les données filtrées (CSV)",
-                    data=csv,
-                    file_name=f"cortex_logs_{app}.csv",
-                    mime="text/csv",
-                )
-
-            # Ajouter une section avec une ombre pour les votes
-            st.markdown(f"<div class='custom-shadow'><h2>Votes pour {app}</h2></div>", unsafe_allow_html=True)
-
-            # Afficher les votes sans lien avec l'application pour l'instant
-            filtered_vote_df = vote_df.copy()
-
-            # Filtres pour les votes
-            vote_users = ['Tous'] + sorted(filtered_vote_df['VOTE_USERNAME'].unique().tolist())
-            selected_vote_user = st.selectbox('Filtrer par utilisateur (votes)', vote_users, key=f'vote_user_{app}')
-            vote_keyword = st.text_input('Rechercher un mot-clé dans les questions', key=f'vote_keyword_{app}')
-
-            # Appliquer les filtres aux votes
-            if selected_vote_user != 'Tous':
-                filtered_vote_df = filtered_vote_df[filtered_vote_df['VOTE_USERNAME'] == selected_vote_user]
-            if vote_keyword:
-                filtered_vote_df = filtered_vote_df[filtered_vote_df['QUESTION_TEXT'].str.contains(vote_keyword, case=False)]
-
-            # Afficher les votes filtrés
-            st.write(f"Nombre de votes : {len(filtered_vote_df)}")
-            st.dataframe(filtered_vote_df)
-
-            # Visualisations pour les votes
-            # Graphique 1 : Répartition des votes positifs et négatifs (Graphique en anneau)
-            vote_counts = filtered_vote_df['VOTE_VALUE'].value_counts().reset_index()
-            vote_counts.columns = ['Vote', 'Count']
-            
-            # Utiliser un pie chart avec un trou au centre pour créer un graphique en anneau
-            fig_votes = px.pie(vote_counts, 
-                            values='Count', 
-                            names='Vote', 
-                            title="Répartition des votes 👍 et 👎",
-                            hole=0.4,  # Ceci ajoute le trou pour créer l'effet 'donut'
-                            color='Vote', 
-                            color_discrete_map={1: 'lightblue', -1: 'darkred'})
-            
-            st.plotly_chart(fig_votes)
-
-            # Graphique 2 : Top 10 des questions les plus votées (barres avec couleurs progressives)
-            top_questions = filtered_vote_df.groupby('QUESTION_TEXT')['VOTE_VALUE'].count().sort_values(ascending=False).head(10)
-            fig_top_questions = px.bar(top_questions, x=top_questions.index, y=top_questions.values,
-                                    title="Top 10 des questions les plus votées",
-                                    color=top_questions.values,
-                                    color_continuous_scale='Blues')
-            fig_top_questions.update_xaxes(tickangle=45, title_text="Question")
-            fig_top_questions.update_yaxes(title_text="Nombre de votes")
-            st.plotly_chart(fig_top_questions)
-
-            # Graphique 3 : Évolution des votes dans le temps (courbe avec zone d'ombre)
-            if 'VOTE_ID' in filtered_vote_df.columns:
-                filtered_vote_df['Date'] = pd.to_datetime(filtered_vote_df['VOTE_ID']).dt.date
-                votes_over_time = filtered_vote_df.groupby('Date').size().reset_index(name='count')
-                fig_vote_timeline = px.area(votes_over_time, 
-                                            x='Date', y='count', 
-                                            title="Évolution du nombre de votes dans le temps",
-                                            labels={'Date':'Date', 'count':'Nombre de votes'})
-                st.plotly_chart(fig_vote_timeline)
-
-            # Option pour télécharger les votes filtrés
-            if not filtered_vote_df.empty:
-                vote_csv = filtered_vote_df.to_csv(index=False)
-                st.download_button(
-                    label=f"Télécharger les données de votes filtrées (CSV)",
-                    data=vote_csv,
-                    file_name=f"cortex_votes_{app}.csv",
-                    mime="text/csv",
-                )
-
-            # Bouton pour ajouter un bookmark
-            question = st.text_input("Entrer la question pour le bookmark", key=f'bk_question_{app}')
-            if st.button("Ajouter un bookmark", key=f'add_bookmark_{app}'):
-                app_id = 1  # You can adjust this to pull from a variable or external data source
-                add_bookmark(app_id, question)
-                st.success(f"Bookmark ajouté pour {app} avec la question : {question}")
+    apps = load_app_names()
+
+    # Sélecteur de vue : seule la vue choisie est construite à chaque rerun (contrairement à st.tabs)
+    views = [f"🤖 {app}" for app in apps] + ["⏱️ Performance"]
+    view = st.radio('Vue', views, horizontal=True, key='monitoring_view', label_visibility='collapsed')
+    if view == views[-1]:
+        display_performance_tab()
+        return
+    app = apps[views.index(view)]
+
+
+    # Ajouter une section avec une ombre pour les logs
+    st.markdown(f"<div class='custom-shadow'><h2>Logs pour {app}</h2></div>", unsafe_allow_html=True)
+    
+    # Filtres pour les logs (liste des utilisateurs issue de l'agrégat non filtré)
+    col1, col2 = st.columns(2)
+    with col1:
+        users = ['Tous'] + sorted(load_log_aggregates(app)['user_requests']['USERNAME'].dropna().tolist())
+        selected_user = st.selectbox('Filtrer par utilisateur', users, key=f'user_{app}')
+    with col2:
+        keyword = st.text_input('Rechercher un mot-clé', key=f'keyword_{app}')
+
+    # KPI, graphiques et chaque page de la table sont lus côté serveur : sur le rollup sans mot-clé ;
+    # avec un mot-clé, sur les lignes de la fenêtre de rétention dont l'index renvoie les clés
+    # (question et SQL généré), seule règle de correspondance pour la table, les KPI et les graphiques.
+    # L'index n'est alimenté que lorsqu'un mot-clé est saisi.
+    log_filters = (app, selected_user if selected_user != 'Tous' else None, keyword or None)
+    search_index = get_log_search_index()
+    if keyword:
+        search_index.refresh(fetch_index_rows, force=refresh_logs)
+    watermark = search_index.watermark if keyword else None
+    aggregates = load_log_aggregates(*log_filters, 'DAY', watermark)
+
+    page_count = max(1, -(-aggregates['total_requests'] // LOG_PAGE_SIZE))
+    page = st.number_input('Page', min_value=1, max_value=page_count, value=1, step=1, key=f'log_page_{app}')
+    page_df = load_log_page(*log_filters, watermark, page)
+
+    # Afficher les logs filtrés
+    all_columns = page_df.columns.tolist()
+    default_columns = ['DATETIME', 'USERNAME', 'APP_NAME', 'INPUT_TEXT', 'ELAPSED_TIME']
+    output_columns = [col for col in all_columns if col.startswith('output_')]
+    selected_columns = st.multiselect('Sélectionner les colonnes à afficher', all_columns, default=default_columns + output_columns[:5], key=f'columns_{app}')
+
+    if keyword:
+        st.write(f"Nombre d'entrées correspondant à « {keyword} » sur les {search_index.retention_days} derniers jours : "
+                 f"{aggregates['total_requests']} (page {page}/{page_count})")
+    else:
+        st.write(f"Nombre d'entrées : {aggregates['total_requests']} (page {page}/{page_count})")
+    st.dataframe(page_df[selected_columns])
+
+    # Correspondances surlignées pour la page affichée
+    if keyword and not page_df.empty:
+        terms = tokenize(keyword)
+        with st.expander("Correspondances", expanded=True):
+            for _, row in page_df.iterrows():
+                sql_excerpt = snippet(row.get('output_sql'), terms)
+                st.markdown(
+                    f"<small>{row['DATETIME']} · {html.escape(str(row['USERNAME']))}</small><br>{highlight(row['INPUT_TEXT'], terms)}"
+                    + (f"<br><code>{sql_excerpt}</code>" if sql_excerpt else ""),
+                    unsafe_allow_html=True)
+
+    # JSON complet chargé uniquement pour l'entrée choisie
+    with st.expander("Détail d'une entrée (JSON complet)"):
+        entry_labels = ['—'] + [f"{row['DATETIME']} · {row['USERNAME']} · {row['INPUT_TEXT']}" for _, row in page_df.iterrows()]
+        entry_index = st.selectbox('Entrée', range(len(entry_labels)), format_func=lambda i: entry_labels[i], key=f'log_entry_{app}')
+        if entry_index:
+            entry = page_df.iloc[entry_index - 1]
+            st.json(load_log_output_json(entry))
+
+    # Visualisation pour les logs
+    st.subheader("Visualisations des Logs")
+    
+    # Trois indicateurs côte à côte
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        # Indicateur pour le total des requêtes
+        total_requests = aggregates['total_requests']
+        st.markdown(f"""
+        <div class='kpi-box'>
+            <div class='kpi-value'>{total_requests}</div>
+            <div class='kpi-title'>Total Requêtes</div>
+        </div>
+        """, unsafe_allow_html=True)
+        
+    with col2:
+        # Indicateur pour le temps d'exécution moyen (converti en secondes)
+        avg_execution_time_sec = aggregates['avg_elapsed_time'] / 1000  # Convertir de ms en secondes
+        st.markdown(f"""
+        <div class='kpi-box'>
+            <div class='kpi-value'>{avg_execution_time_sec:.2f} s</div>
+            <div class='kpi-title'>Temps d'exécution moyen</div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    with col3:
+        avg_resolution_time = aggregates['avg_resolution_time'] / 1000  # Convertir en secondes
+        st.markdown(f"""
+        <div class='kpi-box'>
+            <div class='kpi-value'>{avg_resolution_time:.2f} s</div>
+            <div class='kpi-title'>Temps de résolution moyen</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    
+    # Granularité des séries temporelles : automatique selon l'historique, « Jour » pour la pleine résolution
+    grain_label = st.selectbox('Granularité des graphiques temporels', ['Auto'] + list(TIME_GRAIN_LABELS),
+                               key=f'time_grain_{app}')
+    if grain_label == 'Auto':
+        history = load_log_aggregates(app)['requests_over_time']
+        span_days = (pd.Timestamp(history['Date'].max()) - pd.Timestamp(history['Date'].min())).days if not history.empty else 0
+        time_grain = choose_time_grain(span_days)
+    else:
+        time_grain = TIME_GRAIN_LABELS[grain_label]
+
+    # Graphique du nombre de requêtes par utilisateur, puis évolution dans le temps
+    fig_users, fig_timeline = build_log_figures(*log_filters, time_grain, watermark)
+    st.subheader("Nombre de requêtes par utilisateur")
+    st.plotly_chart(fig_users)
+    st.plotly_chart(fig_timeline)
+
+    # Option pour télécharger les logs filtrés (chargés uniquement à l'export)
+    if aggregates['total_requests']:
+        offer_csv_download("Données filtrées", lambda: load_log_rows(*log_filters)[selected_columns],
+                           f"cortex_logs_{app}.csv", f'logs_{app}', log_filters + (tuple(selected_columns), watermark))
+
+    # Ajouter une section avec une ombre pour les votes
+    st.markdown(f"<div class='custom-shadow'><h2>Votes pour {app}</h2></div>", unsafe_allow_html=True)
+
+    # Satisfaction de l'application et de chacun de ses modèles (votes reliés aux requêtes journalisées)
+    satisfaction, model_satisfaction = load_vote_satisfaction(app)
+    if satisfaction is not None and satisfaction['VOTE_COUNT']:
+        st.markdown(f"""
+        <div class='kpi-box'>
+            <div class='kpi-value'>{satisfaction['SATISFACTION']:.0%}</div>
+            <div class='kpi-title'>Satisfaction ({int(satisfaction['VOTE_COUNT'])} votes sur {int(satisfaction['VOTED_REQUESTS'])} réponses)</div>
+        </div>
+        """, unsafe_allow_html=True)
+        st.dataframe(model_satisfaction)
+
+    # Filtres pour les votes de l'application (liste des utilisateurs issue de l'agrégat non filtré)
+    vote_users = ['Tous'] + sorted(load_vote_aggregates(app)['user_votes']['USERNAME'].dropna().tolist())
+    selected_vote_user = st.selectbox('Filtrer par utilisateur (votes)', vote_users, key=f'vote_user_{app}')
+    vote_keyword = st.text_input('Rechercher un mot-clé dans les questions', key=f'vote_keyword_{app}')
+    vote_filters = (app, selected_vote_user if selected_vote_user != 'Tous' else None, vote_keyword or None)
+    vote_aggregates = load_vote_aggregates(*vote_filters, time_grain)
+
+    # Table de détail paginée côté serveur (seul usage des lignes brutes de CORTEX_VOTES)
+    vote_rows = count_vote_rows(*vote_filters)
+    vote_page_count = max(1, -(-vote_rows // VOTE_PAGE_SIZE))
+    vote_page = st.number_input('Page', min_value=1, max_value=vote_page_count, value=1, step=1, key=f'vote_page_{app}')
+    st.write(f"Nombre de votes : {vote_aggregates['total_votes']} "
+             f"({vote_aggregates['up_votes']} 👍, {vote_aggregates['down_votes']} 👎 ; page {vote_page}/{vote_page_count})")
+    st.dataframe(load_vote_page(*vote_filters, vote_page))
+
+    # Visualisations pour les votes (anneau, top 10 des questions, évolution dans le temps)
+    fig_votes, fig_top_questions, fig_vote_timeline = build_vote_figures(*vote_filters, time_grain)
+    st.plotly_chart(fig_votes)
+    st.plotly_chart(fig_top_questions)
+    if fig_vote_timeline is not None:
+        st.plotly_chart(fig_vote_timeline)
+
+    # Option pour télécharger les votes filtrés (chargés uniquement à l'export)
+    if vote_rows:
+        offer_csv_download("Données de votes filtrées", lambda: load_vote_rows(*vote_filters), f"cortex_votes_{app}.csv",
+                           f'votes_{app}', vote_filters)
+
+    # Bouton pour ajouter un bookmark
+    question = st.text_input("Entrer la question pour le bookmark", key=f'bk_question_{app}')
+    if st.button("Ajouter un bookmark", key=f'add_bookmark_{app}'):
+        app_id = 1  # You can adjust this to pull from a variable or external data source
+        add_bookmark(app_id, question)
+        st.success(f"Bookmark ajouté pour {app} avec la question : {question}")
 
 if __name__ == "__main__":
-    main()
+    with profile_rerun("monitoring"):
+        main()
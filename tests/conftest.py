@@ -0,0 +1,8 @@
+import pytest
+from common.local_backend import LocalBackend
+
+
+@pytest.fixture
+def local_backend():
+    # Base SQLite en mémoire créée à partir du script de configuration, sans données de démonstration
+    return LocalBackend(seed=False, analyst_latency=0)
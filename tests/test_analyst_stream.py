@@ -0,0 +1,90 @@
+import json
+import pytest
+from common.analyst_stream import AnalystStreamParser, JsonResponseParser, iter_sse_events, open_analyst_stream, streaming_enabled
+from common.fake_analyst_server import analyst_payload, canned_content, format_sse, start_fake_server, stream_events
+
+
+def sse_lines(content, request_id="req-1"):
+    text = "".join(format_sse(event, data) for event, data in stream_events(content, request_id))
+    return text.splitlines(keepends=True)
+
+
+def test_iter_sse_events_handles_bytes_crlf_and_multiline_data():
+    lines = [
+        b"event: status\r\n", b'data: {"status": "ok"}\r\n', b"\r\n",
+        ": commentaire ignoré\n",
+        'data: {"a":\n', 'data: 1}\n', "\n",
+        "event: done\n", "data: {}\n",
+    ]
+    assert list(iter_sse_events(lines)) == [("status", {"status": "ok"}), ("message", {"a": 1}), ("done", {})]
+
+
+def test_stream_is_rebuilt_into_the_non_streamed_response():
+    content = canned_content("Combien de médailles ?")
+    events = list(AnalystStreamParser().parse(sse_lines(content)))
+
+    kinds = [kind for kind, _, _ in events]
+    assert kinds[0] == "status" and kinds[-1] == "done"
+    assert [value["type"] for kind, _, value in events if kind == "block_done"] == ["text", "sql", "suggestions"]
+    # Le texte est rendu au fil de l'eau, chaque fragment cumulant les précédents
+    deltas = [value for kind, _, value in events if kind == "text_delta"]
+    assert len(deltas) > 1 and all(content[0]["text"].startswith(delta) for delta in deltas)
+    assert deltas[-1] == content[0]["text"]
+
+    response = events[-1][2]
+    assert response["message"]["content"] == content
+    assert response["request_id"] == "req-1"
+
+
+def test_sql_block_is_done_before_the_suggestions_arrive():
+    # Le SQL peut être lancé (préchargement) dès la fin de son bloc
+    events = list(AnalystStreamParser().parse(sse_lines(canned_content("q"))))
+    sql_done = next(i for i, (kind, _, value) in enumerate(events) if kind == "block_done" and value["type"] == "sql")
+    suggestions_done = next(i for i, (kind, _, value) in enumerate(events)
+                            if kind == "block_done" and value["type"] == "suggestions")
+    assert sql_done < suggestions_done
+
+
+def test_error_event_raises():
+    lines = [format_sse("status", {"status": "interpreting_question"}),
+             format_sse("error", {"code": "390", "message": "Modèle introuvable"})]
+    with pytest.raises(RuntimeError, match="390 Modèle introuvable"):
+        list(AnalystStreamParser().parse("".join(lines).splitlines()))
+
+
+def test_json_parser_yields_blocks_then_the_body():
+    body = analyst_payload(canned_content("q"), "req-2")
+    events = list(JsonResponseParser().parse([json.dumps(body)]))
+    assert [value["type"] for kind, _, value in events[:-1]] == ["text", "sql", "suggestions"]
+    assert events[-1] == ("done", None, body)
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    responses = {"Question test": [{"type": "text", "text": "Réponse « accentuée » sur plusieurs fragments"}]}
+    server, url = start_fake_server(first_token_delay=0, chunk_delay=0, responses=responses)
+    monkeypatch.setenv("CORTEX_ANALYST_URL", url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("prompt", ["Question test", "Combien de médailles ?"])
+def test_stream_from_the_fake_server_over_http(fake_server, prompt):
+    body = {"messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}], "stream": True}
+    events = list(AnalystStreamParser().parse(open_analyst_stream(body)))
+    response = events[-1][2]
+    expected = fake_server.RequestHandlerClass.responses.get(prompt) or canned_content(prompt)
+    assert response["message"]["content"] == expected
+    assert response["request_id"]
+
+
+def test_streaming_requires_the_direct_http_transport(monkeypatch):
+    monkeypatch.delenv("CORTEX_ANALYST_URL", raising=False)
+    monkeypatch.setenv("CORTEX_ANALYST_STREAMING", "1")
+    # Streamlit in Snowflake : le flux arrive en une fois, le mode streamé reste désactivé
+    assert not streaming_enabled()
+    monkeypatch.setenv("CORTEX_ANALYST_URL", "http://localhost:8765")
+    assert streaming_enabled()
+    monkeypatch.setenv("CORTEX_ANALYST_STREAMING", "0")
+    assert not streaming_enabled()
@@ -0,0 +1,76 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from common.downsample import choose_time_grain, downsample_frame, lttb, minmax_indices
+
+
+def noisy_series(length, spike_at=None):
+    rng = np.random.default_rng(0)
+    y = np.sin(np.linspace(0, 20, length)) + rng.normal(0, 0.05, length)
+    if spike_at is not None:
+        y[spike_at] = 50.0
+    return np.arange(length), y
+
+
+@pytest.mark.parametrize("threshold", [3, 10, 500])
+def test_lttb_keeps_the_ends_and_returns_the_threshold(threshold):
+    x, y = noisy_series(5000)
+    selected = lttb(x, y, threshold)
+    assert len(selected) == threshold
+    assert selected[0] == 0 and selected[-1] == len(y) - 1
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    x, y = noisy_series(5000, spike_at=2345)
+    assert 2345 in lttb(x, y, 100)
+
+
+def test_lttb_returns_everything_when_short():
+    x, y = noisy_series(50)
+    assert list(lttb(x, y, 50)) == list(range(50))
+    assert list(lttb(x, y, 2)) == list(range(50))
+
+
+def test_minmax_keeps_the_extremes_of_each_column():
+    rng = np.random.default_rng(1)
+    values = rng.normal(0, 1, (3000, 2))
+    values[1234, 0], values[2222, 1] = 99.0, -99.0
+    values[10, 1] = np.nan
+    selected = minmax_indices(values, 20)
+    assert {0, 1234, 2222, 2999} <= set(selected)
+    assert len(selected) <= 2 * 2 * 20 + 2
+
+
+def test_short_frame_is_unchanged():
+    df = pd.DataFrame({"v": range(10)})
+    assert downsample_frame(df, max_points=100) is df
+
+
+def test_date_object_index_is_downsampled_in_order():
+    start = datetime.date(2020, 1, 1)
+    dates = [start + datetime.timedelta(days=i) for i in range(2000)]
+    df = pd.DataFrame({"v": noisy_series(2000)[1]}, index=pd.Index(dates[::-1], dtype=object))
+    result = downsample_frame(df, max_points=200)
+    assert len(result) == 200
+    assert result.index.is_monotonic_increasing
+    assert result.index[0] == pd.Timestamp(start)
+
+
+def test_unorderable_index_is_left_alone():
+    df = pd.DataFrame({"v": range(2000)}, index=[f"app {i}" for i in range(2000)])
+    assert downsample_frame(df, max_points=100) is df
+
+
+def test_multi_column_frame_uses_minmax():
+    df = pd.DataFrame({"a": noisy_series(4000)[1], "b": noisy_series(4000, spike_at=17)[1]})
+    result = downsample_frame(df, max_points=400)
+    assert len(result) <= 402
+    assert 17 in result.index
+
+
+@pytest.mark.parametrize("span_days, grain", [(30, "DAY"), (180, "DAY"), (365, "WEEK"), (5 * 365, "MONTH"),
+                                              (100 * 365, "QUARTER")])
+def test_choose_time_grain(span_days, grain):
+    assert choose_time_grain(span_days) == grain
@@ -0,0 +1,89 @@
+import io
+import json
+import os
+from PIL import Image
+from common.image_service import ImageService
+
+
+def encode(mode, color, file_format="PNG"):
+    output = io.BytesIO()
+    Image.new(mode, (300, 200), color).save(output, format=file_format)
+    return output.getvalue()
+
+
+STAGE_FILES = {
+    "@db.schema.stage/rgb.png": encode("RGB", (255, 0, 0)),
+    "@db.schema.stage/cmyk.jpg": encode("CMYK", (0, 0, 0, 255), "JPEG"),
+}
+
+
+def fetch(session, stage_path):
+    return STAGE_FILES[stage_path]
+
+
+def version(session, stage_path):
+    return None
+
+
+def read_index(cache_dir):
+    with open(os.path.join(cache_dir, "index.json")) as index_file:
+        return json.load(index_file)
+
+
+def test_thumbnails_are_resized_and_cmyk_is_converted(tmp_path):
+    service = ImageService(str(tmp_path), fetch=fetch, version=version)
+    images = service.get_many(None, list(STAGE_FILES), (100, 100))
+    for data in images.values():
+        image = Image.open(io.BytesIO(data))
+        assert image.format == "PNG" and image.mode == "RGB" and image.size == (100, 67)
+
+
+def test_index_is_merged_between_processes_sharing_the_directory(tmp_path):
+    first = ImageService(str(tmp_path), fetch=fetch, version=version)
+    second = ImageService(str(tmp_path), fetch=fetch, version=version)
+    first.get(None, "@db.schema.stage/rgb.png", (100, 100))
+    second.get(None, "@db.schema.stage/cmyk.jpg", (50, 50))
+    assert len(read_index(tmp_path)) == 2
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    # Une invalidation n'est pas annulée par la fusion avec l'index sur disque
+    first.invalidate("@db.schema.stage/cmyk.jpg")
+    assert list(read_index(tmp_path)) == ["@db.schema.stage/rgb.png|100x100|fit"]
+    second.invalidate()
+    assert read_index(tmp_path) == {}
+
+
+def test_cached_thumbnail_is_read_from_disk(tmp_path):
+    calls = []
+    ImageService(str(tmp_path), fetch=fetch, version=version).get(None, "@db.schema.stage/rgb.png", (100, 100))
+    restarted = ImageService(str(tmp_path), fetch=lambda session, path: calls.append(path), version=version)
+    assert restarted.get(None, "@db.schema.stage/rgb.png", (100, 100)) is not None
+    assert calls == []
+
+
+def test_a_logo_replaced_under_the_same_path_is_refetched(tmp_path):
+    files = {"@db.schema.stage/logo.png": encode("RGB", (255, 0, 0))}
+    versions = {"@db.schema.stage/logo.png": "md5-1|lundi"}
+    service = ImageService(str(tmp_path), fetch=lambda session, path: files[path],
+                           version=lambda session, path: versions[path], version_ttl=0)
+    first = service.get(None, "@db.schema.stage/logo.png", (100, 100))
+
+    files["@db.schema.stage/logo.png"] = encode("RGB", (0, 0, 255))
+    versions["@db.schema.stage/logo.png"] = "md5-2|mardi"
+    second = service.get(None, "@db.schema.stage/logo.png", (100, 100))
+    assert Image.open(io.BytesIO(second)).getpixel((0, 0)) == (0, 0, 255)
+    assert first != second
+    # La miniature de l'ancienne version est retirée de l'index
+    assert list(read_index(tmp_path)) == ["@db.schema.stage/logo.png|100x100|fit|md5-2|mardi"]
+
+
+def test_versions_are_listed_once_per_ttl(tmp_path):
+    calls = []
+    service = ImageService(str(tmp_path), fetch=fetch, version_ttl=3600,
+                           version=lambda session, path: calls.append(path) or "v1")
+    service.get(None, "@db.schema.stage/rgb.png", (100, 100))
+    service.get(None, "@db.schema.stage/rgb.png", (50, 50))
+    assert calls == ["@db.schema.stage/rgb.png"]
+    service.invalidate("@db.schema.stage/rgb.png")
+    service.get(None, "@db.schema.stage/rgb.png", (100, 100))
+    assert len(calls) == 2
@@ -0,0 +1,145 @@
+import hashlib
+import pandas as pd
+import pytest
+from common.local_backend import LocalAsyncJob, LocalBackend, translate
+from common.result_cache import ResultCursor
+
+
+def test_translate_strips_snowflake_syntax():
+    query = translate("SELECT x::NUMBER(38,0), CURRENT_TIMESTAMP() FROM CORTEX_DB.PUBLIC.T "
+                      "WHERE y ILIKE ? AND d >= DATEADD(day, -7, CURRENT_DATE())")
+    assert query == ("SELECT x, SF_CURRENT_TIMESTAMP() FROM T "
+                     "WHERE y LIKE ? AND d >= DATEADD('day', -7, SF_CURRENT_DATE())")
+
+
+def test_translate_rewrites_json_paths_and_filter():
+    query = translate("SELECT TRY_PARSE_JSON(OUTPUT_JSON):message:content AS c, "
+                      "FILTER(c, b -> b:type::STRING = 'sql')[0]:statement::STRING AS s FROM T")
+    assert "SF_JSON_PATH(OUTPUT_JSON, 'message.content')" in query
+    assert "SF_CONTENT_FIELD(c, 'sql', 'statement')" in query
+
+
+def test_translate_rewrites_flatten_to_json_each():
+    query = translate("SELECT 1 FROM T WHERE ID IN (SELECT VALUE::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))")
+    assert query == "SELECT 1 FROM T WHERE ID IN (SELECT VALUE FROM json_each(?))"
+
+
+def test_translate_expands_grouping_sets_with_numbered_parameters():
+    query = translate("SELECT APP, USERNAME, COUNT(*) AS N FROM T WHERE D >= ? "
+                      "GROUP BY GROUPING SETS ((APP), (USERNAME), ())")
+    assert query.count("UNION ALL") == 2
+    assert query.count("?1") == 3 and "?2" not in query
+
+
+@pytest.fixture
+def session(local_backend):
+    session = local_backend.session()
+    session.sql("CREATE TABLE T (APP TEXT, USERNAME TEXT, V INTEGER, D TEXT, J TEXT)").collect()
+    for i in range(1200):
+        session.sql("INSERT INTO T VALUES (?, ?, ?, ?, ?)", (
+            "A" if i % 3 else "B", f"U{i % 4}", i, f"2024-03-{1 + i % 28:02d} {i % 24:02d}:30:00",
+            '{"message": {"content": [{"type": "sql", "statement": "SELECT ' + str(i) + '"}]}}',
+        )).collect()
+    return session
+
+
+def test_grouping_sets_execute_with_parameters(session):
+    df = session.sql("""
+        SELECT APP, USERNAME, COUNT(*) AS N, GROUPING(USERNAME) AS G
+        FROM T WHERE V >= ?
+        GROUP BY GROUPING SETS ((APP), (USERNAME), ())
+    """, (600,)).to_pandas()
+    assert df.loc[df["APP"].isna() & df["USERNAME"].isna(), "N"].tolist() == [600]
+    assert df.loc[df["APP"].notna(), "N"].sum() == 600
+    assert df.loc[df["USERNAME"].notna(), "N"].sum() == 600
+    assert set(df.loc[df["APP"].notna(), "G"]) == {1}
+
+
+def test_json_path_and_filter_are_evaluated(session):
+    row = session.sql("""
+        SELECT FILTER(CONTENT, c -> c:type::STRING = 'sql')[0]:statement::STRING AS S
+        FROM (SELECT TRY_PARSE_JSON(J):message:content AS CONTENT FROM T WHERE V = 7)
+    """).collect()[0]
+    assert row["S"] == "SELECT 7"
+
+
+def test_date_functions(session):
+    row = session.sql("""
+        SELECT DATE_TRUNC('DAY', D) AS DAY, DATE_TRUNC('HOUR', D) AS HOUR, DATEADD(day, 3, D) AS LATER
+        FROM T WHERE V = 29
+    """).collect()[0]
+    assert pd.Timestamp(row["DAY"]) == pd.Timestamp("2024-03-02")
+    assert pd.Timestamp(row["HOUR"]) == pd.Timestamp("2024-03-02 05:00")
+    assert pd.Timestamp(row["LATER"]) == pd.Timestamp("2024-03-05 05:30")
+
+
+def test_async_job_yields_batches_and_supports_result_scan(session):
+    job = session.sql("SELECT V FROM T ORDER BY V").to_pandas_batches(block=False)
+    batches = list(job.result("pandas_batches"))
+    assert [len(batch) for batch in batches] == [LocalAsyncJob.BATCH_ROWS, LocalAsyncJob.BATCH_ROWS, 200]
+    assert batches[2]["V"].iloc[-1] == 1199
+
+    count = session.sql(f"SELECT COUNT(*) AS N FROM TABLE(RESULT_SCAN('{job.query_id}'))").collect()[0]["N"]
+    assert count == 1200
+    rejoined = session.create_async_job(job.query_id).result("pandas")
+    assert len(rejoined) == 1200
+
+
+def test_result_cursor_reads_pages_from_a_single_result(session):
+    job = session.sql("SELECT V FROM T ORDER BY V").to_pandas_batches(block=False)
+    cursor = ResultCursor(job.result("pandas_batches"), max_rows=1000, query_id=job.query_id)
+    assert cursor.read(0, 100)["V"].tolist() == list(range(100))
+    # Un seul lot lu pour la première page
+    assert cursor.fetched_rows == LocalAsyncJob.BATCH_ROWS and not cursor.exhausted
+    assert cursor.read(450, 100)["V"].tolist() == list(range(450, 550))
+    # Les lignes au-delà de max_rows ne sont jamais conservées
+    assert cursor.read(950, 100)["V"].tolist() == list(range(950, 1000))
+    assert cursor.fetched_rows == 1000
+    assert cursor.read(1000, 100).empty
+
+
+def test_result_cursor_on_a_short_result(session):
+    job = session.sql("SELECT V FROM T WHERE V < 10").to_pandas_batches(block=False)
+    cursor = ResultCursor(job.result("pandas_batches"), max_rows=1000)
+    assert len(cursor.read(0, 100)) == 10
+    assert cursor.exhausted
+
+
+def test_list_returns_the_stage_files_with_their_md5(tmp_path):
+    (tmp_path / "models").mkdir()
+    (tmp_path / "models" / "ventes.yaml").write_text("name: ventes\n")
+    (tmp_path / "models" / "ventes.yaml.bak").write_text("ancienne version\n")
+    (tmp_path / "logos").mkdir()
+    (tmp_path / "logos" / "demo.png").write_bytes(b"png")
+    session = LocalBackend(stage_dir=str(tmp_path), seed=False, analyst_latency=0).session()
+
+    rows = session.sql("LIST @CORTEX_DB.PUBLIC.RAW_DATA/models/ventes.yaml").collect()
+    assert [row["name"] for row in rows] == ["raw_data/models/ventes.yaml", "raw_data/models/ventes.yaml.bak"]
+    assert rows[0]["md5"] == hashlib.md5(b"name: ventes\n").hexdigest()
+    assert rows[0]["size"] == len("name: ventes\n")
+    assert len(session.sql("LIST @CORTEX_DB.PUBLIC.RAW_DATA").collect()) == 3
+
+
+def test_script_block_runs_in_one_transaction(session):
+    script = """
+        EXECUTE IMMEDIATE $$
+        BEGIN
+            BEGIN TRANSACTION;
+            DELETE FROM T WHERE V >= 100;
+            INSERT INTO T (APP, V) SELECT 'C; D', V FROM T WHERE V < 10;
+            COMMIT;
+        EXCEPTION
+            WHEN OTHER THEN
+                ROLLBACK;
+                RAISE;
+        END;
+        $$
+    """
+    session.sql(script).collect()
+    assert session.sql("SELECT COUNT(*) AS N FROM T").collect()[0]["N"] == 110
+    assert session.sql("SELECT COUNT(*) AS N FROM T WHERE APP = 'C; D'").collect()[0]["N"] == 10
+
+    # Une erreur en cours de bloc annule aussi la suppression qui la précède
+    with pytest.raises(RuntimeError):
+        session.sql(script.replace("V >= 100", "V >= 5").replace("SELECT 'C; D', V", "SELECT COLONNE_ABSENTE, V")).collect()
+    assert session.sql("SELECT COUNT(*) AS N FROM T").collect()[0]["N"] == 110
@@ -0,0 +1,132 @@
+import pandas as pd
+from common.log_search import LogSearchIndex, highlight, row_keys, tokenize
+
+def make_logs(rows):
+    return pd.DataFrame([
+        {"DATETIME": pd.Timestamp(when), "USERNAME": user, "APP_ID": 1, "APP_NAME": app,
+         "INPUT_TEXT": text, "output_sql": sql}
+        for when, user, app, text, sql in rows
+    ])
+
+
+LOGS = make_logs([
+    ("2024-03-01 10:00", "alice", "Ventes", "Chiffre d'affaires par Région", "SELECT region FROM ventes"),
+    ("2024-03-01 11:00", "bob", "Ventes", "Top clients", "SELECT client FROM ventes"),
+    ("2024-03-01 12:00", "alice", "RH", "Effectif par région et service", "SELECT service FROM rh"),
+])
+
+
+def test_tokenize_normalizes_case_and_accents():
+    assert tokenize("Région  NORD-Est") == ["region", "nord", "est"]
+    assert tokenize(None) == []
+
+
+def test_highlight_escapes_html():
+    assert highlight("<b>Région</b> & co", ["reg"]) == "&lt;b&gt;<mark>Région</mark>&lt;/b&gt; &amp; co"
+
+
+def test_search_is_a_prefix_and():
+    index = LogSearchIndex()
+    assert index.update(LOGS) == 3
+    assert len(index.search("regi")) == 2
+    assert len(index.search("région service")) == 1
+    assert index.search("région absent") == []
+    assert index.search("  ") == []
+
+
+def test_search_matches_the_generated_sql():
+    index = LogSearchIndex()
+    index.update(LOGS)
+    assert [index.documents[key][1] for key in index.search("client")] == ["bob"]
+
+
+def test_app_and_user_filters():
+    index = LogSearchIndex()
+    index.update(LOGS)
+    assert len(index.search("region", app_name="Ventes")) == 1
+    assert len(index.search("region", username="alice")) == 2
+    assert index.search("region", app_name="RH", username="bob") == []
+
+
+def test_incremental_update_indexes_only_new_rows():
+    index = LogSearchIndex(overlap_minutes=5)
+    index.update(LOGS)
+    late = make_logs([("2024-03-01 11:58", "carol", "RH", "Absences par région", None),
+                      ("2024-03-01 13:00", "dave", "RH", "Recrutements", None)])
+    # Les lignes déjà indexées dans la fenêtre de recouvrement ne sont pas recomptées
+    assert index.update(pd.concat([LOGS, late], ignore_index=True)) == 2
+    assert len(index.search("region")) == 3
+    assert index.watermark == pd.Timestamp("2024-03-01 13:00")
+
+
+def test_identical_questions_written_in_one_batch_are_kept_apart():
+    # Même lot du sink : même DATETIME (heure d'écriture) et même USERNAME, REQUEST_ID distincts
+    batch = make_logs([("2024-03-02 09:00", "SERVICE", "Ventes", "Top clients", None)] * 2)
+    batch["REQUEST_ID"] = ["req-1", "req-2"]
+    index = LogSearchIndex()
+    assert index.update(batch) == 2
+    assert sorted(index.search("clients")) == ["req-1", "req-2"]
+
+
+def test_legacy_rows_without_request_id_are_keyed_on_their_content():
+    legacy = make_logs([("2024-03-02 09:00", "alice", "Ventes", "Top clients", None)] * 2)
+    legacy["REQUEST_ID"] = None
+    index = LogSearchIndex()
+    assert index.update(legacy) == 1
+    assert index.search("clients") == [(pd.Timestamp("2024-03-02 09:00"), "alice", 1, "Top clients")]
+
+
+def test_rows_without_request_id_fall_back_to_their_content():
+    now = pd.Timestamp("2024-03-02 09:00")
+    frame = make_logs([(now, "alice", "Ventes", "q", None)] * 3).assign(REQUEST_ID=["req-1", None, ""])
+    keys = row_keys(frame)
+    assert keys[0] == "req-1" and keys[1] == keys[2] == (now, "alice", 1, "q")
+
+
+class FakeLogTable:
+    # Table de logs simulée : enregistre les filigranes demandés
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def fetch_since(self, since, retention_days):
+        self.calls.append(since)
+        if since is None:
+            return self.rows.copy()
+        return self.rows[self.rows['DATETIME'] >= since].copy()
+
+
+def test_refresh_fetches_from_the_watermark_minus_overlap():
+    now = pd.Timestamp.now().floor("min")
+    table = FakeLogTable(make_logs([(now - pd.Timedelta(minutes=30), "alice", "Ventes", "Top clients", None),
+                                    (now - pd.Timedelta(minutes=10), "alice", "Ventes", "Top régions", None)]))
+    index = LogSearchIndex(overlap_minutes=5, refresh_interval=0)
+    assert index.refresh(table.fetch_since) == 2
+
+    # Ligne écrite en retard sous le filigrane : récupérée dans la fenêtre de recouvrement
+    late = make_logs([(now - pd.Timedelta(minutes=12), "bob", "Ventes", "Top clients", None)])
+    table.rows = pd.concat([table.rows, late], ignore_index=True)
+    assert index.refresh(table.fetch_since) == 1
+    assert table.calls == [None, now - pd.Timedelta(minutes=15)]
+    assert len(index.search("top")) == 3
+
+
+def test_refresh_is_throttled_unless_forced():
+    table = FakeLogTable(make_logs([(pd.Timestamp.now(), "alice", "Ventes", "Top clients", None)]))
+    index = LogSearchIndex(refresh_interval=3600)
+    index.refresh(table.fetch_since)
+    index.refresh(table.fetch_since)
+    assert len(table.calls) == 1
+    index.refresh(table.fetch_since, force=True)
+    assert len(table.calls) == 2
+
+
+def test_refresh_prunes_rows_past_retention():
+    now = pd.Timestamp.now()
+    table = FakeLogTable(make_logs([(now - pd.Timedelta(days=100), "alice", "Ventes", "Top clients", None),
+                                    (now, "bob", "Ventes", "Top régions", None)]))
+    index = LogSearchIndex(retention_days=90, refresh_interval=0)
+    index.refresh(table.fetch_since)
+    assert len(index.documents) == 1
+    assert index.search("clients") == []
+    assert "clients" not in index.vocabulary
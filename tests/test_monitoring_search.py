@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+from bench.workloads import insert_rows
+from common.log_search import LogSearchIndex
+import pages.monitoring as monitoring
+
+
+@pytest.fixture
+def logs(local_backend, monkeypatch):
+    # Deux questions identiques d'un même lot (même DATETIME et USERNAME), une ligne antérieure à
+    # REQUEST_ID, une ligne hors de la fenêtre de rétention et une ligne sans rapport
+    session = local_backend.session()
+    now = datetime.now().replace(microsecond=0)
+    old = now - timedelta(days=120)
+    sql = json.dumps({"message": {"content": [{"type": "sql", "statement": "SELECT region FROM ventes"}]}})
+    insert_rows(session, "CORTEX_DB.PUBLIC.CORTEX_LOGS",
+                ("DATETIME", "USERNAME", "APP_NAME", "APP_ID", "INPUT_TEXT", "OUTPUT_JSON", "ELAPSED_TIME",
+                 "RESOLUTION_TIME", "CACHED", "REQUEST_ID"), [
+        (now, "SERVICE", "Ventes", 1, "Top clients", "{}", 100.0, 300.0, False, "req-1"),
+        (now, "SERVICE", "Ventes", 1, "Top clients", "{}", 200.0, 500.0, True, "req-2"),
+        (now - timedelta(days=2), "alice", "Ventes", 1, "Top clients par pays", "{}", 400.0, 700.0, False, None),
+        (now - timedelta(days=1), "bob", "Ventes", 1, "Chiffre d'affaires", sql, 50.0, 60.0, False, "req-3"),
+        (old, "alice", "Ventes", 1, "Top clients", "{}", 1.0, 1.0, False, "req-old"),
+    ])
+    index = LogSearchIndex(refresh_interval=0)
+    monkeypatch.setattr(monitoring, "get_session", lambda: session)
+    monkeypatch.setattr(monitoring, "get_log_search_index", lambda: index)
+    index.refresh(monitoring.fetch_index_rows)
+    return index
+
+
+def test_keyword_rows_are_read_server_side_for_the_index_keys(logs):
+    rows = monitoring.load_log_rows("Ventes", keyword="clients")
+    assert sorted(rows["REQUEST_ID"].fillna("").tolist()) == ["", "req-1", "req-2"]
+    # La recherche porte aussi sur le SQL généré
+    assert monitoring.load_log_rows("Ventes", keyword="region")["REQUEST_ID"].tolist() == ["req-3"]
+    assert monitoring.load_log_rows("Ventes", username="alice", keyword="clients")["USERNAME"].tolist() == ["alice"]
+    assert monitoring.load_log_rows("Ventes", keyword="inexistant").empty
+
+
+def test_keyword_aggregates_match_the_rows(logs):
+    aggregates = monitoring.load_log_aggregates.__wrapped__("Ventes", keyword="clients", watermark=logs.watermark)
+    assert aggregates["total_requests"] == 3
+    # Réponse servie par le cache exclue des latences
+    assert aggregates["avg_elapsed_time"] == pytest.approx(250.0)
+    assert aggregates["avg_resolution_time"] == pytest.approx(500.0)
+    assert dict(zip(aggregates["user_requests"]["USERNAME"], aggregates["user_requests"]["count"])) == {"SERVICE": 2, "alice": 1}
+    assert aggregates["requests_over_time"]["count"].sum() == 3
+    assert pd.Timestamp(aggregates["requests_over_time"]["Date"].max()).date() == datetime.now().date()
@@ -0,0 +1,71 @@
+from common.response_cache import ResponseCache, normalize_prompt
+
+
+def test_normalize_prompt_ignores_case_accents_and_spaces():
+    assert normalize_prompt("  Évolution   DES médailles\t") == "evolution des medailles"
+    assert normalize_prompt(None) == ""
+
+
+def test_equivalent_prompts_share_a_key():
+    cache = ResponseCache()
+    assert cache.make_key(1, "a.yaml", "Quelle RÉGION ?") == cache.make_key("1", "a.yaml", "quelle region ?")
+    assert cache.make_key(1, "a.yaml", "question") != cache.make_key(1, "b.yaml", "question")
+
+
+def test_a_new_version_of_the_yaml_file_misses():
+    cache = ResponseCache()
+    cache.put(cache.make_key(1, "a.yaml", "question", "md5-v1|lundi"), "réponse v1")
+    assert cache.get(cache.make_key(1, "a.yaml", "question", "md5-v1|lundi")) == "réponse v1"
+    assert cache.get(cache.make_key(1, "a.yaml", "question", "md5-v2|mardi")) is None
+
+
+def test_hits_and_misses_are_counted():
+    cache = ResponseCache()
+    key = cache.make_key(1, "a.yaml", "question")
+    assert cache.get(key) is None
+    cache.put(key, {"message": "réponse"})
+    assert cache.get(key) == {"message": "réponse"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_expired_entries_are_dropped():
+    cache = ResponseCache(ttl_seconds=-1)
+    key = cache.make_key(1, "a.yaml", "question")
+    cache.put(key, "réponse")
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_changed_model_file_invalidates_only_its_answers():
+    cache = ResponseCache()
+    assert cache.sync_models(1, {"Ventes": "ventes_v1.yaml", "RH": "rh.yaml"}) == 0
+    cache.put(cache.make_key(1, "ventes_v1.yaml", "q1"), "ventes")
+    cache.put(cache.make_key(1, "rh.yaml", "q2"), "rh")
+    cache.put(cache.make_key(2, "ventes_v1.yaml", "q1"), "autre application")
+
+    assert cache.sync_models(1, {"Ventes": "ventes_v2.yaml", "RH": "rh.yaml"}) == 1
+    assert cache.get(cache.make_key(1, "ventes_v1.yaml", "q1")) is None
+    assert cache.get(cache.make_key(1, "rh.yaml", "q2")) == "rh"
+    assert cache.get(cache.make_key(2, "ventes_v1.yaml", "q1")) == "autre application"
+
+
+def test_invalidate_app_removes_all_its_answers():
+    cache = ResponseCache()
+    cache.put(cache.make_key(1, "a.yaml", "q1"), 1)
+    cache.put(cache.make_key(1, "b.yaml", "q2"), 2)
+    cache.put(cache.make_key(2, "a.yaml", "q1"), 3)
+    assert cache.invalidate_app(1) == 2
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from common.rollups import PandasRollupBackend, RollupRefresher, SnowflakeRollupBackend
+
+START = datetime(2024, 3, 1, 8, 0)
+SKETCHES = ["ELAPSED_SKETCH", "RESOLUTION_SKETCH", "SQL_TIME_SKETCH"]
+
+
+def make_logs(count, start=START, step_minutes=7, seed=0):
+    rng = np.random.default_rng(seed)
+    times = [start + timedelta(minutes=step_minutes * i) for i in range(count)]
+    return pd.DataFrame({
+        "DATETIME": pd.to_datetime(times),
+        "APP_ID": rng.choice([1, 2], count),
+        "APP_NAME": None,
+        "YAML_FILE": rng.choice(["a.yaml", "b.yaml"], count),
+        "USERNAME": rng.choice(["ALICE", "BOB", "CAROL"], count),
+        "ELAPSED_TIME": rng.gamma(2.0, 400.0, count),
+        "RESOLUTION_TIME": rng.gamma(3.0, 600.0, count),
+        "SQL_TIME": np.where(rng.random(count) < 0.3, np.nan, rng.gamma(1.5, 200.0, count)),
+    }).assign(APP_NAME=lambda df: df["APP_ID"].map({1: "Ventes", 2: "RH"}))
+
+
+def make_votes(count, start=START):
+    return pd.DataFrame({
+        "VOTE_CREATED_AT": pd.to_datetime([start + timedelta(minutes=11 * i) for i in range(count)]),
+        "APP_ID": [np.nan if i % 3 == 0 else 2 for i in range(count)],
+        "YAML_FILE": ["a.yaml" if i % 2 else "b.yaml" for i in range(count)],
+        "VOTE_USERNAME": ["ALICE" if i % 2 else "BOB" for i in range(count)],
+        "VOTE_VALUE": [1 if i % 4 else -1 for i in range(count)],
+    })
+
+
+MODELS = pd.DataFrame({"CORTEX_YAML_FILE": ["a.yaml", "b.yaml"], "APP_ID": [1, 2]})
+
+
+def normalized(table):
+    # Ordre des lignes et sketches triés : comparaison indépendante de l'ordre de recalcul
+    keys = [c for c in ["BUCKET_START", "APP_ID", "APP_NAME", "YAML_FILE", "USERNAME"] if c in table]
+    table = table.sort_values(keys).reset_index(drop=True)
+    for column in SKETCHES:
+        if column in table:
+            table[column] = table[column].map(lambda values: sorted(float(v) for v in values))
+    return table
+
+
+def full_rebuild(logs, votes):
+    backend = PandasRollupBackend(logs, votes, MODELS)
+    RollupRefresher(backend).refresh()
+    return backend
+
+
+def test_first_refresh_builds_every_rollup():
+    backend = PandasRollupBackend(make_logs(50), make_votes(20), MODELS)
+    refreshed = RollupRefresher(backend).refresh()
+    assert set(refreshed) == set(backend.tables)
+    assert all(start is None for start in refreshed.values())
+    assert backend.tables["CORTEX_LOGS_ROLLUP_DAILY"]["REQUEST_COUNT"].sum() == 50
+    assert backend.tables["CORTEX_VOTES_ROLLUP_HOURLY"]["VOTE_COUNT"].sum() == 20
+
+
+def test_refresh_without_new_rows_is_a_no_op():
+    backend = PandasRollupBackend(make_logs(50), make_votes(20), MODELS)
+    refresher = RollupRefresher(backend)
+    refresher.refresh()
+    recomputed = backend.recomputed_rows
+    assert refresher.refresh() == {}
+    assert backend.recomputed_rows == recomputed
+
+
+def refresh_with_late_row(overlap_minutes):
+    # Filigrane à 15:02 ; ligne écrite en retard horodatée 14:58, donc dans l'intervalle horaire précédent
+    logs = pd.concat([make_logs(50), make_logs(1, start=datetime(2024, 3, 1, 15, 2), seed=1)], ignore_index=True)
+    backend = PandasRollupBackend(logs, make_votes(0), MODELS)
+    refresher = RollupRefresher(backend, overlap_minutes=overlap_minutes)
+    refresher.refresh()
+    watermark = backend.get_watermark("CORTEX_LOGS_ROLLUP_HOURLY")
+    late = make_logs(1, start=watermark - timedelta(minutes=4), seed=2)
+    fresh = make_logs(5, start=watermark + timedelta(minutes=1), seed=3)
+    logs = pd.concat([logs, late, fresh], ignore_index=True)
+    backend.sources["LOGS"] = logs
+    recomputed = backend.recomputed_rows
+    refreshed = refresher.refresh()
+    return logs, backend, refreshed, backend.recomputed_rows - recomputed
+
+
+def test_incremental_refresh_picks_up_late_rows_in_the_overlap_window():
+    logs, backend, refreshed, recomputed = refresh_with_late_row(overlap_minutes=5)
+
+    assert set(refreshed) == {"CORTEX_LOGS_ROLLUP_HOURLY", "CORTEX_LOGS_ROLLUP_DAILY"}
+    assert refreshed["CORTEX_LOGS_ROLLUP_HOURLY"] == pd.Timestamp(2024, 3, 1, 14)
+    # Seuls les intervalles touchés sont relus
+    assert recomputed < 2 * len(logs)
+    rebuilt = full_rebuild(logs, make_votes(0))
+    for name in refreshed:
+        pd.testing.assert_frame_equal(normalized(backend.tables[name]), normalized(rebuilt.tables[name]))
+    assert backend.tables["CORTEX_LOGS_ROLLUP_HOURLY"]["REQUEST_COUNT"].sum() == len(logs)
+
+
+def test_late_rows_before_the_overlap_window_are_missed():
+    # Sans recouvrement, la ligne en retard tombe avant l'intervalle recalculé
+    logs, backend, _, _ = refresh_with_late_row(overlap_minutes=0)
+    assert backend.tables["CORTEX_LOGS_ROLLUP_HOURLY"]["REQUEST_COUNT"].sum() == len(logs) - 1
+
+
+def test_incremental_vote_refresh_matches_a_full_rebuild():
+    votes = make_votes(40)
+    backend = PandasRollupBackend(make_logs(0), votes, MODELS)
+    refresher = RollupRefresher(backend, overlap_minutes=5)
+    refresher.refresh()
+    watermark = backend.get_watermark("CORTEX_VOTES_ROLLUP_HOURLY")
+
+    votes = pd.concat([votes, make_votes(1, start=watermark - timedelta(minutes=2)),
+                       make_votes(3, start=watermark + timedelta(minutes=30))], ignore_index=True)
+    backend.sources["VOTES"] = votes
+    refresher.refresh()
+
+    rebuilt = full_rebuild(make_logs(0), votes)
+    for name in ("CORTEX_VOTES_ROLLUP_HOURLY", "CORTEX_VOTES_ROLLUP_DAILY"):
+        pd.testing.assert_frame_equal(normalized(backend.tables[name]), normalized(rebuilt.tables[name]))
+
+
+def test_votes_without_app_id_are_attached_through_the_model():
+    backend = full_rebuild(make_logs(0), make_votes(12))
+    daily = backend.tables["CORTEX_VOTES_ROLLUP_DAILY"]
+    assert daily["APP_ID"].notna().all()
+    by_app = daily.groupby("APP_ID")["VOTE_COUNT"].sum().to_dict()
+    # Votes sans APP_ID (un sur trois) : a.yaml -> 1, b.yaml -> 2
+    assert by_app == {1: 2, 2: 10}
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.9, 0.99])
+@pytest.mark.parametrize("sketch, column", [("ELAPSED_SKETCH", "ELAPSED_TIME"), ("SQL_TIME_SKETCH", "SQL_TIME")])
+def test_percentiles_match_an_exact_computation(quantile, sketch, column):
+    logs = make_logs(400)
+    backend = full_rebuild(logs, make_votes(0))
+    estimated = backend.percentile("CORTEX_LOGS_ROLLUP_HOURLY", sketch, quantile, "APP_NAME")
+    for app_name, values in logs.groupby("APP_NAME")[column]:
+        expected = np.percentile(values.dropna(), quantile * 100)
+        assert estimated[app_name] == pytest.approx(expected)
+
+
+def test_percentiles_after_incremental_refresh_match_an_exact_computation():
+    logs = make_logs(200)
+    backend = PandasRollupBackend(logs, make_votes(0), MODELS)
+    refresher = RollupRefresher(backend, overlap_minutes=5)
+    refresher.refresh()
+    watermark = backend.get_watermark("CORTEX_LOGS_ROLLUP_DAILY")
+    logs = pd.concat([logs, make_logs(1, start=watermark - timedelta(minutes=4), seed=3),
+                      make_logs(30, start=watermark + timedelta(minutes=5), seed=4)], ignore_index=True)
+    backend.sources["LOGS"] = logs
+    refresher.refresh()
+
+    estimated = backend.percentile("CORTEX_LOGS_ROLLUP_DAILY", "RESOLUTION_SKETCH", 0.9, "USERNAME")
+    for username, values in logs.groupby("USERNAME")["RESOLUTION_TIME"]:
+        assert estimated[username] == pytest.approx(np.percentile(values, 90))
+
+
+def test_cached_responses_count_as_requests_but_not_in_latencies():
+    logs = make_logs(30)
+    cached = pd.Series([i % 3 == 0 for i in range(len(logs))])
+    logs = logs.assign(CACHED=cached, ELAPSED_TIME=logs["ELAPSED_TIME"].mask(cached))
+    backend = full_rebuild(logs, make_votes(0))
+    daily = backend.tables["CORTEX_LOGS_ROLLUP_DAILY"]
+    assert daily["REQUEST_COUNT"].sum() == 30
+    assert daily["ELAPSED_COUNT"].sum() == daily["RESOLUTION_COUNT"].sum() == 20
+    assert daily["RESOLUTION_SUM"].sum() == pytest.approx(logs.loc[~cached, "RESOLUTION_TIME"].sum())
+    estimated = backend.percentile("CORTEX_LOGS_ROLLUP_DAILY", "RESOLUTION_SKETCH", 0.5, "APP_NAME")
+    for app_name, values in logs[~cached].groupby("APP_NAME")["RESOLUTION_TIME"]:
+        assert estimated[app_name] == pytest.approx(np.percentile(values, 50))
+
+
+def insert_rows(session, table, frame):
+    columns = list(frame.columns)
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for values in frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None):
+        session.sql(query, tuple(v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in values)).collect()
+
+
+def test_sql_backend_matches_the_pandas_backend(local_backend):
+    session = local_backend.session()
+    logs = make_logs(60)
+    logs = logs.assign(CACHED=[i % 4 == 0 for i in range(len(logs))])
+    logs = logs.assign(ELAPSED_TIME=logs["ELAPSED_TIME"].mask(logs["CACHED"]))
+    votes = make_votes(30)
+    insert_rows(session, "CORTEX_MODELS", MODELS.assign(APP_ID=MODELS["APP_ID"].astype(str)))
+
+    # Deux vagues d'écritures : la seconde passe par le rafraîchissement incrémental
+    sql_refresher = RollupRefresher(SnowflakeRollupBackend(local_backend.session))
+    for logs_part, votes_part in [(logs[:40], votes[:20]), (logs[40:], votes[20:])]:
+        insert_rows(session, "CORTEX_LOGS", logs_part)
+        insert_rows(session, "CORTEX_VOTES", votes_part.assign(VOTE_VALUE=votes_part["VOTE_VALUE"].astype(int)))
+        sql_refresher.refresh()
+    expected = full_rebuild(logs, votes).tables
+
+    logs_sums = ["REQUEST_COUNT", "ELAPSED_SUM", "ELAPSED_COUNT", "RESOLUTION_SUM", "RESOLUTION_COUNT", "SQL_TIME_COUNT"]
+    for name, keys, sums in [
+        ("CORTEX_LOGS_ROLLUP_HOURLY", ["BUCKET_START", "APP_NAME"], logs_sums),
+        ("CORTEX_LOGS_ROLLUP_DAILY", ["BUCKET_START", "APP_NAME", "USERNAME"], logs_sums),
+        ("CORTEX_VOTES_ROLLUP_DAILY", ["BUCKET_START", "APP_ID"], ["VOTE_COUNT", "UP_VOTES", "DOWN_VOTES"]),
+    ]:
+        actual = session.sql(f"SELECT * FROM {name}").to_pandas()
+        actual = actual.assign(BUCKET_START=pd.to_datetime(actual["BUCKET_START"]))
+        if "APP_ID" in keys:
+            actual = actual.assign(APP_ID=actual["APP_ID"].astype(float))
+        pd.testing.assert_frame_equal(
+            actual.groupby(keys)[sums].sum().astype(float),
+            expected[name].groupby(keys)[sums].sum().astype(float),
+            check_exact=False,
+        )
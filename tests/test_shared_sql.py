@@ -0,0 +1,57 @@
+import pytest
+from apps.base_analyst_app import BaseAnalystApp, get_shared_queries
+
+
+@pytest.fixture
+def app():
+    # Application sans initialisation Streamlit : seules les méthodes d'exécution SQL sont utilisées
+    get_shared_queries.clear()
+    app = BaseAnalystApp.__new__(BaseAnalystApp)
+    app.MAX_ROWS = 100
+    app.RESULT_PAGE_SIZE = 10
+    app.STATEMENT_TIMEOUT = 5
+    return app
+
+
+STATEMENT = "SELECT APP_ID FROM CORTEX_APPS"
+
+
+def seed_apps(local_backend, count):
+    session = local_backend.session()
+    for app_id in range(count):
+        session.sql("INSERT INTO CORTEX_APPS (APP_ID, APP_NAME) VALUES (?, ?)", [str(app_id), f"app {app_id}"]).collect()
+    return session
+
+
+def test_sessions_share_the_query_but_not_the_cursor(app, local_backend):
+    session = seed_apps(local_backend, 25)
+    leader_jobs, follower_jobs = {}, {}
+    # Le meneur garde sa requête (rerun) pendant que l'autre session s'y rattache
+    query_id, _ = get_shared_queries().acquire(("sql", STATEMENT), lambda: (session.sql(STATEMENT).to_pandas_batches(block=False).query_id, 0.0))
+    df, total_rows, cursor = app.run_sql(STATEMENT, session=session, jobs=follower_jobs, job_key="b")
+    assert cursor.query_id == query_id
+    assert (len(df), total_rows) == (10, 25)
+
+    other_df, _, other_cursor = app.run_sql(STATEMENT, session=session, jobs=leader_jobs, job_key="a")
+    assert other_cursor is not cursor
+    # Chaque appelant pagine avec son propre curseur
+    assert len(app.read_sql_page(other_cursor, 10)) == 10
+    assert list(app.read_sql_page(cursor, 10)["APP_ID"]) == list(app.read_sql_page(other_cursor, 10)["APP_ID"])
+    assert leader_jobs == {} and follower_jobs == {}
+
+
+def test_cancel_only_kills_the_query_when_nobody_else_waits(app, local_backend):
+    session = local_backend.session()
+    cancelled = []
+    local_backend.cancel_query = lambda query_id: cancelled.append(query_id) or "terminated"
+    local_backend.connection.create_function("SYSTEM_CANCEL_QUERY", 1, local_backend.cancel_query)
+    first_jobs, second_jobs = {}, {}
+    for jobs in (first_jobs, second_jobs):
+        app.submit_sql_job(session, jobs, ("k", "result"), ("sql", STATEMENT),
+                           lambda: session.sql(STATEMENT).to_pandas_batches(block=False))
+
+    app.release_sql_jobs(session, first_jobs, ("k",), cancel=True)
+    assert cancelled == []
+    app.release_sql_jobs(session, second_jobs, ("k",), cancel=True)
+    assert len(cancelled) == 1
+    assert get_shared_queries().stats()["in_flight"] == 0
@@ -0,0 +1,146 @@
+import threading
+import time
+import pytest
+from common.single_flight import SharedQueries, SingleFlight
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition non remplie dans le délai")
+        time.sleep(0.01)
+
+
+def run_followers(single_flight, key, fn, count):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(single_flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_identical_calls_execute_once():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def fetch():
+        executions.append(1)
+        release.wait(5)
+        return {"rows": 42}
+
+    threads, results, errors = run_followers(single_flight, ("sql", "SELECT 1"), fetch, 5)
+    wait_until(lambda: single_flight.stats()["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == []
+    assert results == [{"rows": 42}] * 5
+    assert len(executions) == 1
+    assert single_flight.stats() == {"calls": 5, "executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_different_keys_are_not_coalesced():
+    single_flight = SingleFlight()
+    assert single_flight.do("a", lambda: 1) == 1
+    assert single_flight.do("b", lambda: 2) == 2
+    assert single_flight.stats()["executions"] == 2
+
+
+def test_leader_error_is_shared_with_waiting_callers():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("entrepôt indisponible")
+
+    threads, results, errors = run_followers(single_flight, "key", fail, 3)
+    wait_until(lambda: single_flight.stats()["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == []
+    assert len(errors) == 3 and all(isinstance(e, ValueError) for e in errors)
+    # La clé est libérée : l'appel suivant est réexécuté
+    assert single_flight.do("key", lambda: "ok") == "ok"
+
+
+class RerunInterrupt(BaseException):
+    # Équivalent de l'interruption d'un script Streamlit par un rerun
+    pass
+
+
+def test_waiting_caller_retries_when_the_leader_is_interrupted():
+    single_flight = SingleFlight()
+    leader_started, interrupt = threading.Event(), threading.Event()
+
+    def interrupted():
+        leader_started.set()
+        interrupt.wait(5)
+        raise RerunInterrupt()
+
+    def leader():
+        with pytest.raises(RerunInterrupt):
+            single_flight.do("key", interrupted)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    leader_started.wait(5)
+    threads, results, errors = run_followers(single_flight, "key", lambda: "relancé", 1)
+    wait_until(lambda: single_flight.stats()["coalesced"] == 1)
+    interrupt.set()
+    for thread in threads + [leader_thread]:
+        thread.join(5)
+
+    assert errors == []
+    assert results == ["relancé"]
+    assert single_flight.stats()["executions"] == 2
+
+
+def test_shared_query_is_submitted_once_and_released_by_its_last_waiter():
+    shared = SharedQueries()
+    submitted = []
+
+    def submit():
+        submitted.append(1)
+        return ("q1", 100.0)
+
+    assert shared.acquire(("sql", "SELECT 1"), submit) == ("q1", 100.0)
+    assert shared.acquire(("sql", "SELECT 1"), submit) == ("q1", 100.0)
+    assert len(submitted) == 1
+
+    # Le premier appelant détaché n'est pas le dernier : la requête ne doit pas être annulée
+    assert shared.release(("sql", "SELECT 1"), "q1") is False
+    assert shared.release(("sql", "SELECT 1"), "q1") is True
+    assert shared.stats() == {"calls": 2, "executions": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_shared_query_submit_error_is_not_kept():
+    shared = SharedQueries()
+
+    def fail():
+        raise ValueError("entrepôt indisponible")
+
+    with pytest.raises(ValueError):
+        shared.acquire("key", fail)
+    assert shared.acquire("key", lambda: ("q2", 0.0)) == ("q2", 0.0)
+
+
+def test_stale_shared_query_is_resubmitted():
+    shared = SharedQueries(max_age=0)
+    shared.acquire("key", lambda: ("q1", 0.0))
+    time.sleep(0.01)
+    assert shared.acquire("key", lambda: ("q2", 0.0)) == ("q2", 0.0)
+    # Le détenteur de l'ancienne requête n'attend plus rien de partagé
+    assert shared.release("key", "q1") is True